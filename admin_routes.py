@@ -1,6 +1,13 @@
-from flask import Blueprint, request, jsonify, session
-from config import conn, cursor
+from flask import Blueprint, request, jsonify, session, current_app, Response, stream_with_context
+from config import get_db, pool
+from utils import CHAVE_ESTATISTICAS, invalidar_estatisticas, invalidar_plano
+from senhas import hash_fora_do_hub
+from analytics import DIMENSOES
+from transferencia import FORMATOS, IMPORTACOES, EXPORTACOES, Importacao, detectar_formato, ler_registros, exportar
 from datetime import datetime, timedelta
+import base64
+import json
+import os
 import sqlite3
 
 # ✅ CORRIGIDO: Nome correto do Blueprint
@@ -48,6 +55,68 @@ def logout():
 # DASHBOARD: ESTATÍSTICAS GERAIS
 # ===================================================================
 
+SQL_ESTATISTICAS = '''
+    SELECT 'alunos' as fonte, plano, NULL as materia, quantidade, 0 as validos, 0 as soma
+    FROM resumo_alunos_plano
+    UNION ALL
+    SELECT 'total', plano, materia, quantidade, quantidade_validos, soma_percentual
+    FROM resumo_quiz
+    UNION ALL
+    SELECT 'semana', plano, materia, SUM(quantidade), 0, 0
+    FROM resumo_quiz_dia
+    WHERE dia >= ?
+    GROUP BY plano, materia
+'''
+
+def calcular_estatisticas():
+    """
+    Calcula as estatísticas do dashboard em uma única consulta
+
+    Lê apenas as tabelas de resumo mantidas por triggers (migrations.py). Usa uma
+    conexão própria do pool para poder rodar na atualização em segundo plano do cache.
+    """
+    sete_dias_atras = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+
+    with pool.conexao() as conn:
+        linhas = conn.execute(SQL_ESTATISTICAS, (sete_dias_atras,)).fetchall()
+
+    alunos_por_plano = []
+    validos = {}
+    soma = {}
+    semana = {}
+    for row in linhas:
+        if row['fonte'] == 'alunos':
+            if row['quantidade'] > 0:
+                alunos_por_plano.append({'plano': row['plano'], 'count': row['quantidade']})
+        elif row['fonte'] == 'total':
+            validos[row['materia']] = validos.get(row['materia'], 0) + row['validos']
+            soma[row['materia']] = soma.get(row['materia'], 0) + row['soma']
+        else:
+            semana[(row['plano'], row['materia'])] = row['quantidade']
+
+    alunos_por_plano.sort(key=lambda row: row['plano'])
+
+    def media(materias):
+        total_validos = sum(validos.get(m, 0) for m in materias)
+        return sum(soma.get(m, 0) for m in materias) / total_validos if total_validos else 0
+
+    # Formatar dados para o gráfico
+    planos = ['freemium', 'premium']
+
+    return {
+        'total_alunos': sum(row['count'] for row in alunos_por_plano),
+        'alunos_por_plano': alunos_por_plano,
+        'media_geral_acertos': f"{media(list(validos)) * 100:.1f}%",
+        'media_filosofia': f"{media(['Filosofia']) * 100:.1f}%",
+        'media_sociologia': f"{media(['Sociologia']) * 100:.1f}%",
+        'quizzes_por_plano_e_tema': {
+            'labels': [plano.capitalize() for plano in planos],
+            'data_filosofia': [semana.get((plano, 'Filosofia'), 0) for plano in planos],
+            'data_sociologia': [semana.get((plano, 'Sociologia'), 0) for plano in planos]
+        }
+    }
+
+
 @admin_bp.route('/stats', methods=['GET'])
 def get_admin_stats():
     """Retorna estatísticas para o dashboard do admin"""
@@ -57,108 +126,9 @@ def get_admin_stats():
         return jsonify({'error': 'Não autorizado'}), 401
     
     try:
-        # 1. Total de alunos
-        cursor.execute('SELECT COUNT(*) as total FROM Aluno')
-        total_alunos = cursor.fetchone()['total']
-        
-        # 2. Alunos por plano
-        cursor.execute('''
-            SELECT plano, COUNT(*) as count 
-            FROM Aluno 
-            GROUP BY plano
-        ''')
-        alunos_por_plano = [dict(row) for row in cursor.fetchall()]
-        
-        # 3. Média geral de acertos
-        cursor.execute('''
-            SELECT AVG(CAST(acertos AS FLOAT) / total_perguntas) as media 
-            FROM quiz_resultado
-            WHERE total_perguntas > 0
-        ''')
-        result = cursor.fetchone()
-        media_geral = result['media'] if result['media'] else 0
-        media_geral_formatada = f"{media_geral * 100:.1f}%"
-        
-        # 4. Média por matéria (Filosofia e Sociologia)
-        # Assumindo que o tema contém "Filosofia" ou "Sociologia"
-        
-        # Filosofia
-        cursor.execute('''
-            SELECT AVG(CAST(acertos AS FLOAT) / total_perguntas) as media 
-            FROM quiz_resultado
-            WHERE total_perguntas > 0 
-            AND LOWER(tema) LIKE '%filosofia%'
-        ''')
-        result = cursor.fetchone()
-        media_filo = result['media'] if result['media'] else 0
-        media_filosofia = f"{media_filo * 100:.1f}%"
-        
-        # Sociologia
-        cursor.execute('''
-            SELECT AVG(CAST(acertos AS FLOAT) / total_perguntas) as media 
-            FROM quiz_resultado
-            WHERE total_perguntas > 0 
-            AND LOWER(tema) LIKE '%sociologia%'
-        ''')
-        result = cursor.fetchone()
-        media_socio = result['media'] if result['media'] else 0
-        media_sociologia = f"{media_socio * 100:.1f}%"
-        
-        # 5. Quizzes por plano e tema (últimos 7 dias)
-        sete_dias_atras = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        
-        cursor.execute('''
-            SELECT 
-                a.plano,
-                CASE 
-                    WHEN LOWER(q.tema) LIKE '%filosofia%' THEN 'Filosofia'
-                    WHEN LOWER(q.tema) LIKE '%sociologia%' THEN 'Sociologia'
-                    ELSE 'Outros'
-                END as tema,
-                COUNT(*) as count
-            FROM quiz_resultado q
-            JOIN Aluno a ON q.id_aluno = a.id_aluno
-            WHERE q.data_criacao >= ?
-            GROUP BY a.plano, tema
-            ORDER BY a.plano, tema
-        ''', (sete_dias_atras,))
-        
-        quizzes_agrupados = cursor.fetchall()
-        
-        # Formatar dados para o gráfico
-        labels = []
-        data_filosofia = []
-        data_sociologia = []
-        
-        planos = ['freemium', 'premium']
-        for plano in planos:
-            labels.append(plano.capitalize())
-            
-            filo_count = 0
-            socio_count = 0
-            
-            for row in quizzes_agrupados:
-                if row['plano'] == plano:
-                    if row['tema'] == 'Filosofia':
-                        filo_count = row['count']
-                    elif row['tema'] == 'Sociologia':
-                        socio_count = row['count']
-            
-            data_filosofia.append(filo_count)
-            data_sociologia.append(socio_count)
-        
-        return jsonify({
-            'total_alunos': total_alunos,
-            'alunos_por_plano': alunos_por_plano,
-            'media_geral_acertos': media_geral_formatada,
-            'media_filosofia': media_filosofia,
-            'media_sociologia': media_sociologia,
-            'quizzes_por_plano_e_tema': {
-                'labels': labels,
-                'data_filosofia': data_filosofia,
-                'data_sociologia': data_sociologia
-            }
-        })
+        # Vários admins atualizando o dashboard custam um cálculo por intervalo
+        cache = current_app.config['STATS_CACHE']
+        return jsonify(cache.obter(CHAVE_ESTATISTICAS, calcular_estatisticas))
     
     except Exception as e:
         print(f"Erro ao buscar estatísticas: {e}")
@@ -169,58 +139,123 @@ def get_admin_stats():
 # GERENCIAR ALUNOS: LISTAR, CRIAR, EDITAR, EXCLUIR
 # ===================================================================
 
+# Ordenações aceitas em ?ordem=: (expressão, desempate, direção). O id do aluno
+# desempata e, junto com a expressão, forma o cursor da próxima página. O desempate
+# usa a coluna da mesma tabela do índice da ordenação
+ORDENACOES_ALUNOS = {
+    'nome': ('a.nome', 'a.id_aluno', 'ASC'),
+    'email': ('a.email', 'a.id_aluno', 'ASC'),
+    'recentes': ('a.id_aluno', 'a.id_aluno', 'DESC'),
+    'total_quizzes': ('r.total_quizzes', 'r.id_aluno', 'DESC'),
+    'media_geral': ('IFNULL(r.media_geral, -1)', 'r.id_aluno', 'DESC'),
+}
+
+LIMITE_PADRAO_ALUNOS = int(os.getenv('ADMIN_ALUNOS_LIMITE', 100))
+LIMITE_MAXIMO_ALUNOS = 500
+
+def _codificar_cursor(valor, id_aluno):
+    return base64.urlsafe_b64encode(json.dumps([valor, id_aluno]).encode('utf-8')).decode('ascii')
+
+def _decodificar_cursor(cursor_texto):
+    valor, id_aluno = json.loads(base64.urlsafe_b64decode(cursor_texto.encode('ascii')))
+    return valor, int(id_aluno)
+
+def _termo_fts(texto):
+    """Busca o texto literal (como frase) no índice de trigramas"""
+    return '"' + texto.replace('"', '""') + '"'
+
 @admin_bp.route('/alunos', methods=['GET'])
 def get_alunos():
-    """Lista todos os alunos com filtros opcionais"""
+    """
+    Lista os alunos em páginas, com filtros e ordenação opcionais
+
+    Query params: search, plano, ordem (nome, email, recentes, total_quizzes,
+    media_geral), limit e cursor (valor do header X-Next-Cursor da página anterior).
+    """
     
     if 'admin_id' not in session:
         return jsonify({'error': 'Não autorizado'}), 401
     
     search = request.args.get('search', '').strip()
     plano = request.args.get('plano', '').strip()
+    ordem = request.args.get('ordem', 'nome').strip()
+    cursor_pagina = request.args.get('cursor', '').strip()
+
+    if ordem not in ORDENACOES_ALUNOS:
+        return jsonify({'error': f"Ordem inválida. Use: {', '.join(ORDENACOES_ALUNOS)}"}), 400
+
+    try:
+        limite = int(request.args.get('limit', LIMITE_PADRAO_ALUNOS))
+    except ValueError:
+        return jsonify({'error': 'limit deve ser um número inteiro'}), 400
+    limite = max(1, min(limite, LIMITE_MAXIMO_ALUNOS))
+
+    expressao, desempate, direcao = ORDENACOES_ALUNOS[ordem]
     
-    query = '''
+    query = f'''
         SELECT 
             a.id_aluno,
             a.nome,
             a.email,
             a.plano,
             a.url_foto,
-            COUNT(DISTINCT q.id_resultado) as total_quizzes,
-            AVG(CASE WHEN LOWER(q.tema) LIKE '%filosofia%' THEN CAST(q.acertos AS FLOAT) / q.total_perguntas END) as media_filosofia,
-            AVG(CASE WHEN LOWER(q.tema) LIKE '%sociologia%' THEN CAST(q.acertos AS FLOAT) / q.total_perguntas END) as media_sociologia,
-            AVG(CAST(q.acertos AS FLOAT) / q.total_perguntas) as media_geral
+            r.total_quizzes,
+            CASE WHEN r.validos_filosofia > 0 THEN r.soma_filosofia / r.validos_filosofia END as media_filosofia,
+            CASE WHEN r.validos_sociologia > 0 THEN r.soma_sociologia / r.validos_sociologia END as media_sociologia,
+            r.media_geral,
+            {expressao} as chave_ordem
         FROM Aluno a
-        LEFT JOIN quiz_resultado q ON a.id_aluno = q.id_aluno
+        JOIN resumo_aluno r ON r.id_aluno = a.id_aluno
         WHERE 1=1
     '''
     
     params = []
     
     if search:
-        query += ' AND (a.nome LIKE ? OR a.email LIKE ?)'
-        params.extend([f'%{search}%', f'%{search}%'])
+        if len(search) >= 3:
+            # Índice FTS5 de trigramas (substring, sem diferenciar maiúsculas)
+            query += ' AND a.id_aluno IN (SELECT rowid FROM aluno_busca WHERE aluno_busca MATCH ?)'
+            params.append(_termo_fts(search))
+        else:
+            # Trigramas exigem 3 caracteres; termos curtos varrem nome/e-mail
+            query += ' AND (a.nome LIKE ? OR a.email LIKE ?)'
+            params.extend([f'%{search}%', f'%{search}%'])
     
     if plano:
         query += ' AND a.plano = ?'
         params.append(plano)
+
+    if cursor_pagina:
+        try:
+            valor, ultimo_id = _decodificar_cursor(cursor_pagina)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Cursor inválido'}), 400
+        comparacao = '>' if direcao == 'ASC' else '<'
+        query += f' AND ({expressao}, {desempate}) {comparacao} (?, ?)'
+        params.extend([valor, ultimo_id])
+    
+    query += f' ORDER BY {expressao} {direcao}, {desempate} {direcao} LIMIT ?'
+    params.append(limite + 1)
     
-    query += ' GROUP BY a.id_aluno ORDER BY a.nome'
+    conn = get_db()
+    cursor = conn.cursor()
     
     try:
         cursor.execute(query, params)
         alunos = [dict(row) for row in cursor.fetchall()]
-        
-        # Formatar médias
+
+        proximo_cursor = None
+        if len(alunos) > limite:
+            alunos = alunos[:limite]
+            proximo_cursor = _codificar_cursor(alunos[-1]['chave_ordem'], alunos[-1]['id_aluno'])
+
         for aluno in alunos:
-            if aluno['media_filosofia']:
-                aluno['media_filosofia'] = aluno['media_filosofia']
-            if aluno['media_sociologia']:
-                aluno['media_sociologia'] = aluno['media_sociologia']
-            if aluno['media_geral']:
-                aluno['media_geral'] = aluno['media_geral']
+            del aluno['chave_ordem']
         
-        return jsonify(alunos)
+        response = jsonify(alunos)
+        if proximo_cursor:
+            response.headers['X-Next-Cursor'] = proximo_cursor
+        return response
     
     except Exception as e:
         print(f"Erro ao listar alunos: {e}")
@@ -243,12 +278,17 @@ def create_aluno():
     if not all([nome, email, senha]):
         return jsonify({'error': 'Nome, email e senha são obrigatórios'}), 400
     
+    conn = get_db()
+    cursor = conn.cursor()
+    
     try:
         cursor.execute(
             'INSERT INTO Aluno (nome, email, senha, plano) VALUES (?, ?, ?, ?)',
-            (nome, email.lower(), senha, plano)
+            (nome, email.lower(), hash_fora_do_hub(senha), plano)
         )
         conn.commit()
+        invalidar_estatisticas()
+        invalidar_plano(cursor.lastrowid)
         return jsonify({'message': 'Aluno criado com sucesso'}), 201
     
     except sqlite3.IntegrityError:
@@ -281,7 +321,7 @@ def update_aluno(id_aluno):
     
     if 'senha' in data:
         campos.append('senha = ?')
-        valores.append(data['senha'])
+        valores.append(hash_fora_do_hub(data['senha']))
     
     if 'plano' in data:
         campos.append('plano = ?')
@@ -294,9 +334,14 @@ def update_aluno(id_aluno):
     
     query = f"UPDATE Aluno SET {', '.join(campos)} WHERE id_aluno = ?"
     
+    conn = get_db()
+    cursor = conn.cursor()
+    
     try:
         cursor.execute(query, valores)
         conn.commit()
+        invalidar_estatisticas()
+        invalidar_plano(id_aluno)
         
         if cursor.rowcount == 0:
             return jsonify({'error': 'Aluno não encontrado'}), 404
@@ -318,9 +363,14 @@ def delete_aluno(id_aluno):
     if 'admin_id' not in session:
         return jsonify({'error': 'Não autorizado'}), 401
     
+    conn = get_db()
+    cursor = conn.cursor()
+    
     try:
         cursor.execute('DELETE FROM Aluno WHERE id_aluno = ?', (id_aluno,))
         conn.commit()
+        invalidar_estatisticas()
+        invalidar_plano(id_aluno)
         
         if cursor.rowcount == 0:
             return jsonify({'error': 'Aluno não encontrado'}), 404
@@ -344,6 +394,9 @@ def get_resultados_aluno(id_aluno):
     if 'admin_id' not in session:
         return jsonify({'error': 'Não autorizado'}), 401
     
+    conn = get_db()
+    cursor = conn.cursor()
+    
     try:
         cursor.execute('''
             SELECT 
@@ -361,4 +414,140 @@ def get_resultados_aluno(id_aluno):
     
     except Exception as e:
         print(f"Erro ao buscar resultados: {e}")
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+# ===================================================================
+# IMPORTAÇÃO E EXPORTAÇÃO EM MASSA (CSV / NDJSON)
+# ===================================================================
+
+@admin_bp.route('/importar/<entidade>', methods=['POST'])
+def importar_dados(entidade):
+    """
+    Importa alunos ou resultados de quiz em massa
+
+    Aceita o arquivo no corpo da requisição ou no campo 'arquivo' de um upload
+    multipart. O formato vem de ?formato=csv|ndjson ou do Content-Type.
+    """
+    
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    if entidade not in IMPORTACOES:
+        return jsonify({'error': f"Use: {', '.join(IMPORTACOES)}"}), 404
+
+    arquivo = request.files.get('arquivo')
+    content_type = arquivo.mimetype if arquivo else request.mimetype
+    formato = detectar_formato(request.args.get('formato'), content_type)
+    if formato not in FORMATOS:
+        return jsonify({'error': f"Formato inválido. Use: {', '.join(FORMATOS)}"}), 400
+
+    stream = arquivo.stream if arquivo else request.stream
+    
+    conn = get_db()
+    
+    try:
+        resumo = Importacao(entidade).executar(conn, ler_registros(stream, formato))
+        if resumo['inseridos']:
+            invalidar_estatisticas()
+            if entidade == 'alunos':
+                invalidar_plano()
+            if entidade == 'resultados' and current_app.config.get('RANKING'):
+                # Placares em memória são relidos com os resultados importados
+                current_app.config['RANKING'].invalidar()
+        return jsonify(resumo)
+    
+    except UnicodeDecodeError:
+        return jsonify({'error': 'O arquivo deve estar em UTF-8'}), 400
+    except Exception as e:
+        print(f"Erro ao importar {entidade}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/exportar/<entidade>', methods=['GET'])
+def exportar_dados(entidade):
+    """
+    Exporta alunos (sem senha), resultados de quiz ou histórico premium
+
+    Query params: formato (csv ou ndjson), desde e ate (AAAA-MM-DD, para
+    resultados e histórico). A resposta é enviada em pedaços, sem montar o
+    arquivo inteiro na memória.
+    """
+    
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    if entidade not in EXPORTACOES:
+        return jsonify({'error': f"Use: {', '.join(EXPORTACOES)}"}), 404
+
+    formato = request.args.get('formato', 'csv').lower()
+    if formato not in FORMATOS:
+        return jsonify({'error': f"Formato inválido. Use: {', '.join(FORMATOS)}"}), 400
+
+    desde = request.args.get('desde')
+    ate = request.args.get('ate')
+    try:
+        for valor in (desde, ate):
+            if valor:
+                datetime.strptime(valor, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'Datas devem estar no formato AAAA-MM-DD'}), 400
+
+    mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    response = Response(
+        stream_with_context(exportar(entidade, formato, desde, ate)),
+        mimetype=mimetype
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename={entidade}.{formato}'
+    return response
+
+
+# ===================================================================
+# TENDÊNCIAS (BASE DE ANÁLISE SEPARADA)
+# ===================================================================
+
+@admin_bp.route('/tendencias', methods=['GET'])
+def get_tendencias():
+    """
+    Série temporal de quizzes ou atividades premium
+
+    Query params: fonte (quiz ou premium), granularidade (dia ou semana),
+    agrupar (plano, materia, tema, id_aluno; tipo_atividade para premium),
+    desde, ate e filtros por dimensão (ex.: ?plano=premium&materia=Filosofia).
+    Lê apenas a base de análise, atualizada a cada ANALYTICS_INTERVALO segundos.
+    """
+    
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    fonte = request.args.get('fonte', 'quiz')
+    granularidade = request.args.get('granularidade', 'dia')
+    if fonte not in DIMENSOES:
+        return jsonify({'error': f"Fonte inválida. Use: {', '.join(DIMENSOES)}"}), 400
+    if granularidade not in ('dia', 'semana'):
+        return jsonify({'error': "Granularidade inválida. Use: dia, semana"}), 400
+
+    desde = request.args.get('desde') or (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    ate = request.args.get('ate')
+    try:
+        for valor in (desde, ate):
+            if valor:
+                datetime.strptime(valor, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'Datas devem estar no formato AAAA-MM-DD'}), 400
+
+    filtros = {d: request.args[d] for d in DIMENSOES[fonte] if request.args.get(d)}
+
+    try:
+        return jsonify(current_app.config['ANALYTICS'].tendencias(
+            fonte=fonte,
+            granularidade=granularidade,
+            agrupar=request.args.get('agrupar') or None,
+            desde=desde,
+            ate=ate,
+            filtros=filtros
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Erro ao buscar tendências: {e}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,170 @@
+"""
+Controle de admissão das chamadas ao Gemini
+No máximo N chamadas em andamento no worker; as demais esperam em uma fila limitada
+(em ordem de chegada) por até um tempo máximo. Fila cheia ou espera esgotada viram
+uma recusa rápida (503 + Retry-After), em vez de acumular requisições até todas
+estourarem o timeout quando o Gemini fica lento
+"""
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+import math
+import os
+import threading
+import time
+
+from flask import current_app, jsonify
+
+from tarefas import novo_semaforo
+
+
+class Sobrecarga(Exception):
+    """Chamada recusada pelo controle de admissão"""
+
+    def __init__(self, retry_after, motivo):
+        super().__init__(motivo)
+        self.retry_after = retry_after
+        self.motivo = motivo
+
+
+class _Espera:
+    __slots__ = ('sinal', 'concedida', 'ao_aguardar')
+
+    def __init__(self, ao_aguardar):
+        self.sinal = novo_semaforo(0)
+        self.concedida = False
+        self.ao_aguardar = ao_aguardar
+
+
+class Admissao:
+    def __init__(self, max_simultaneas=None, max_fila=None, espera_maxima=None):
+        """
+        Inicializa o controle de admissão
+
+        Args:
+            max_simultaneas: Chamadas ao Gemini em andamento ao mesmo tempo
+            max_fila: Chamadas aguardando vaga; acima disso a recusa é imediata
+            espera_maxima: Segundos que uma chamada aguarda vaga antes de ser recusada
+        """
+        self.max_simultaneas = max_simultaneas or int(os.getenv('ADMISSAO_MAX_SIMULTANEAS', 8))
+        self.max_fila = max_fila if max_fila is not None else int(os.getenv('ADMISSAO_MAX_FILA', 32))
+        self.espera_maxima = espera_maxima or float(os.getenv('ADMISSAO_ESPERA_MAXIMA', 10))
+
+        self._em_uso = 0
+        self._fila = deque()
+        self._lock = threading.Lock()
+
+        # Média móvel da duração de uma chamada (estimativa do Retry-After)
+        self._duracao_media = 5.0
+        self._admitidas = 0
+        self._recusadas_fila_cheia = 0
+        self._recusadas_espera = 0
+
+    def _retry_after(self):
+        rodadas = (len(self._fila) + 1) / self.max_simultaneas
+        return max(1, math.ceil(self._duracao_media * rodadas))
+
+    def _entrar(self, ao_aguardar):
+        with self._lock:
+            if self._em_uso < self.max_simultaneas and not self._fila:
+                self._em_uso += 1
+                self._admitidas += 1
+                return
+            if len(self._fila) >= self.max_fila:
+                self._recusadas_fila_cheia += 1
+                raise Sobrecarga(self._retry_after(), 'fila cheia')
+            espera = _Espera(ao_aguardar)
+            self._fila.append(espera)
+            posicao = len(self._fila)
+
+        if ao_aguardar:
+            ao_aguardar(posicao)
+
+        recebeu = espera.sinal.acquire(timeout=self.espera_maxima)
+        with self._lock:
+            # A vaga pode ter sido repassada junto com o fim do tempo de espera
+            if recebeu or espera.concedida:
+                self._admitidas += 1
+                return
+            self._fila.remove(espera)
+            self._recusadas_espera += 1
+            retry_after = self._retry_after()
+
+        self._avisar_posicoes()
+        raise Sobrecarga(retry_after, 'tempo de espera esgotado')
+
+    def _sair(self, duracao):
+        with self._lock:
+            self._duracao_media = 0.8 * self._duracao_media + 0.2 * duracao
+            proxima = self._fila.popleft() if self._fila else None
+            if proxima is not None:
+                # A vaga passa direto para o primeiro da fila (_em_uso não muda)
+                proxima.concedida = True
+                proxima.sinal.release()
+            else:
+                self._em_uso -= 1
+
+        if proxima is not None:
+            self._avisar_posicoes()
+
+    def _avisar_posicoes(self):
+        for posicao, espera in enumerate(list(self._fila), start=1):
+            if espera.ao_aguardar:
+                espera.ao_aguardar(posicao)
+
+    @contextmanager
+    def vaga(self, ao_aguardar=None):
+        """
+        Ocupa uma vaga durante o bloco
+
+        Args:
+            ao_aguardar: Função(posição) chamada ao entrar na fila e a cada avanço dela
+
+        Raises:
+            Sobrecarga: Fila cheia ou espera maior que espera_maxima
+        """
+        self._entrar(ao_aguardar)
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            self._sair(time.monotonic() - inicio)
+
+    def estatisticas(self):
+        return {
+            'em_andamento': self._em_uso,
+            'na_fila': len(self._fila),
+            'max_simultaneas': self.max_simultaneas,
+            'max_fila': self.max_fila,
+            'duracao_media': round(self._duracao_media, 2),
+            'admitidas': self._admitidas,
+            'recusadas_fila_cheia': self._recusadas_fila_cheia,
+            'recusadas_espera': self._recusadas_espera
+        }
+
+
+def resposta_sobrecarga(erro):
+    """503 com Retry-After para uma chamada recusada"""
+    response = jsonify({'error': 'Servidor ocupado gerando outros conteúdos. Tente novamente em instantes.',
+                        'motivo': erro.motivo, 'retry_after': erro.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(erro.retry_after)
+    return response
+
+
+def com_admissao(view):
+    """
+    Rota que chama o Gemini: só executa com uma vaga em ADMISSAO_GEMINI,
+    senão responde 503 com Retry-After (antes de reservar o uso do aluno)
+    """
+    @wraps(view)
+    def envolvida(*args, **kwargs):
+        admissao = current_app.config.get('ADMISSAO_GEMINI')
+        if admissao is None:
+            return view(*args, **kwargs)
+        try:
+            with admissao.vaga():
+                return view(*args, **kwargs)
+        except Sobrecarga as e:
+            return resposta_sobrecarga(e)
+    return envolvida
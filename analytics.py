@@ -0,0 +1,333 @@
+# comando para rodar uma carga manual: python analytics.py
+"""
+Base de análise separada do banco principal
+Um ETL periódico copia, de forma incremental, quiz_resultado e historico_premium
+para agregados diários e semanais em outro arquivo SQLite. Os relatórios leem só
+essa base e não disputam locks com as escritas dos alunos
+"""
+from datetime import date, datetime, timedelta
+import os
+import sqlite3
+
+from config import pool
+from utils import classificar_materia, normalizar_tema
+from tarefas import iniciar_em_segundo_plano, pausar
+
+SQL_SCHEMA_ANALYTICS = """
+/* Até onde cada tabela de origem já foi carregada (maior id processado) */
+CREATE TABLE IF NOT EXISTS etl_marca (
+    fonte TEXT PRIMARY KEY,
+    ultimo_id INTEGER NOT NULL DEFAULT 0,
+    atualizado_em DATETIME
+);
+
+/* Quizzes por período x plano x matéria x tema x aluno */
+CREATE TABLE IF NOT EXISTS fato_quiz (
+    granularidade TEXT NOT NULL CHECK(granularidade IN ('dia', 'semana')),
+    periodo DATE NOT NULL, /* o dia, ou a segunda-feira da semana */
+    plano TEXT NOT NULL,
+    materia TEXT NOT NULL,
+    tema TEXT NOT NULL,
+    id_aluno INTEGER NOT NULL,
+    quantidade INTEGER NOT NULL DEFAULT 0,
+    quantidade_validos INTEGER NOT NULL DEFAULT 0,
+    soma_percentual REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularidade, periodo, plano, materia, tema, id_aluno)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_fato_quiz_aluno ON fato_quiz(id_aluno, granularidade, periodo);
+
+/* Atividades premium por período x plano x tipo x matéria x tema x aluno */
+CREATE TABLE IF NOT EXISTS fato_premium (
+    granularidade TEXT NOT NULL CHECK(granularidade IN ('dia', 'semana')),
+    periodo DATE NOT NULL,
+    plano TEXT NOT NULL,
+    tipo_atividade TEXT NOT NULL,
+    materia TEXT NOT NULL,
+    tema TEXT NOT NULL,
+    id_aluno INTEGER NOT NULL,
+    quantidade INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularidade, periodo, plano, tipo_atividade, materia, tema, id_aluno)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_fato_premium_aluno ON fato_premium(id_aluno, granularidade, periodo);
+"""
+
+# Agrupamentos aceitos em /admin/tendencias, por fonte
+DIMENSOES = {
+    'quiz': ('plano', 'materia', 'tema', 'id_aluno'),
+    'premium': ('plano', 'tipo_atividade', 'materia', 'tema', 'id_aluno'),
+}
+
+
+def _dia(valor):
+    """Data (AAAA-MM-DD) de um DATE ou DATETIME gravado pelo SQLite"""
+    return str(valor)[:10]
+
+
+def _semana(dia):
+    """Segunda-feira da semana do dia"""
+    d = date.fromisoformat(dia)
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+
+class AnalyticsETL:
+    def __init__(self, db_path=None, intervalo=None, tamanho_lote=None):
+        """
+        Args:
+            db_path: Arquivo SQLite da base de análise
+            intervalo: Segundos entre as cargas periódicas
+            tamanho_lote: Linhas de origem lidas por transação
+        """
+        self.db_path = db_path or os.getenv('ANALYTICS_DB', 'analytics.db')
+        self.intervalo = intervalo or int(os.getenv('ANALYTICS_INTERVALO', 300))
+        self.tamanho_lote = tamanho_lote or int(os.getenv('ANALYTICS_LOTE', 5000))
+        self._tarefa = None
+        self.ultima_carga = None
+
+        conn = self._conectar()
+        try:
+            conn.executescript(SQL_SCHEMA_ANALYTICS)
+        finally:
+            conn.close()
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    # ============================================
+    # ETL
+    # ============================================
+
+    def _extrair_quiz(self, ultimo_id):
+        with pool.conexao() as conn:
+            return conn.execute(
+                '''
+                SELECT q.id_resultado AS id, q.id_aluno, q.tema, q.materia, q.acertos, q.total_perguntas,
+                       q.data_criacao, COALESCE(a.plano, 'removido') AS plano
+                FROM quiz_resultado q
+                LEFT JOIN aluno a ON a.id_aluno = q.id_aluno
+                WHERE q.id_resultado > ?
+                ORDER BY q.id_resultado
+                LIMIT ?
+                ''', (ultimo_id, self.tamanho_lote)
+            ).fetchall()
+
+    def _extrair_premium(self, ultimo_id):
+        with pool.conexao() as conn:
+            return conn.execute(
+                '''
+                SELECT h.id_historico AS id, h.id_aluno, h.tema, h.tipo_atividade, h.data_criacao,
+                       COALESCE(a.plano, 'removido') AS plano
+                FROM historico_premium h
+                LEFT JOIN aluno a ON a.id_aluno = h.id_aluno
+                WHERE h.id_historico > ?
+                ORDER BY h.id_historico
+                LIMIT ?
+                ''', (ultimo_id, self.tamanho_lote)
+            ).fetchall()
+
+    def _agregar_quiz(self, linhas):
+        fatos = {}
+        for linha in linhas:
+            dia = _dia(linha['data_criacao'])
+            valido = linha['total_perguntas'] > 0
+            percentual = linha['acertos'] / linha['total_perguntas'] if valido else 0
+            for granularidade, periodo in (('dia', dia), ('semana', _semana(dia))):
+                chave = (granularidade, periodo, linha['plano'], linha['materia'],
+                         normalizar_tema(linha['tema']), linha['id_aluno'])
+                fato = fatos.setdefault(chave, [0, 0, 0.0])
+                fato[0] += 1
+                fato[1] += valido
+                fato[2] += percentual
+        return [chave + tuple(valores) for chave, valores in fatos.items()]
+
+    def _agregar_premium(self, linhas):
+        fatos = {}
+        for linha in linhas:
+            dia = _dia(linha['data_criacao'])
+            for granularidade, periodo in (('dia', dia), ('semana', _semana(dia))):
+                chave = (granularidade, periodo, linha['plano'], linha['tipo_atividade'],
+                         classificar_materia(linha['tema']), normalizar_tema(linha['tema']), linha['id_aluno'])
+                fatos[chave] = fatos.get(chave, 0) + 1
+        return [chave + (quantidade,) for chave, quantidade in fatos.items()]
+
+    def _carregar(self, fonte, ultimo_id, novo_ultimo_id, sql, fatos):
+        """
+        Grava os agregados e avança a marca na mesma transação
+
+        A marca só avança se ainda for ultimo_id (outro worker pode ter carregado o
+        mesmo lote); nesse caso nada é gravado, evitando contagem dupla.
+
+        Returns:
+            bool: True se o lote foi gravado
+        """
+        conn = self._conectar()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT ultimo_id FROM etl_marca WHERE fonte = ?', (fonte,)).fetchone()
+            if (row['ultimo_id'] if row else 0) != ultimo_id:
+                conn.rollback()
+                return False
+
+            conn.executemany(sql, fatos)
+            conn.execute(
+                '''
+                INSERT INTO etl_marca (fonte, ultimo_id, atualizado_em) VALUES (?, ?, ?)
+                ON CONFLICT(fonte) DO UPDATE SET ultimo_id = excluded.ultimo_id, atualizado_em = excluded.atualizado_em
+                ''', (fonte, novo_ultimo_id, datetime.now())
+            )
+            conn.commit()
+            return True
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _marca(self, fonte):
+        conn = self._conectar()
+        try:
+            row = conn.execute('SELECT ultimo_id FROM etl_marca WHERE fonte = ?', (fonte,)).fetchone()
+            return row['ultimo_id'] if row else 0
+        finally:
+            conn.close()
+
+    def executar(self):
+        """
+        Carrega tudo o que entrou desde a última execução
+
+        Resultados apagados depois de carregados continuam na base de análise
+        (ela registra a atividade que aconteceu, não o estado atual).
+
+        Returns:
+            dict: Linhas de origem processadas por fonte
+        """
+        fontes = {
+            'quiz_resultado': (
+                self._extrair_quiz, self._agregar_quiz,
+                '''
+                INSERT INTO fato_quiz (granularidade, periodo, plano, materia, tema, id_aluno,
+                                       quantidade, quantidade_validos, soma_percentual)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(granularidade, periodo, plano, materia, tema, id_aluno) DO UPDATE SET
+                    quantidade = quantidade + excluded.quantidade,
+                    quantidade_validos = quantidade_validos + excluded.quantidade_validos,
+                    soma_percentual = soma_percentual + excluded.soma_percentual
+                '''
+            ),
+            'historico_premium': (
+                self._extrair_premium, self._agregar_premium,
+                '''
+                INSERT INTO fato_premium (granularidade, periodo, plano, tipo_atividade, materia, tema, id_aluno, quantidade)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(granularidade, periodo, plano, tipo_atividade, materia, tema, id_aluno) DO UPDATE SET
+                    quantidade = quantidade + excluded.quantidade
+                '''
+            ),
+        }
+
+        processadas = {}
+        for fonte, (extrair, agregar, sql) in fontes.items():
+            processadas[fonte] = 0
+            while True:
+                ultimo_id = self._marca(fonte)
+                linhas = extrair(ultimo_id)
+                if not linhas:
+                    break
+                if not self._carregar(fonte, ultimo_id, linhas[-1]['id'], sql, agregar(linhas)):
+                    # Outro processo carregou este lote; continua a partir da nova marca
+                    continue
+                processadas[fonte] += len(linhas)
+                if len(linhas) < self.tamanho_lote:
+                    break
+
+        self.ultima_carga = datetime.now().isoformat(timespec='seconds')
+        return processadas
+
+    def _laco(self):
+        while True:
+            try:
+                processadas = self.executar()
+                if any(processadas.values()):
+                    print(f"📊 Base de análise atualizada: {processadas}")
+            except Exception as e:
+                print(f"❌ Erro no ETL da base de análise: {e}")
+            pausar(self.intervalo)
+
+    def iniciar_periodico(self):
+        """Inicia (uma única vez) a carga periódica em segundo plano"""
+        if self._tarefa is None:
+            self._tarefa = iniciar_em_segundo_plano(self._laco)
+        return self._tarefa
+
+    # ============================================
+    # CONSULTAS
+    # ============================================
+
+    def tendencias(self, fonte='quiz', granularidade='dia', agrupar=None, desde=None, ate=None, filtros=None):
+        """
+        Série temporal sobre os agregados
+
+        Args:
+            fonte: 'quiz' ou 'premium'
+            granularidade: 'dia' ou 'semana'
+            agrupar: Dimensão que separa as séries (None = uma série com o total)
+            desde, ate: Limites do período (AAAA-MM-DD)
+            filtros: {dimensão: valor} para restringir as linhas
+
+        Returns:
+            dict: {'series': [{'chave', 'pontos': [{'periodo', 'quantidade', 'media'?}]}], ...}
+        """
+        tabela = 'fato_quiz' if fonte == 'quiz' else 'fato_premium'
+        dimensoes = DIMENSOES[fonte]
+        if agrupar and agrupar not in dimensoes:
+            raise ValueError(f"Agrupamento inválido. Use: {', '.join(dimensoes)}")
+
+        coluna_serie = agrupar or "'total'"
+        colunas = f"{coluna_serie} AS chave, periodo, SUM(quantidade) AS quantidade"
+        if fonte == 'quiz':
+            colunas += ", SUM(quantidade_validos) AS validos, SUM(soma_percentual) AS soma"
+
+        condicoes = ['granularidade = ?']
+        params = [granularidade]
+        if desde:
+            condicoes.append('periodo >= ?')
+            params.append(desde)
+        if ate:
+            condicoes.append('periodo <= ?')
+            params.append(ate)
+        for dimensao, valor in (filtros or {}).items():
+            if dimensao not in dimensoes:
+                raise ValueError(f"Filtro inválido: {dimensao}")
+            condicoes.append(f'{dimensao} = ?')
+            params.append(normalizar_tema(valor) if dimensao == 'tema' else valor)
+
+        sql = (f"SELECT {colunas} FROM {tabela} WHERE {' AND '.join(condicoes)} "
+               f"GROUP BY chave, periodo ORDER BY chave, periodo")
+
+        conn = self._conectar()
+        try:
+            linhas = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+        series = {}
+        for linha in linhas:
+            ponto = {'periodo': linha['periodo'], 'quantidade': linha['quantidade']}
+            if fonte == 'quiz':
+                ponto['media'] = linha['soma'] / linha['validos'] if linha['validos'] else None
+            series.setdefault(linha['chave'], []).append(ponto)
+
+        return {
+            'fonte': fonte,
+            'granularidade': granularidade,
+            'agrupar': agrupar,
+            'ultima_carga': self.ultima_carga,
+            'series': [{'chave': chave, 'pontos': pontos} for chave, pontos in series.items()]
+        }
+
+
+if __name__ == "__main__":
+    print(AnalyticsETL().executar())
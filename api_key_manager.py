@@ -3,21 +3,71 @@ Gerenciador de Chaves API do Google Gemini
 Rotaciona automaticamente entre múltiplas chaves quando uma atinge o limite
 """
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from collections import deque
 from datetime import datetime, timedelta
 import json
 import os
+import queue
+import time
+
+from tarefas import iniciar_em_segundo_plano, pausar, executar_bloqueante, nova_fila, cancelar
+
+# Estados do circuit breaker de cada chave
+CIRCUIT_CLOSED = 'closed'        # Chave saudável, recebe tráfego
+CIRCUIT_OPEN = 'open'            # Chave falhando, nenhum tráfego até a próxima sondagem
+CIRCUIT_HALF_OPEN = 'half_open'  # Sondagem em andamento, ainda sem tráfego real
+
+# Trechos de mensagens de erro que indicam limite de quota atingido
+QUOTA_ERRORS = [
+    'quota',
+    'rate limit',
+    'too many requests',
+    'resource exhausted',
+    '429',
+    'daily limit exceeded'
+]
+
+def is_quota_error(error):
+    """Indica se a exceção corresponde a um limite de quota/429"""
+    error_str = str(error).lower()
+    return any(err in error_str for err in QUOTA_ERRORS)
 
 class APIKeyManager:
-    def __init__(self, keys_file='api_keys.json'):
+    def __init__(self, keys_file='api_keys.json', cooldown_base=None, cooldown_max=None, probe_interval=None, ewma_alpha=None):
         """
         Inicializa o gerenciador de chaves
         
         Args:
             keys_file: Caminho para o arquivo JSON com as chaves
+            cooldown_base: Segundos até a primeira sondagem de uma chave aberta
+            cooldown_max: Limite (segundos) do backoff exponencial entre sondagens
+            probe_interval: Intervalo (segundos) da varredura de sondagem em segundo plano
+            ewma_alpha: Peso da observação mais recente nas médias móveis exponenciais
         """
         self.keys_file = keys_file
+        self.cooldown_base = cooldown_base or int(os.getenv('KEY_COOLDOWN_BASE', 60))
+        self.cooldown_max = cooldown_max or int(os.getenv('KEY_COOLDOWN_MAX', 1800))
+        self.probe_interval = probe_interval or int(os.getenv('KEY_PROBE_INTERVAL', 30))
+        self.ewma_alpha = ewma_alpha or float(os.getenv('KEY_EWMA_ALPHA', 0.2))
+        self.max_rate_limit_rate = float(os.getenv('KEY_MAX_429_RATE', 0.5))
         self.keys_data = self._load_keys()
         self.current_key_index = 0
+        self._clients = {}
+        self._probe_task = None
+        self._stats = {}
+
+        # Hedging: se a chamada passar do percentil HEDGE_PERCENTIL das latências
+        # recentes, uma cópia vai para outra chave e vale a primeira resposta.
+        # As cópias gastam um orçamento reposto a cada chamada (HEDGE_ORCAMENTO = 10% a mais, no máximo)
+        self.hedge_enabled = os.getenv('HEDGE_ATIVO', '0') == '1'
+        self.hedge_percentile = float(os.getenv('HEDGE_PERCENTIL', 95))
+        self.hedge_min_samples = int(os.getenv('HEDGE_MIN_AMOSTRAS', 20))
+        self.hedge_budget_ratio = float(os.getenv('HEDGE_ORCAMENTO', 0.1))
+        self.hedge_budget_max = float(os.getenv('HEDGE_ORCAMENTO_MAX', 5))
+        self._latencies = deque(maxlen=int(os.getenv('HEDGE_JANELA', 200)))
+        self._hedge_tokens = self.hedge_budget_max
+        self._hedge_stats = {"calls": 0, "hedges": 0, "hedge_wins": 0, "no_budget": 0}
         # Só configura se houver chaves
         if self.keys_data.get('keys'):
             self.configure_current_key()
@@ -26,7 +76,13 @@ class APIKeyManager:
         """Carrega as chaves do arquivo JSON"""
         if os.path.exists(self.keys_file):
             with open(self.keys_file, 'r') as f:
-                return json.load(f)
+                data = json.load(f)
+            # Arquivos antigos não têm os campos do circuit breaker
+            for key_entry in data.get('keys', []):
+                key_entry.setdefault('circuit_state', CIRCUIT_CLOSED if key_entry.get('active', True) else CIRCUIT_OPEN)
+                key_entry.setdefault('opened_at', None)
+                key_entry.setdefault('probe_failures', 0)
+            return data
         else:
             # Cria estrutura inicial se o arquivo não existir
             default_structure = {
@@ -58,7 +114,10 @@ class APIKeyManager:
             "active": True,
             "error_count": 0,
             "last_error": None,
-            "blocked_until": None
+            "blocked_until": None,
+            "circuit_state": CIRCUIT_CLOSED,
+            "opened_at": None,
+            "probe_failures": 0
         }
         
         self.keys_data['keys'].append(key_entry)
@@ -78,6 +137,29 @@ class APIKeyManager:
         genai.configure(api_key=current['key'])
         print(f"🔑 Usando chave: {current['name']}")
     
+    def model_for_key(self, key_entry, model_name, **model_kwargs):
+        """
+        Cria um GenerativeModel preso a uma chave específica
+
+        O genai.configure é global; para sondar (ou usar) uma chave sem trocar a
+        chave de todo o processo, o modelo recebe um cliente próprio. O SDK não tem
+        API pública para isso: o atributo _client é o da versão fixada em
+        requirements.txt, e a checagem abaixo falha alto se ele mudar.
+        """
+        client = self._clients.get(key_entry['name'])
+        if client is None:
+            client = glm.GenerativeServiceClient(client_options={'api_key': key_entry['key']})
+            self._clients[key_entry['name']] = client
+
+        model = genai.GenerativeModel(model_name, **model_kwargs)
+        if '_client' not in vars(model):
+            raise RuntimeError(
+                "google-generativeai sem GenerativeModel._client: atualize model_for_key "
+                "ou use a versão fixada em requirements.txt"
+            )
+        model._client = client
+        return model
+    
     def rotate_key(self, reason="manual"):
         """
         Rotaciona para a próxima chave disponível
@@ -89,82 +171,343 @@ class APIKeyManager:
             print("⚠️ Apenas uma chave disponível, não é possível rotacionar!")
             return False
         
-        # Marca a chave atual como com erro
-        current = self.keys_data['keys'][self.current_key_index]
-        current['error_count'] += 1
-        current['last_error'] = datetime.now().isoformat()
+        # Escolhe a melhor chave disponível (menor latência esperada), exceto a atual
+        original_index = self.current_key_index
+        next_index = self._best_key_index(exclude=original_index)
         
-        # Se atingiu muitos erros, bloqueia temporariamente (24h)
-        if current['error_count'] >= 3:
-            current['blocked_until'] = (datetime.now() + timedelta(hours=24)).isoformat()
-            current['active'] = False
-            print(f"🚫 Chave '{current['name']}' bloqueada até {current['blocked_until']}")
+        if next_index is not None:
+            next_key = self.keys_data['keys'][next_index]
+            self.current_key_index = next_index
+            self.keys_data['last_rotation'] = datetime.now().isoformat()
+            self._save_keys(self.keys_data)
+            self.configure_current_key()
+            print(f"🔄 Rotação realizada: {reason}")
+            print(f"   {self.keys_data['keys'][original_index]['name']} → {next_key['name']}")
+            return True
         
-        # Procura a próxima chave disponível
-        attempts = 0
-        original_index = self.current_key_index
+        print("❌ Nenhuma chave disponível para rotação!")
+        return False
+    
+    def _is_key_available(self, key_entry):
+        """
+        Verifica se uma chave está disponível para uso
+
+        Só chaves com o circuito fechado recebem tráfego. A reativação de chaves
+        abertas é responsabilidade das sondagens (probe_due_keys).
+        """
+        return key_entry.get('circuit_state', CIRCUIT_CLOSED) == CIRCUIT_CLOSED
+    
+    # ============================================
+    # ESTATÍSTICAS POR CHAVE (EWMA) E SELEÇÃO
+    # ============================================
+    
+    def _stats_for(self, key_entry):
+        stats = self._stats.get(key_entry['name'])
+        if stats is None:
+            stats = {
+                "latency_ewma": None,
+                "error_rate": 0.0,
+                "rate_limit_rate": 0.0,
+                "calls": 0,
+                "last_latency": None
+            }
+            self._stats[key_entry['name']] = stats
+        return stats
+    
+    def _ewma(self, previous, value):
+        if previous is None:
+            return value
+        return self.ewma_alpha * value + (1 - self.ewma_alpha) * previous
+    
+    def record_result(self, key_entry, latency, error=None):
+        """
+        Registra o resultado de uma chamada feita com a chave
         
-        while attempts < len(self.keys_data['keys']):
-            self.current_key_index = (self.current_key_index + 1) % len(self.keys_data['keys'])
-            next_key = self.keys_data['keys'][self.current_key_index]
+        Args:
+            key_entry: Chave usada
+            latency: Duração da chamada em segundos
+            error: Exceção da chamada (None em caso de sucesso)
+        """
+        stats = self._stats_for(key_entry)
+        stats['calls'] += 1
+        stats['error_rate'] = self._ewma(stats['error_rate'], 1.0 if error else 0.0)
+        stats['rate_limit_rate'] = self._ewma(stats['rate_limit_rate'], 1.0 if error and is_quota_error(error) else 0.0)
+        
+        # Latência só é representativa quando a chamada terminou normalmente
+        if error is None:
+            stats['last_latency'] = latency
+            stats['latency_ewma'] = self._ewma(stats['latency_ewma'], latency)
+            self._latencies.append(latency)
+            self.record_success(key_entry)
+    
+    def record_censored(self, key_entry, elapsed):
+        """
+        Registra uma chamada abandonada (perdedora de um hedge) ainda em andamento
+        
+        A latência real é desconhecida, mas é pelo menos elapsed: o valor entra na
+        janela do percentil e só puxa o EWMA para cima, nunca para baixo. Sem isso
+        as chamadas lentas sumiriam das estatísticas justamente por serem lentas.
+        
+        Args:
+            key_entry: Chave da chamada abandonada
+            elapsed: Tempo decorrido até o abandono, em segundos
+        """
+        stats = self._stats_for(key_entry)
+        if stats['latency_ewma'] is None or elapsed > stats['latency_ewma']:
+            stats['latency_ewma'] = self._ewma(stats['latency_ewma'], elapsed)
+        self._latencies.append(elapsed)
+    
+    def _score(self, key_entry):
+        """
+        Latência esperada da chave: EWMA da latência inflada pela taxa de erro
+        (cada erro custa, em média, uma nova tentativa). Chaves sem histórico
+        recebem 0 para serem experimentadas logo.
+        """
+        stats = self._stats_for(key_entry)
+        if stats['latency_ewma'] is None:
+            return 0.0
+        success_rate = max(1.0 - stats['error_rate'], 0.05)
+        return stats['latency_ewma'] / success_rate
+    
+    def _best_key_index(self, exclude=None):
+        """Índice da chave disponível de menor score, priorizando as que têm folga de quota"""
+        candidates = [
+            i for i, k in enumerate(self.keys_data['keys'])
+            if i != exclude and self._is_key_available(k)
+        ]
+        if not candidates:
+            return None
+        
+        with_headroom = [
+            i for i in candidates
+            if self._stats_for(self.keys_data['keys'][i])['rate_limit_rate'] < self.max_rate_limit_rate
+        ]
+        pool = with_headroom or candidates
+        return min(pool, key=lambda i: self._score(self.keys_data['keys'][i]))
+    
+    def select_key(self, exclude=None):
+        """
+        Escolhe a chave para a próxima chamada
+
+        Args:
+            exclude: Entrada de chave que não deve ser escolhida (ex.: a da chamada original de um hedge)
+
+        Returns:
+            dict: Entrada da chave ou None se nenhuma estiver disponível
+        """
+        exclude_index = None
+        if exclude is not None:
+            exclude_index = next((i for i, k in enumerate(self.keys_data['keys']) if k is exclude), None)
+        index = self._best_key_index(exclude=exclude_index)
+        if index is None:
+            return None
+        return self.keys_data['keys'][index]
+    
+    def get_key_stats(self):
+        """Estatísticas por chave (para o endpoint de status)"""
+        result = {}
+        for key_entry in self.keys_data['keys']:
+            stats = self._stats_for(key_entry)
+            result[key_entry['name']] = {
+                "latency_ewma_ms": round(stats['latency_ewma'] * 1000, 1) if stats['latency_ewma'] is not None else None,
+                "last_latency_ms": round(stats['last_latency'] * 1000, 1) if stats['last_latency'] is not None else None,
+                "error_rate": round(stats['error_rate'], 4),
+                "rate_limit_rate": round(stats['rate_limit_rate'], 4),
+                "calls": stats['calls'],
+                "score_ms": round(self._score(key_entry) * 1000, 1)
+            }
+        return result
+    
+    # ============================================
+    # HEDGING (CÓPIA DA CHAMADA EM OUTRA CHAVE)
+    # ============================================
+
+    def hedge_delay(self):
+        """
+        Segundos de espera antes de disparar a cópia (percentil das latências recentes)
+
+        Returns:
+            float ou None: None com hedging desligado, menos de duas chaves ou poucas amostras
+        """
+        if not self.hedge_enabled or len(self.keys_data['keys']) < 2 or len(self._latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(self.hedge_percentile / 100 * len(ordered)))
+        return ordered[index]
+
+    def note_call(self):
+        """Cada chamada original repõe uma fração do orçamento de cópias"""
+        self._hedge_stats['calls'] += 1
+        self._hedge_tokens = min(self.hedge_budget_max, self._hedge_tokens + self.hedge_budget_ratio)
+
+    def reserve_hedge(self):
+        """Consome o orçamento de uma cópia; False quando ele acabou"""
+        if self._hedge_tokens >= 1:
+            self._hedge_tokens -= 1
+            self._hedge_stats['hedges'] += 1
+            return True
+        self._hedge_stats['no_budget'] += 1
+        return False
+
+    def note_hedge_win(self):
+        self._hedge_stats['hedge_wins'] += 1
+
+    def get_hedge_stats(self):
+        delay = self.hedge_delay()
+        return {
+            **self._hedge_stats,
+            "enabled": self.hedge_enabled,
+            "percentile": self.hedge_percentile,
+            "delay_ms": round(delay * 1000, 1) if delay is not None else None,
+            "budget": round(self._hedge_tokens, 2)
+        }
+
+    # ============================================
+    # CIRCUIT BREAKER
+    # ============================================
+    
+    def has_available_key(self):
+        """Indica se existe ao menos uma chave com o circuito fechado"""
+        return any(self._is_key_available(k) for k in self.keys_data['keys'])
+    
+    def has_spare_quota(self):
+        """
+        Indica se há chave com o circuito fechado e folga de quota (poucos 429 recentes),
+        para trabalho que pode esperar, como a pré-geração de conteúdo
+        """
+        return any(
+            self._is_key_available(k) and self._stats_for(k)['rate_limit_rate'] < self.max_rate_limit_rate / 2
+            for k in self.keys_data['keys']
+        )
+    
+    def _cooldown_for(self, key_entry):
+        """Backoff exponencial entre sondagens que continuam falhando"""
+        cooldown = self.cooldown_base * (2 ** key_entry.get('probe_failures', 0))
+        return min(cooldown, self.cooldown_max)
+    
+    def open_circuit(self, key_entry, reason=""):
+        """Abre o circuito da chave: ela sai do rodízio até uma sondagem passar"""
+        now = datetime.now()
+        key_entry['error_count'] += 1
+        key_entry['last_error'] = now.isoformat()
+        key_entry['circuit_state'] = CIRCUIT_OPEN
+        key_entry['active'] = False
+        if not key_entry.get('opened_at'):
+            key_entry['opened_at'] = now.isoformat()
+        key_entry['blocked_until'] = (now + timedelta(seconds=self._cooldown_for(key_entry))).isoformat()
+        self._save_keys(self.keys_data)
+        print(f"🚫 Circuito da chave '{key_entry['name']}' aberto ({reason}) - próxima sondagem em {key_entry['blocked_until']}")
+    
+    def close_circuit(self, key_entry):
+        """Fecha o circuito: a chave volta a receber tráfego"""
+        was_open = key_entry.get('circuit_state') != CIRCUIT_CLOSED
+        key_entry['circuit_state'] = CIRCUIT_CLOSED
+        key_entry['active'] = True
+        key_entry['error_count'] = 0
+        key_entry['blocked_until'] = None
+        key_entry['opened_at'] = None
+        key_entry['probe_failures'] = 0
+        if was_open:
+            self._save_keys(self.keys_data)
+            print(f"✅ Chave '{key_entry['name']}' reativada!")
+    
+    def record_success(self, key_entry=None):
+        """Registra uma chamada bem-sucedida (zera a contagem de erros da chave)"""
+        if key_entry is None:
+            if not self.keys_data['keys']:
+                return
+            key_entry = self.get_current_key()
+        if key_entry['error_count']:
+            key_entry['error_count'] = 0
+            self._save_keys(self.keys_data)
+    
+    def _probe_key(self, key_entry, model_name="gemini-2.5-flash"):
+        """Envia uma requisição mínima (1 token de saída) usando a chave informada"""
+        model = self.model_for_key(key_entry, model_name)
+        executar_bloqueante(
+            model.generate_content,
+            "ping",
+            generation_config={"max_output_tokens": 1}
+        )
+    
+    def probe_due_keys(self):
+        """
+        Sonda as chaves abertas cujo cooldown expirou (estado half-open)
+
+        Returns:
+            int: Quantidade de chaves reativadas
+        """
+        reactivated = 0
+        now = datetime.now()
+        
+        for key_entry in self.keys_data['keys']:
+            if key_entry.get('circuit_state') != CIRCUIT_OPEN:
+                continue
+            if key_entry['blocked_until'] and datetime.fromisoformat(key_entry['blocked_until']) > now:
+                continue
             
-            # Verifica se a chave está disponível
-            if self._is_key_available(next_key):
-                self.keys_data['last_rotation'] = datetime.now().isoformat()
+            key_entry['circuit_state'] = CIRCUIT_HALF_OPEN
+            try:
+                self._probe_key(key_entry)
+            except Exception as e:
+                if key_entry.get('circuit_state') != CIRCUIT_HALF_OPEN:
+                    # Resetada manualmente durante a sondagem
+                    continue
+                key_entry['probe_failures'] = key_entry.get('probe_failures', 0) + 1
+                key_entry['circuit_state'] = CIRCUIT_OPEN
+                key_entry['blocked_until'] = (datetime.now() + timedelta(seconds=self._cooldown_for(key_entry))).isoformat()
                 self._save_keys(self.keys_data)
-                self.configure_current_key()
-                print(f"🔄 Rotação realizada: {reason}")
-                print(f"   {self.keys_data['keys'][original_index]['name']} → {next_key['name']}")
-                return True
+                print(f"🔴 Sondagem da chave '{key_entry['name']}' falhou: {e}")
+                continue
             
-            attempts += 1
+            self.close_circuit(key_entry)
+            reactivated += 1
         
-        print("❌ Nenhuma chave disponível para rotação!")
-        return False
+        # Se a chave atual estava fora do rodízio, aproveita a chave recuperada
+        if reactivated and not self._is_key_available(self.get_current_key()):
+            self.rotate_key(reason="Chave reativada pela sondagem")
+        
+        return reactivated
     
-    def _is_key_available(self, key_entry):
-        """Verifica se uma chave está disponível para uso"""
-        if not key_entry['active']:
-            # Verifica se o bloqueio expirou
-            if key_entry['blocked_until']:
-                blocked_until = datetime.fromisoformat(key_entry['blocked_until'])
-                if datetime.now() > blocked_until:
-                    # Reativa a chave
-                    key_entry['active'] = True
-                    key_entry['error_count'] = 0
-                    key_entry['blocked_until'] = None
-                    print(f"✅ Chave '{key_entry['name']}' reativada!")
-                    return True
-            return False
-        return True
+    def _probe_loop(self):
+        """Laço da green-thread de sondagem"""
+        while True:
+            pausar(self.probe_interval)
+            try:
+                self.probe_due_keys()
+            except Exception as e:
+                print(f"❌ Erro na sondagem de chaves: {e}")
+    
+    def start_health_probes(self):
+        """Inicia (uma única vez) a sondagem das chaves em segundo plano"""
+        if self._probe_task is None:
+            self._probe_task = iniciar_em_segundo_plano(self._probe_loop)
+            print(f"🩺 Sondagem de chaves ativa (a cada {self.probe_interval}s)")
+        return self._probe_task
     
-    def handle_api_error(self, error):
+    def handle_api_error(self, error, key_entry=None):
         """
         Trata erros da API e decide se deve rotacionar
         
         Args:
             error: Exceção capturada
+            key_entry: Chave que falhou (padrão: a chave atual)
             
         Returns:
-            bool: True se rotacionou, False caso contrário
+            bool: True se há outra chave para tentar novamente, False caso contrário
         """
-        error_str = str(error).lower()
-        
-        # Erros que indicam limite atingido
-        quota_errors = [
-            'quota',
-            'rate limit',
-            'too many requests',
-            'resource exhausted',
-            '429',
-            'daily limit exceeded'
-        ]
-        
-        should_rotate = any(err in error_str for err in quota_errors)
-        
-        if should_rotate:
+        if is_quota_error(error):
             print(f"⚠️ Limite de API detectado: {error}")
-            return self.rotate_key(reason="Limite de API atingido")
+            if not self.keys_data['keys']:
+                return False
+            
+            current = self.get_current_key()
+            failed = key_entry or current
+            self.open_circuit(failed, reason="limite de API")
+            
+            if failed is current:
+                return self.rotate_key(reason="Limite de API atingido")
+            return self.has_available_key()
         else:
             print(f"❌ Erro não relacionado a quota: {error}")
             return False
@@ -176,7 +519,13 @@ class APIKeyManager:
         print("="*60)
         
         for i, key in enumerate(self.keys_data['keys']):
-            status = "🟢 ATIVA" if key['active'] else "🔴 BLOQUEADA"
+            state = key.get('circuit_state', CIRCUIT_CLOSED)
+            if state == CIRCUIT_CLOSED:
+                status = "🟢 ATIVA"
+            elif state == CIRCUIT_HALF_OPEN:
+                status = "🟡 EM SONDAGEM"
+            else:
+                status = "🔴 BLOQUEADA"
             current = " ← ATUAL" if i == self.current_key_index else ""
             
             print(f"\n{key['name']}{current}")
@@ -189,7 +538,7 @@ class APIKeyManager:
             
             if key['blocked_until']:
                 blocked_until = datetime.fromisoformat(key['blocked_until'])
-                print(f"  Bloqueada até: {blocked_until.strftime('%d/%m/%Y %H:%M:%S')}")
+                print(f"  Próxima sondagem: {blocked_until.strftime('%d/%m/%Y %H:%M:%S')}")
         
         print("\n" + "="*60)
     
@@ -197,10 +546,8 @@ class APIKeyManager:
         """Reseta os erros de uma chave específica"""
         for key in self.keys_data['keys']:
             if key['name'] == key_name:
-                key['error_count'] = 0
-                key['active'] = True
-                key['blocked_until'] = None
                 key['last_error'] = None
+                self.close_circuit(key)
                 self._save_keys(self.keys_data)
                 print(f"✅ Erros da chave '{key_name}' resetados!")
                 return True
@@ -213,9 +560,94 @@ class APIKeyManager:
 # EXEMPLO DE USO
 # ============================================
 
+def _call_model(key_manager, key_entry, prompt, model_name, results):
+    """Faz uma chamada e coloca (chave, texto, erro, latência) em results"""
+    started = time.monotonic()
+    try:
+        if key_entry is not None:
+            model = key_manager.model_for_key(key_entry, model_name)
+        else:
+            model = genai.GenerativeModel(model_name)
+        # Fora do hub: enquanto o Gemini responde, as outras requisições (e a fila de admissão) andam
+        text, error = executar_bloqueante(model.generate_content, prompt).text, None
+    except Exception as e:
+        text, error = None, e
+    results.put((key_entry, text, error, time.monotonic() - started))
+
+
+def _generate_hedged(key_manager, key_entry, prompt, model_name):
+    """
+    Uma tentativa de geração, com uma cópia em outra chave se ela demorar
+
+    Vale a primeira resposta bem-sucedida; a outra chamada é abandonada (o SDK
+    síncrono não permite interromper uma requisição em andamento, então o
+    resultado dela apenas é descartado). O tempo que ela já tinha levado entra
+    nas estatísticas como limite inferior (ver record_censored).
+
+    Raises:
+        Exception: Erro da chamada original quando nenhuma das chamadas teve sucesso
+    """
+    results = nova_fila()
+    key_manager.note_call()
+    delay = key_manager.hedge_delay() if key_entry is not None else None
+
+    # (chave, início) das chamadas ainda sem resultado
+    in_flight = []
+
+    if delay is None:
+        _call_model(key_manager, key_entry, prompt, model_name, results)
+        tasks = []
+        outcome = results.get()
+    else:
+        in_flight.append((key_entry, time.monotonic()))
+        tasks = [iniciar_em_segundo_plano(_call_model, key_manager, key_entry, prompt, model_name, results)]
+        try:
+            outcome = results.get(timeout=delay)
+        except queue.Empty:
+            hedge_key = key_manager.select_key(exclude=key_entry)
+            if hedge_key is not None and key_manager.reserve_hedge():
+                print(f"🐢 Chamada passou de {delay:.1f}s; cópia enviada na chave '{hedge_key['name']}'")
+                in_flight.append((hedge_key, time.monotonic()))
+                tasks.append(iniciar_em_segundo_plano(_call_model, key_manager, hedge_key, prompt, model_name, results))
+            outcome = results.get()
+
+    remaining = max(len(tasks), 1) - 1
+    primary_error = None
+    while True:
+        entry, text, error, latency = outcome
+        in_flight = [(other, started) for other, started in in_flight if other is not entry]
+        if entry is not None:
+            key_manager.record_result(entry, latency, error=error)
+
+        if error is None:
+            if entry is not key_entry:
+                key_manager.note_hedge_win()
+            # A perdedora levaria pelo menos o tempo que já passou
+            now = time.monotonic()
+            for other, started in in_flight:
+                if other is not None:
+                    key_manager.record_censored(other, now - started)
+            for task in tasks:
+                cancelar(task)
+            return text
+
+        if entry is key_entry:
+            primary_error = error
+        elif is_quota_error(error):
+            key_manager.open_circuit(entry, reason="limite de API (hedge)")
+
+        if remaining == 0:
+            raise primary_error or error
+        remaining -= 1
+        outcome = results.get()
+
+
 def generate_with_retry(key_manager, prompt, model_name="gemini-2.5-flash", max_retries=3):
     """
     Gera conteúdo com retry automático em caso de erro de quota
+
+    Com HEDGE_ATIVO=1, cada tentativa pode ganhar uma cópia em outra chave
+    quando demora mais que o percentil configurado (ver _generate_hedged).
     
     Args:
         key_manager: Instância do APIKeyManager
@@ -227,24 +659,29 @@ def generate_with_retry(key_manager, prompt, model_name="gemini-2.5-flash", max_
         str: Resposta gerada ou None em caso de falha total
     """
     for attempt in range(max_retries):
+        key_entry = None
+        if key_manager.keys_data['keys']:
+            key_entry = key_manager.select_key()
+            if key_entry is None:
+                # Todas as chaves estão com o circuito aberto: falha rápido em vez de insistir
+                print("❌ Nenhuma chave disponível (todos os circuitos abertos)")
+                return None
+        
         try:
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(prompt)
-            return response.text
+            return _generate_hedged(key_manager, key_entry, prompt, model_name)
         
         except Exception as e:
             print(f"\n🔴 Tentativa {attempt + 1}/{max_retries} falhou")
             
-            # Tenta rotacionar a chave
-            if key_manager.handle_api_error(e):
+            # Tenta novamente com outra chave
+            if key_manager.handle_api_error(e, key_entry):
                 print("🔄 Tentando novamente com nova chave...")
                 continue
             else:
                 # Erro não relacionado a quota
                 if attempt < max_retries - 1:
                     print("⏳ Aguardando antes de tentar novamente...")
-                    import time
-                    time.sleep(2)
+                    pausar(2)
                 else:
                     print("❌ Todas as tentativas falharam!")
                     raise
@@ -1,26 +1,49 @@
 from flask import Flask, session, jsonify, request
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 import google.generativeai as genai
 from dotenv import load_dotenv
 import os
+import time
+import atexit
 from uuid import uuid4
 from datetime import timedelta
 
 # --- IMPORTAÇÃO DO GERENCIADOR DE CHAVES ---
 from api_key_manager import APIKeyManager, generate_with_retry
+from usage_ledger import UsageLedger
+from chat_store import ChatStore
+from chat_context import ChatContext
+from chat_worker import ChatDispatcher
+from tarefas import iterar_bloqueante, iniciar_em_segundo_plano, executar_bloqueante
+from socket_queue import SQLiteManager
+from prompt_cache import PromptCache
+from cache import TTLCache
+from analytics import AnalyticsETL
+from ranking import Ranking
+from limitador import Limitador
+from admissao import Admissao
+from jobs import FilaDeJobs
+from pregeracao import PreGeracao
 
 # --- Importar Config e Blueprints ---
-from config import conn, cursor
+from config import init_app as init_db_app, get_db, pool as db_pool
+from migrations import migrar
 from auth_routes import auth_bp
 from freemium_routes import freemium_bp
-from premium_routes import premium_bp
+from premium_routes import premium_bp, gerar_conteudo, gerar_texto, tema_recusado
 from admin_routes import admin_bp
 from quiz_routes import quiz_bp
 
 # --- Configurações Iniciais ---
 load_dotenv()
 app = Flask(__name__, static_folder='static', static_url_path='/static')
+init_db_app(app)  # Devolve ao pool a conexão SQLite de cada requisição
+
+# Aplica as migrações pendentes do schema (não apaga dados)
+with db_pool.conexao() as conn_migracao:
+    if conn_migracao:
+        migrar(conn_migracao)
 
 # ============================================================
 # 🔥 CORREÇÃO CRÍTICA: CONFIGURAÇÃO DE SESSÃO PARA O RENDER
@@ -76,19 +99,42 @@ CORS(app,
      origins=ALLOWED_ORIGINS,
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
      allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
-     expose_headers=["Content-Type", "Authorization", "Set-Cookie"],
+     expose_headers=["Content-Type", "Authorization", "Set-Cookie", "Retry-After", "X-Next-Cursor"],
      max_age=3600
 )
 
+# --- Limite de requisições por aluno/IP (429 + Retry-After antes de chegar às rotas) ---
+limitador = Limitador(confiar_proxy=IS_PRODUCTION)
+limitador.init_app(app)
+
 # ============================================================
 # SOCKETIO
 # ============================================================
 
+# Com vários workers/nós, os eventos passam por uma fila compartilhada:
+#   SOCKETIO_MESSAGE_QUEUE=redis://...            (produção com Redis)
+#   SOCKETIO_MESSAGE_QUEUE=sqlite:///arquivo.db   (substituto local, mesma máquina)
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+CHAT_COMPARTILHADO = bool(SOCKETIO_MESSAGE_QUEUE)
+
+socketio_options = {}
+if SOCKETIO_MESSAGE_QUEUE:
+    if SOCKETIO_MESSAGE_QUEUE.startswith('sqlite://'):
+        socketio_options['client_manager'] = SQLiteManager(SOCKETIO_MESSAGE_QUEUE, channel='repensei')
+    else:
+        socketio_options['message_queue'] = SOCKETIO_MESSAGE_QUEUE
+
+# Sem sticky sessions no balanceador, o long-polling quebra entre workers;
+# SOCKETIO_TRANSPORTS=websocket dispensa a afinidade de sessão
+if os.getenv('SOCKETIO_TRANSPORTS'):
+    socketio_options['transports'] = os.getenv('SOCKETIO_TRANSPORTS').split(',')
+
 socketio = SocketIO(app, 
                     cors_allowed_origins=ALLOWED_ORIGINS,
                     ping_timeout=60,
                     ping_interval=25,
-                    async_mode='eventlet')
+                    async_mode='eventlet',
+                    **socketio_options)
 
 # --- INICIALIZA O GERENCIADOR DE CHAVES ---
 print("\n🔐 Inicializando Gerenciador de Chaves API...")
@@ -98,11 +144,43 @@ if not key_manager.keys_data.get('keys'):
     print("\n⚠️ Nenhuma chave configurada!")
 else:
     key_manager.get_status()
+    key_manager.start_health_probes()
 
 # --- Configuração Google GenAI ---
 MODEL_NAME = "gemini-2.5-flash"
 app.config['KEY_MANAGER'] = key_manager
 
+# --- Controle de admissão das chamadas ao Gemini (rotas Premium e chat) ---
+admissao_gemini = Admissao()
+app.config['ADMISSAO_GEMINI'] = admissao_gemini
+
+# --- Ledger de uso Premium (limites diários por aluno) ---
+# Com mais de um worker, cada reserva é conferida no banco (limite por aluno, não por processo)
+usage_ledger = UsageLedger(compartilhado=CHAT_COMPARTILHADO or int(os.getenv('WEB_CONCURRENCY', 1)) > 1)
+usage_ledger.iniciar_flush_periodico()
+atexit.register(usage_ledger.flush)
+app.config['USAGE_LEDGER'] = usage_ledger
+
+# --- Cache das estatísticas do dashboard (TTL + stale-while-revalidate) ---
+stats_cache = TTLCache(
+    ttl=int(os.getenv('ADMIN_STATS_TTL', 30)),
+    idade_maxima=int(os.getenv('ADMIN_STATS_IDADE_MAXIMA', 300))
+)
+app.config['STATS_CACHE'] = stats_cache
+
+# --- Cache de plano/existência dos alunos (descartado a cada escrita no aluno) ---
+# Sem stale-while-revalidate: um plano rebaixado não pode continuar sendo servido
+PLANOS_CACHE_TTL = int(os.getenv('PLANOS_CACHE_TTL', 60))
+# Ids inexistentes não são guardados (qualquer cliente pode enviar ids arbitrários)
+planos_cache = TTLCache(ttl=PLANOS_CACHE_TTL, idade_maxima=PLANOS_CACHE_TTL,
+                        max_entradas=int(os.getenv('PLANOS_CACHE_MAX', 10000)), guardar_none=False)
+app.config['PLANOS_CACHE'] = planos_cache
+
+# --- Base de análise separada (ETL incremental periódico) ---
+analytics = AnalyticsETL()
+analytics.iniciar_periodico()
+app.config['ANALYTICS'] = analytics
+
 # --- Registrar Blueprints ---
 app.register_blueprint(auth_bp)
 app.register_blueprint(freemium_bp)
@@ -135,11 +213,27 @@ def login_page():
 @app.route('/health')
 def health_check():
     """Health check para monitoramento"""
+    try:
+        get_db().execute('SELECT 1')
+        banco = 'connected'
+    except Exception:
+        banco = 'disconnected'
+
     return jsonify({
         'status': 'healthy',
         'environment': 'production' if IS_PRODUCTION else 'development',
-        'database': 'connected' if conn else 'disconnected',
+        'database': banco,
+        'db_pool': db_pool.estatisticas(),
         'keys_configured': len(key_manager.keys_data.get('keys', [])),
+        'chat_sessions': chat_store.estatisticas(),
+        'chat_workers': chat_dispatcher.estatisticas(),
+        'admissao_gemini': admissao_gemini.estatisticas(),
+        'jobs_geracao': jobs.estatisticas(),
+        'pregeracao': pregeracao.estatisticas(),
+        'stats_cache': stats_cache.estatisticas(),
+        'planos_cache': planos_cache.estatisticas(),
+        'ranking': ranking.estatisticas(),
+        'rate_limit': limitador.estatisticas(),
         'session_config': {
             'samesite': app.config['SESSION_COOKIE_SAMESITE'],
             'secure': app.config['SESSION_COOKIE_SECURE'],
@@ -168,10 +262,22 @@ def session_test():
 @app.route('/api/keys/status', methods=['GET'])
 def api_keys_status():
     key_manager.get_status()
+    key_stats = key_manager.get_key_stats()
     status_data = {
         "total_keys": len(key_manager.keys_data['keys']),
         "current_key": key_manager.keys_data['keys'][key_manager.current_key_index]['name'],
-        "keys": [{"name": k['name'], "active": k['active'], "error_count": k['error_count']} for k in key_manager.keys_data['keys']]
+        "keys": [
+            {
+                "name": k['name'],
+                "active": k['active'],
+                "error_count": k['error_count'],
+                "circuit_state": k.get('circuit_state'),
+                "next_probe": k.get('blocked_until'),
+                "stats": key_stats.get(k['name'])
+            }
+            for k in key_manager.keys_data['keys']
+        ],
+        "hedge": key_manager.get_hedge_stats()
     }
     return jsonify(status_data), 200
 
@@ -223,48 +329,173 @@ SEU OBJETIVO: Não entregar respostas, mas "parir" ideias. Você deve desafiar a
 
 RESUMO OPERACIONAL: Mantenha o usuário pensando. Mantenha o foco em Humanidades. Bloqueie desvios técnicos ou inapropriados."""
 
-active_chats = {}
+MENSAGEM_INICIAL = "Olá! Estou aqui para bater um papo sobre filosofia e sociologia. Sobre o que você gostaria de conversar hoje?"
+
+# As instruções fixas ficam no Context Cache do Gemini (fallback: system_instruction)
+prompt_cache = PromptCache(MODEL_NAME, instrucoes, key_manager)
+
+def criar_modelo_tutor():
+    """Modelo do tutor: as instruções vão pelo cache/system instruction, não como turno"""
+    return prompt_cache.obter_modelo()
+
+def criar_modelo_resumo():
+    return genai.GenerativeModel(MODEL_NAME)
+
+def criar_chat(historico=None):
+    """Cria o contexto do chat, reaproveitando a transcrição salva se houver"""
+    try:
+        return ChatContext(
+            criar_modelo_tutor,
+            criar_modelo_resumo,
+            estado=historico,
+            mensagem_inicial=MENSAGEM_INICIAL,
+            registrar_uso=prompt_cache.registrar_uso
+        )
+    except Exception as e:
+        print(f"❌ Erro ao iniciar chat da IA: {e}")
+        return None
+
+def serializar_chat(chat_context):
+    """Estado gravado do chat (None enquanto a conversa não começou)"""
+    if not (chat_context.turnos or chat_context.resumo):
+        return None
+    return chat_context.to_dict()
+
+chat_store = ChatStore(criar_chat, serializar_chat, compartilhado=CHAT_COMPARTILHADO)
+chat_store.iniciar_varredura()
+atexit.register(chat_store.persistir_todas)
+
+@app.route('/api/chat/cache', methods=['GET'])
+def chat_cache_status():
+    """Métricas do cache do prompt do tutor (tokens economizados / reenviados por turno)"""
+    return jsonify(prompt_cache.metricas()), 200
+
+def sala_da_sessao(session_id):
+    """Sala com todos os sockets da sessão, em qualquer worker"""
+    return f"sessao_{session_id}"
+
+def sala_do_aluno(id_aluno):
+    """Sala com todos os sockets de um aluno logado (avisos de ranking)"""
+    return f"aluno_{id_aluno}"
 
 def get_user_chat():
     if 'session_id' not in session:
         session['session_id'] = str(uuid4())
     session_id = session['session_id']
 
-    if session_id not in active_chats:
-        try:
-            model = genai.GenerativeModel(MODEL_NAME)
-            chat_session = model.start_chat(history=[
-                {"role": "user", "parts": [{"text": instrucoes}]},
-                {"role": "model", "parts": [{"text": "Olá! Estou aqui para bater um papo sobre filosofia e sociologia. Sobre o que você gostaria de conversar hoje?"}]}
-            ])
-            active_chats[session_id] = chat_session
-            print(f"✅ Novo chat iniciado para sessão: {session_id}")
-        except Exception as e:
-            print(f"❌ Erro ao iniciar chat da IA para sessão {session_id}: {e}")
-            return None
-
-    return active_chats.get(session_id)
+    user_chat = chat_store.obter(session_id)
+    if user_chat is None:
+        print(f"❌ Erro ao iniciar chat da IA para sessão {session_id}")
+    return user_chat
 
 @socketio.on('connect')
 def handle_connect():
     print(f"🔌 Cliente conectado: {request.sid}")
     if 'session_id' not in session:
         session['session_id'] = str(uuid4())
+    # As respostas são emitidas para a sala da sessão: chegam ao aluno mesmo
+    # que ele reconecte em outro worker no meio da geração
+    join_room(sala_da_sessao(session['session_id']))
+    if 'id_aluno' in session:
+        join_room(sala_do_aluno(session['id_aluno']))
     
     user_chat = get_user_chat()
     if user_chat:
-        welcome_message = "Olá! Vamos debater filosofia ou sociologia?"
-        # Tenta pegar a última mensagem do modelo se existir
-        if user_chat.history and len(user_chat.history) > 0:
-             last_msg = user_chat.history[-1]
-             if last_msg.role == 'model':
-                 welcome_message = last_msg.parts[0].text
+        # Retoma a partir da última fala do tutor, se existir
+        welcome_message = user_chat.ultima_resposta()
 
         emit('nova_mensagem', {"remetente": "bot", "texto": welcome_message})
         emit('status_conexao', {'data': 'Conectado com sucesso!'})
     else:
         emit('erro', {'erro': 'Não foi possível iniciar o assistente de IA.'})
 
+def processar_mensagem(session_id, destino, mensagem_usuario):
+    """Gera a resposta do tutor fora do hub do eventlet e a emite para a sala da sessão"""
+    user_chat = chat_store.obter(session_id)
+    if not user_chat:
+        socketio.emit('erro', {'erro': 'Sessão perdida. Recarregue a página.'}, to=destino)
+        return
+
+    # Mesma escolha das rotas Premium: chave de menor latência esperada com o circuito fechado
+    chave = key_manager.select_key() if key_manager.keys_data['keys'] else None
+    if key_manager.keys_data['keys'] and chave is None:
+        socketio.emit('erro', {'erro': 'Assistente indisponível no momento. Tente novamente em alguns minutos.'}, to=destino)
+        return
+
+    # Fixada até o fim do stream: os limites de memória não a removem no meio da troca
+    chat_store.fixar(session_id)
+    id_resposta = str(uuid4())
+    inicio = time.monotonic()
+    partes = []
+    try:
+        modelo = prompt_cache.obter_modelo(chave)
+        # Cada trecho vai para o cliente assim que chega do Gemini; a espera
+        # acontece em uma thread do pool, não no hub
+        for trecho in iterar_bloqueante(user_chat.enviar_stream(mensagem_usuario, modelo)):
+            partes.append(trecho)
+            socketio.emit('nova_mensagem_parcial', {"remetente": "bot", "texto": trecho, "id_resposta": id_resposta}, to=destino)
+        if chave:
+            key_manager.record_result(chave, time.monotonic() - inicio)
+        chat_store.atualizar(session_id, user_chat)
+        # Evento final: a troca já está no histórico; o texto completo substitui os parciais
+        socketio.emit('nova_mensagem', {"remetente": "bot", "texto": "".join(partes), "id_resposta": id_resposta, "final": True}, to=destino)
+        # Tokens e resumo só depois do evento final, sem atrasar a resposta
+        iniciar_em_segundo_plano(concluir_troca, session_id, user_chat)
+    except Exception as e:
+        print(f"❌ Erro GenAI: {e}")
+        if chave:
+            key_manager.record_result(chave, time.monotonic() - inicio, error=e)
+        if key_manager.handle_api_error(e, chave):
+             socketio.emit('erro', {'erro': 'Limite atingido, trocando chave... Tente novamente em alguns segundos.', 'id_resposta': id_resposta}, to=destino)
+        else:
+             socketio.emit('erro', {'erro': 'Erro ao processar mensagem.', 'id_resposta': id_resposta}, to=destino)
+    finally:
+        chat_store.liberar(session_id)
+
+def concluir_troca(session_id, user_chat):
+    try:
+        if executar_bloqueante(user_chat.concluir_troca):
+            chat_store.atualizar(session_id, user_chat)
+    except Exception as e:
+        print(f"⚠️ Falha ao concluir troca da sessão {session_id}: {e}")
+
+def avisar_mensagem_enfileirada(destino, pendentes):
+    socketio.emit('mensagem_enfileirada', {'pendentes': pendentes}, to=destino)
+
+def avisar_posicao_na_fila(destino, posicao):
+    socketio.emit('aguardando_vaga', {'posicao': posicao}, to=destino)
+
+def avisar_sobrecarga(destino, erro):
+    socketio.emit('erro', {'erro': f'Servidor ocupado. Tente novamente em {erro.retry_after}s.', 'retry_after': erro.retry_after}, to=destino)
+
+chat_dispatcher = ChatDispatcher(
+    processar_mensagem,
+    ao_enfileirar=avisar_mensagem_enfileirada,
+    admissao=admissao_gemini,
+    ao_aguardar_vaga=avisar_posicao_na_fila,
+    ao_recusar=avisar_sobrecarga
+)
+
+def avisar_ranking(id_aluno, dados):
+    socketio.emit('ranking_atualizado', dados, to=sala_do_aluno(id_aluno))
+
+# --- Ranking semanal (posições em memória, avisos por socket) ---
+ranking = Ranking(ao_mudar=avisar_ranking)
+app.config['RANKING'] = ranking
+
+def avisar_job_concluido(id_aluno, dados):
+    socketio.emit('job_concluido', dados, to=sala_do_aluno(id_aluno))
+
+# --- Jobs de geração Premium (modo assíncrono, pool limitado por prioridade) ---
+jobs = FilaDeJobs(gerar_conteudo, admissao=admissao_gemini, ao_concluir=avisar_job_concluido)
+jobs.init_app(app)
+jobs.iniciar()
+
+# --- Pré-geração dos temas populares/do currículo (horas tranquilas, com folga de quota) ---
+pregeracao = PreGeracao(gerar_texto, tema_recusado, key_manager=key_manager, admissao=admissao_gemini)
+pregeracao.init_app(app)
+pregeracao.iniciar()
+
 @socketio.on('enviar_mensagem')
 def handle_enviar_mensagem(data):
     mensagem_usuario = data.get("mensagem")
@@ -273,20 +504,18 @@ def handle_enviar_mensagem(data):
     if not mensagem_usuario:
         return
 
-    user_chat = get_user_chat()
-    if not user_chat:
+    if 'session_id' not in session:
         emit('erro', {'erro': 'Sessão perdida. Recarregue a página.'})
         return
 
-    try:
-        resposta = user_chat.send_message(mensagem_usuario)
-        emit('nova_mensagem', {"remetente": "bot", "texto": resposta.text})
-    except Exception as e:
-        print(f"❌ Erro GenAI: {e}")
-        if key_manager.handle_api_error(e):
-             emit('erro', {'erro': 'Limite atingido, trocando chave... Tente novamente em alguns segundos.'})
-        else:
-             emit('erro', {'erro': 'Erro ao processar mensagem.'})
+    espera = limitador.verificar('socket.enviar_mensagem', limitador.identidade())
+    if espera:
+        emit('erro', {'erro': f'Muitas mensagens seguidas. Aguarde {espera}s para enviar outra.', 'retry_after': espera})
+        return
+
+    # Não espera o Gemini aqui: o handler libera o worker imediatamente
+    session_id = session['session_id']
+    chat_dispatcher.enviar(session_id, sala_da_sessao(session_id), mensagem_usuario)
 
 @socketio.on('disconnect')
 def handle_disconnect():
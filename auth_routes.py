@@ -1,5 +1,7 @@
 from flask import Blueprint, request, jsonify, session, make_response
-from config import conn, cursor
+from config import get_db
+from utils import invalidar_estatisticas, invalidar_plano
+from senhas import hash_fora_do_hub, verificar_fora_do_hub
 import sqlite3
 import re
 
@@ -26,7 +28,8 @@ def validar_email(email):
 
 def email_ja_existe(email):
     try:
-        cursor.execute('SELECT id_aluno FROM Aluno WHERE email = ?', (email.lower(),))
+        cursor = get_db().cursor()
+        cursor.execute('SELECT id_aluno FROM Aluno WHERE LOWER(email) = ?', (email.lower(),))
         return cursor.fetchone() is not None
     except Exception as e:
         print(f"Erro ao verificar e-mail: {e}")
@@ -93,6 +96,27 @@ def validar_nome(nome):
 # ROTA DE LOGIN - CORRIGIDA
 # ===================================================================
 
+SQL_IDENTIDADE_LOGIN = '''
+SELECT 'aluno' AS papel, id_aluno AS id, nome, email, plano, url_foto, senha FROM Aluno WHERE LOWER(email) = ?
+UNION ALL
+SELECT 'admin', id_admin, nome, email, NULL, NULL, senha FROM Admin WHERE LOWER(email) = ?
+'''
+
+def atualizar_hash_senha(conn, identidade, senha):
+    """Troca a senha antiga (texto puro ou custo anterior) pelo hash atual, após um login válido"""
+    tabela, coluna = ('Aluno', 'id_aluno') if identidade['papel'] == 'aluno' else ('Admin', 'id_admin')
+    try:
+        # Só troca se ninguém alterou a senha entre a leitura e agora
+        conn.execute(
+            f'UPDATE {tabela} SET senha = ? WHERE {coluna} = ? AND senha = ?',
+            (hash_fora_do_hub(senha), identidade['id'], identidade['senha'])
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        # O login continua valendo; a troca é tentada de novo no próximo
+        print(f"⚠️ Falha ao atualizar hash da senha: {e}")
+        conn.rollback()
+
 @auth_bp.route('/login', methods=['POST'])
 def login():
     # Limpar sessão ANTES de processar
@@ -105,14 +129,42 @@ def login():
     if not email or not senha:
         return jsonify({'error': 'Email e senha são obrigatórios.'}), 400
 
-    if not cursor:
+    conn = get_db()
+    if not conn:
         return jsonify({'error': 'Erro de conexão com o banco de dados.'}), 500
+    cursor = conn.cursor()
 
     email = email.strip().lower()
 
-    # Tentar login como ALUNO primeiro (mais comum)
-    cursor.execute('SELECT id_aluno, nome, email, plano, url_foto FROM Aluno WHERE email = ? AND senha = ?', (email, senha))
-    aluno = cursor.fetchone()
+    # Uma única busca pelo e-mail (índices em LOWER(email)) cobre aluno e admin;
+    # aluno vem primeiro, como antes
+    cursor.execute(SQL_IDENTIDADE_LOGIN, (email, email))
+    candidatos = cursor.fetchall()
+    identidade = None
+    for candidato in candidatos:
+        # scrypt é lento de propósito: roda no pool de threads, fora do hub
+        ok, precisa_rehash = verificar_fora_do_hub(senha, candidato['senha'])
+        if ok:
+            identidade = candidato
+            if precisa_rehash:
+                atualizar_hash_senha(conn, candidato, senha)
+            break
+    if not candidatos:
+        # Mesmo tempo de resposta para e-mail inexistente
+        verificar_fora_do_hub(senha, None)
+
+    aluno = None
+    admin = None
+    if identidade and identidade['papel'] == 'aluno':
+        aluno = {
+            'id_aluno': identidade['id'],
+            'nome': identidade['nome'],
+            'email': identidade['email'],
+            'plano': identidade['plano'],
+            'url_foto': identidade['url_foto']
+        }
+    elif identidade:
+        admin = {'id_admin': identidade['id'], 'nome': identidade['nome'], 'email': identidade['email']}
 
     if aluno:
         # Login de aluno bem-sucedido
@@ -139,10 +191,6 @@ def login():
         
         return response, 200
 
-    # Se não for aluno, tenta admin
-    cursor.execute('SELECT id_admin, nome, email FROM Admin WHERE email = ? AND senha = ?', (email, senha))
-    admin = cursor.fetchone()
-    
     if admin:
         session['admin_id'] = admin['id_admin']
         session['admin_nome'] = admin['nome']
@@ -230,15 +278,19 @@ def cadastrar_usuario():
             'detalhes': erros_senha
         }), 400
 
-    if not cursor:
+    conn = get_db()
+    if not conn:
         return jsonify({'error': 'Erro de conexão com o banco de dados.'}), 500
+    cursor = conn.cursor()
 
     try:
         cursor.execute(
             'INSERT INTO Aluno (nome, email, senha) VALUES (?, ?, ?)', 
-            (nome_formatado, email, senha)
+            (nome_formatado, email, hash_fora_do_hub(senha))
         )
         conn.commit()
+        invalidar_estatisticas()
+        invalidar_plano(cursor.lastrowid)
         return jsonify({
             'message': 'Usuário cadastrado com sucesso.',
             'nome': nome_formatado
@@ -260,8 +312,10 @@ def editar_usuario(id_aluno):
     url_foto = data.get('url_foto')
     plano = data.get('plano')
 
-    if not cursor:
+    conn = get_db()
+    if not conn:
         return jsonify({'error': 'Erro de conexão com o banco de dados.'}), 500
+    cursor = conn.cursor()
 
     campos = []
     valores = []
@@ -281,7 +335,7 @@ def editar_usuario(id_aluno):
         email = email.strip().lower()
         
         cursor.execute(
-            'SELECT id_aluno FROM Aluno WHERE email = ? AND id_aluno != ?', 
+            'SELECT id_aluno FROM Aluno WHERE LOWER(email) = ? AND id_aluno != ?', 
             (email, id_aluno)
         )
         if cursor.fetchone():
@@ -298,7 +352,7 @@ def editar_usuario(id_aluno):
                 'detalhes': erros_senha
             }), 400
         campos.append("senha=?")
-        valores.append(senha)
+        valores.append(hash_fora_do_hub(senha))
     
     if url_foto is not None:
         campos.append("url_foto=?")
@@ -319,6 +373,8 @@ def editar_usuario(id_aluno):
     try:
         cursor.execute(query, tuple(valores))
         conn.commit()
+        invalidar_estatisticas()
+        invalidar_plano(id_aluno)
 
         if cursor.rowcount == 0:
             return jsonify({'error': 'Usuário não encontrado.'}), 404
@@ -337,11 +393,15 @@ def editar_usuario(id_aluno):
 
 @auth_bp.route('/excluir_usuario/<int:id_aluno>', methods=['DELETE'])
 def excluir_usuario(id_aluno):
-    if not cursor:
+    conn = get_db()
+    if not conn:
         return jsonify({'error': 'Erro de conexão com o banco de dados.'}), 500
+    cursor = conn.cursor()
         
     cursor.execute('DELETE FROM Aluno WHERE id_aluno=?', (id_aluno,))
     conn.commit()
+    invalidar_estatisticas()
+    invalidar_plano(id_aluno)
     if cursor.rowcount == 0:
         return jsonify({'error': 'Usuário não encontrado.'}), 404
     return jsonify({'message': 'Usuário excluído com sucesso.'})
@@ -349,8 +409,10 @@ def excluir_usuario(id_aluno):
 
 @auth_bp.route('/usuarios', methods=['GET'])
 def listar_usuarios():
-    if not cursor:
+    conn = get_db()
+    if not conn:
         return jsonify({'error': 'Erro de conexão com o banco de dados.'}), 500
+    cursor = conn.cursor()
         
     cursor.execute('SELECT id_aluno, nome, email, url_foto, plano FROM Aluno')
     usuarios = cursor.fetchall()
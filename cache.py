@@ -0,0 +1,125 @@
+"""
+Cache em memória com TTL e stale-while-revalidate
+Dentro do TTL o valor é servido direto; depois dele (até idade_maxima) o valor
+antigo continua sendo servido enquanto uma única atualização roda em segundo plano.
+O número de chaves é limitado: acima do máximo sai a usada há mais tempo (LRU)
+"""
+from collections import OrderedDict
+import os
+import time
+
+from tarefas import iniciar_em_segundo_plano
+
+
+class TTLCache:
+    def __init__(self, ttl=None, idade_maxima=None, max_entradas=None, guardar_none=True):
+        """
+        Inicializa o cache
+
+        Args:
+            ttl: Segundos em que um valor é considerado fresco
+            idade_maxima: Segundos até um valor vencido deixar de ser servido
+                enquanto é recalculado (acima disso o cálculo é síncrono)
+            max_entradas: Máximo de chaves guardadas
+            guardar_none: False para não guardar resultados None (ex.: id inexistente),
+                que qualquer cliente poderia gerar em quantidade
+        """
+        self.ttl = ttl or int(os.getenv('CACHE_TTL', 30))
+        self.idade_maxima = idade_maxima or int(os.getenv('CACHE_IDADE_MAXIMA', 300))
+        self.max_entradas = max_entradas or int(os.getenv('CACHE_MAX_ENTRADAS', 10000))
+        self.guardar_none = guardar_none
+
+        # chave -> {'valor', 'calculado_em', 'vence_em'}, da usada há mais tempo para a mais recente
+        self._entradas = OrderedDict()
+        self._atualizando = set()
+        self._acertos = 0
+        self._acertos_vencidos = 0
+        self._calculos = 0
+
+    def obter(self, chave, calcular):
+        """
+        Retorna o valor da chave, calculando-o com calcular() quando necessário
+
+        Raises:
+            Exception: Erros de calcular() quando não há valor utilizável em cache
+        """
+        agora = time.monotonic()
+        entrada = self._entradas.get(chave)
+
+        if entrada is not None:
+            self._entradas.move_to_end(chave)
+            if agora < entrada['vence_em']:
+                self._acertos += 1
+                return entrada['valor']
+
+            if agora - entrada['calculado_em'] < self.idade_maxima:
+                # Vencido, mas ainda aceitável: serve e atualiza em segundo plano
+                self._acertos_vencidos += 1
+                if chave not in self._atualizando:
+                    self._atualizando.add(chave)
+                    iniciar_em_segundo_plano(self._atualizar, chave, calcular)
+                return entrada['valor']
+
+            # Velho demais para ser servido: não fica ocupando espaço se o cálculo falhar
+            del self._entradas[chave]
+
+        return self._calcular(chave, calcular)
+
+    def _calcular(self, chave, calcular):
+        valor = calcular()
+        self._calculos += 1
+        if valor is None and not self.guardar_none:
+            self._entradas.pop(chave, None)
+            return valor
+
+        agora = time.monotonic()
+        self._entradas[chave] = {'valor': valor, 'calculado_em': agora, 'vence_em': agora + self.ttl}
+        self._entradas.move_to_end(chave)
+        self._descartar_excesso(agora)
+        return valor
+
+    def _descartar_excesso(self, agora):
+        """Remove as menos usadas acima do limite e, do início da fila, as velhas demais para servir"""
+        while self._entradas:
+            chave, entrada = next(iter(self._entradas.items()))
+            if len(self._entradas) <= self.max_entradas and agora - entrada['calculado_em'] < self.idade_maxima:
+                break
+            del self._entradas[chave]
+
+    def _atualizar(self, chave, calcular):
+        try:
+            self._calcular(chave, calcular)
+        except Exception as e:
+            # Mantém o valor antigo; a próxima leitura tenta de novo
+            print(f"⚠️ Falha ao atualizar cache '{chave}': {e}")
+        finally:
+            self._atualizando.discard(chave)
+
+    def invalidar(self, chave):
+        """
+        Marca o valor como vencido após uma escrita relevante
+
+        A próxima leitura ainda recebe o valor antigo e dispara o recálculo, de
+        modo que uma rajada de escritas custa um único cálculo por leitura.
+        """
+        entrada = self._entradas.get(chave)
+        if entrada is not None:
+            entrada['vence_em'] = 0
+
+    def remover(self, chave):
+        """Descarta o valor: a próxima leitura recalcula de forma síncrona (nunca serve o antigo)"""
+        self._entradas.pop(chave, None)
+
+    def limpar(self):
+        self._entradas.clear()
+
+    def estatisticas(self):
+        return {
+            'chaves': len(self._entradas),
+            'max_entradas': self.max_entradas,
+            'acertos': self._acertos,
+            'acertos_vencidos': self._acertos_vencidos,
+            'calculos': self._calculos,
+            'ttl': self.ttl,
+            'idade_maxima': self.idade_maxima
+        }
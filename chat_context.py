@@ -0,0 +1,225 @@
+"""
+Contexto do chatbot socrático com janela deslizante
+Envia ao modelo apenas as últimas trocas literais e um resumo acumulado das
+anteriores, mantendo o tamanho de cada requisição limitado. O resumo e a contagem
+de tokens rodam depois da resposta (concluir_troca), fora do caminho do aluno
+"""
+import os
+
+from tarefas import novo_lock_de_thread
+
+PROMPT_RESUMO = """Você mantém o resumo de um debate entre um aluno e um tutor socrático de Filosofia e Sociologia.
+
+Resumo atual:
+{resumo}
+
+Novas trocas a incorporar:
+{trocas}
+
+Reescreva o resumo em até {limite} palavras, em português, preservando: os temas discutidos, as posições
+defendidas pelo aluno, as contradições apontadas pelo tutor e as perguntas que ficaram em aberto.
+Responda apenas com o resumo."""
+
+
+def _texto(conteudo):
+    return "".join(parte.get('text', '') for parte in conteudo.get('parts', []))
+
+
+def _turno(role, texto):
+    return {"role": role, "parts": [{"text": texto}]}
+
+
+class ChatContext:
+    def __init__(self, criar_modelo, criar_modelo_resumo, estado=None, janela=None, intervalo_resumo=None,
+                 mensagem_inicial=None, registrar_uso=None):
+        """
+        Inicializa o contexto de uma sessão
+
+        Args:
+            criar_modelo: Função que devolve o GenerativeModel do tutor (com system_instruction)
+            criar_modelo_resumo: Função que devolve o modelo usado para resumir
+            estado: Estado serializado por to_dict (ou lista de turnos de transcrições antigas)
+            janela: Quantidade de trocas (aluno + tutor) enviadas literalmente
+            intervalo_resumo: Trocas acumuladas fora da janela antes de atualizar o resumo
+            mensagem_inicial: Saudação exibida quando ainda não há conversa
+            registrar_uso: Função chamada com o usage_metadata de cada resposta do tutor
+        """
+        self.criar_modelo = criar_modelo
+        self.criar_modelo_resumo = criar_modelo_resumo
+        self.janela = janela or int(os.getenv('CHAT_JANELA_TROCAS', 6))
+        self.intervalo_resumo = intervalo_resumo or int(os.getenv('CHAT_INTERVALO_RESUMO', 4))
+        self.limite_resumo = int(os.getenv('CHAT_RESUMO_PALAVRAS', 250))
+        # Falhas seguidas do resumo antes de descartar as trocas pendentes mais antigas
+        self.max_falhas_resumo = int(os.getenv('CHAT_MAX_FALHAS_RESUMO', 3))
+        self.mensagem_inicial = mensagem_inicial
+        self.registrar_uso = registrar_uso
+
+        self.resumo = ""
+        self.turnos = []            # Trocas mais recentes, enviadas literalmente
+        self.fora_da_janela = []    # Trocas antigas aguardando entrar no resumo
+        self._falhas_resumo = 0
+        self._resumindo = False
+        self._uso_pendente = None
+        # O resumo roda em uma thread do tpool enquanto o stream da próxima mensagem
+        # (outra thread) pode deslizar a janela: as listas só mudam com o lock
+        self._lock = novo_lock_de_thread()
+
+        if isinstance(estado, list):
+            # Transcrição no formato antigo (lista de turnos)
+            self.turnos = list(estado)
+            self._deslizar_janela()
+        elif estado:
+            self.resumo = estado.get('resumo', "")
+            self.turnos = estado.get('turnos', [])
+            self.fora_da_janela = estado.get('fora_da_janela', [])
+
+    # ============================================
+    # MONTAGEM DO PAYLOAD
+    # ============================================
+
+    def montar_conteudo(self, mensagem):
+        """Conteúdo enviado ao modelo: resumo + trocas fora da janela ainda não resumidas + janela + nova mensagem"""
+        conteudo = []
+        if self.resumo:
+            conteudo.append(_turno("user", f"[Resumo da conversa até aqui]\n{self.resumo}"))
+            conteudo.append(_turno("model", "Certo, vou continuar o debate a partir desse ponto."))
+        with self._lock:
+            conteudo.extend(self.fora_da_janela)
+            conteudo.extend(self.turnos)
+        conteudo.append(_turno("user", mensagem))
+        return conteudo
+
+    def registrar_troca(self, mensagem, resposta):
+        """Adiciona a troca ao histórico e desliza a janela (o resumo fica para concluir_troca)"""
+        with self._lock:
+            self.turnos.append(_turno("user", mensagem))
+            self.turnos.append(_turno("model", resposta))
+        self._deslizar_janela()
+
+    def precisa_resumo(self):
+        return len(self.fora_da_janela) >= 2 * self.intervalo_resumo
+
+    def _deslizar_janela(self):
+        with self._lock:
+            excesso = len(self.turnos) - 2 * self.janela
+            if excesso > 0:
+                self.fora_da_janela.extend(self.turnos[:excesso])
+                self.turnos = self.turnos[excesso:]
+
+    def atualizar_resumo(self):
+        """
+        Incorpora ao resumo as trocas que saíram da janela
+
+        Pode rodar enquanto a próxima mensagem é respondida: só as trocas lidas no
+        início saem de fora_da_janela. Após max_falhas_resumo falhas seguidas, as
+        trocas pendentes mais antigas são descartadas, para o payload não crescer sem limite
+
+        Returns:
+            bool: True se o resumo mudou
+        """
+        with self._lock:
+            pendentes = list(self.fora_da_janela)
+            if not pendentes or self._resumindo:
+                return False
+            self._resumindo = True
+
+        trocas = "\n".join(
+            f"{'Aluno' if t['role'] == 'user' else 'Tutor'}: {_texto(t)}" for t in pendentes
+        )
+        prompt = PROMPT_RESUMO.format(
+            resumo=self.resumo or "(vazio)",
+            trocas=trocas,
+            limite=self.limite_resumo
+        )
+        try:
+            resposta = self.criar_modelo_resumo().generate_content(prompt)
+            with self._lock:
+                self.resumo = resposta.text.strip()
+                self.fora_da_janela = self.fora_da_janela[len(pendentes):]
+                self._falhas_resumo = 0
+            return True
+        except Exception as e:
+            # Mantém as trocas pendentes; o resumo será tentado na próxima troca
+            print(f"⚠️ Falha ao atualizar resumo do chat: {e}")
+            with self._lock:
+                self._falhas_resumo += 1
+                if self._falhas_resumo >= self.max_falhas_resumo:
+                    descartadas = len(self.fora_da_janela) - 2 * self.intervalo_resumo
+                    if descartadas > 0:
+                        print(f"⚠️ Resumo do chat falhou {self._falhas_resumo} vezes: {descartadas} turnos antigos descartados")
+                        self.fora_da_janela = self.fora_da_janela[descartadas:]
+                    self._falhas_resumo = 0
+            return False
+        finally:
+            with self._lock:
+                self._resumindo = False
+
+    # ============================================
+    # ENVIO
+    # ============================================
+
+    def enviar_stream(self, mensagem, modelo=None):
+        """
+        Envia a mensagem usando a API de streaming do Gemini
+
+        Gera os trechos da resposta conforme chegam. A troca só entra no
+        histórico quando o stream termina; se ele falhar no meio, nada é registrado.
+        A contagem de tokens e o resumo ficam para concluir_troca.
+
+        Args:
+            mensagem: Texto do aluno
+            modelo: Modelo do tutor já preso a uma chave (padrão: criar_modelo())
+
+        Yields:
+            str: Trechos incrementais da resposta
+        """
+        modelo = modelo or self.criar_modelo()
+        resposta = modelo.generate_content(self.montar_conteudo(mensagem), stream=True)
+        partes = []
+        for chunk in resposta:
+            try:
+                trecho = chunk.text
+            except ValueError:
+                # Chunk sem texto (ex.: apenas metadados de finalização)
+                continue
+            if trecho:
+                partes.append(trecho)
+                yield trecho
+
+        self._uso_pendente = getattr(resposta, 'usage_metadata', None)
+        self.registrar_troca(mensagem, "".join(partes))
+
+    def concluir_troca(self):
+        """
+        Trabalho lento depois da resposta já entregue: contabiliza os tokens e,
+        se houver trocas suficientes fora da janela, atualiza o resumo (bloqueante:
+        chame via executar_bloqueante)
+
+        Returns:
+            bool: True se o resumo mudou (o estado precisa ser gravado de novo)
+        """
+        uso, self._uso_pendente = self._uso_pendente, None
+        self._registrar_uso(uso)
+        return self.precisa_resumo() and self.atualizar_resumo()
+
+    def _registrar_uso(self, usage_metadata):
+        if self.registrar_uso and usage_metadata is not None:
+            try:
+                self.registrar_uso(usage_metadata)
+            except Exception as e:
+                print(f"⚠️ Falha ao registrar uso de tokens do chat: {e}")
+
+    def ultima_resposta(self):
+        """Última fala do tutor (usada para retomar a conversa ao reconectar)"""
+        for turno in reversed(self.turnos):
+            if turno['role'] == 'model':
+                return _texto(turno)
+        return self.mensagem_inicial
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'resumo': self.resumo,
+                'turnos': list(self.turnos),
+                'fora_da_janela': list(self.fora_da_janela)
+            }
@@ -0,0 +1,274 @@
+"""
+Armazenamento das sessões do chatbot
+Mantém em memória apenas as sessões recentes (LRU + tempo ocioso) e grava as
+transcrições removidas no SQLite para reidratá-las quando o aluno voltar.
+No modo compartilhado (vários workers), toda troca é gravada e cada acesso
+confere se outro worker avançou a conversa. Sessões com resposta em andamento
+ficam fixadas e não são removidas no meio da troca
+"""
+from collections import OrderedDict
+from datetime import datetime
+import json
+import os
+import sqlite3
+import time
+
+from config import pool
+from tarefas import iniciar_em_segundo_plano, pausar
+
+
+def tamanho_transcricao(historico):
+    """Bytes da transcrição serializada (estimativa do custo em memória)"""
+    if not historico:
+        return 0
+    return len(json.dumps(historico, ensure_ascii=False).encode('utf-8'))
+
+
+class ChatStore:
+    def __init__(self, criar_chat, serializar, max_sessoes=None, tempo_ocioso=None, max_bytes=None, compartilhado=False):
+        """
+        Inicializa o armazenamento
+
+        Args:
+            criar_chat: Função (historico ou None) -> objeto de chat
+            serializar: Função (objeto de chat) -> estado serializável em JSON
+            max_sessoes: Máximo de sessões mantidas em memória
+            tempo_ocioso: Segundos sem uso até a sessão ser removida da memória
+            max_bytes: Máximo de bytes de transcrição mantidos em memória
+            compartilhado: True quando há mais de um worker servindo o chat
+        """
+        self.criar_chat = criar_chat
+        self.serializar = serializar
+        self.max_sessoes = max_sessoes or int(os.getenv('CHAT_MAX_SESSOES', 500))
+        self.tempo_ocioso = tempo_ocioso or int(os.getenv('CHAT_TEMPO_OCIOSO', 1800))
+        self.max_bytes = max_bytes or int(os.getenv('CHAT_MAX_BYTES', 50 * 1024 * 1024))
+        self.compartilhado = compartilhado
+
+        # session_id -> {'chat', 'ultimo_acesso', 'bytes', 'versao', 'gravada', 'em_uso'} (mais antigo primeiro)
+        self._sessoes = OrderedDict()
+        self._total_bytes = 0
+        self._remocoes = 0
+        self._reidratacoes = 0
+        self._tarefa_varredura = None
+
+    # ============================================
+    # PERSISTÊNCIA
+    # ============================================
+
+    def _carregar_transcricao(self, session_id):
+        """Returns: (historico, versao) ou (None, 0) se a sessão não foi gravada"""
+        conn = pool.obter()
+        if not conn:
+            return None, 0
+        try:
+            row = conn.execute(
+                'SELECT historico, versao FROM chat_transcricao WHERE session_id = ?', (session_id,)
+            ).fetchone()
+            if not row:
+                return None, 0
+            return json.loads(row['historico']), row['versao']
+        except (sqlite3.Error, json.JSONDecodeError) as e:
+            print(f"Erro ao carregar transcrição da sessão {session_id}: {e}")
+            return None, 0
+        finally:
+            pool.devolver(conn)
+
+    def _versao_gravada(self, session_id):
+        conn = pool.obter()
+        if not conn:
+            return None
+        try:
+            row = conn.execute(
+                'SELECT versao FROM chat_transcricao WHERE session_id = ?', (session_id,)
+            ).fetchone()
+            return row['versao'] if row else None
+        except sqlite3.Error as e:
+            print(f"Erro ao consultar versão da sessão {session_id}: {e}")
+            return None
+        finally:
+            pool.devolver(conn)
+
+    def _gravar_transcricao(self, session_id, chat, versao):
+        historico = self.serializar(chat)
+        if not historico:
+            return
+        conn = pool.obter()
+        if not conn:
+            return
+        try:
+            conn.execute(
+                '''
+                INSERT INTO chat_transcricao (session_id, historico, bytes, versao, atualizado_em)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    historico = excluded.historico,
+                    bytes = excluded.bytes,
+                    versao = excluded.versao,
+                    atualizado_em = excluded.atualizado_em
+                ''',
+                (session_id, json.dumps(historico, ensure_ascii=False), tamanho_transcricao(historico), versao, datetime.now())
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar transcrição da sessão {session_id}: {e}")
+            conn.rollback()
+        finally:
+            pool.devolver(conn)
+
+    # ============================================
+    # ACESSO E REMOÇÃO
+    # ============================================
+
+    def obter(self, session_id):
+        """
+        Retorna o chat da sessão, reidratando-o do SQLite ou criando um novo
+
+        Returns:
+            Objeto de chat ou None se não foi possível criá-lo
+        """
+        entrada = self._sessoes.get(session_id)
+        if entrada is not None:
+            if self.compartilhado and (self._versao_gravada(session_id) or 0) > entrada['versao']:
+                # Outro worker respondeu a esta sessão: descarta a cópia local
+                self._descartar(session_id)
+            else:
+                self._sessoes.move_to_end(session_id)
+                entrada['ultimo_acesso'] = time.monotonic()
+                return entrada['chat']
+
+        historico, versao = self._carregar_transcricao(session_id)
+        chat = self.criar_chat(historico)
+        if chat is None:
+            return None
+
+        if historico:
+            self._reidratacoes += 1
+            print(f"♻️ Chat reidratado para sessão: {session_id}")
+
+        bytes_chat = tamanho_transcricao(self.serializar(chat))
+        self._sessoes[session_id] = {
+            'chat': chat,
+            'ultimo_acesso': time.monotonic(),
+            'bytes': bytes_chat,
+            'versao': versao,
+            'gravada': True,
+            'em_uso': 0
+        }
+        self._total_bytes += bytes_chat
+        self._aplicar_limites(manter=session_id)
+        return chat
+
+    def fixar(self, session_id):
+        """Impede que a sessão seja removida da memória enquanto uma resposta é gerada"""
+        entrada = self._sessoes.get(session_id)
+        if entrada is not None:
+            entrada['em_uso'] += 1
+
+    def liberar(self, session_id):
+        """Desfaz um fixar() e reaplica os limites que ficaram pendentes"""
+        entrada = self._sessoes.get(session_id)
+        if entrada is not None and entrada['em_uso'] > 0:
+            entrada['em_uso'] -= 1
+            self._aplicar_limites()
+
+    def atualizar(self, session_id, chat=None):
+        """
+        Recalcula o tamanho da sessão depois de uma nova mensagem (e grava, no modo compartilhado)
+
+        Args:
+            session_id: Sessão atualizada
+            chat: Objeto de chat usado na troca; se a sessão já saiu da memória,
+                a transcrição dele é gravada direto no SQLite para não perder a troca
+        """
+        entrada = self._sessoes.get(session_id)
+        if entrada is None:
+            if chat is not None:
+                self._gravar_transcricao(session_id, chat, (self._versao_gravada(session_id) or 0) + 1)
+                print(f"💾 Sessão {session_id} fora da memória: troca gravada direto no banco")
+            return
+        novo = tamanho_transcricao(self.serializar(entrada['chat']))
+        self._total_bytes += novo - entrada['bytes']
+        entrada['bytes'] = novo
+        entrada['ultimo_acesso'] = time.monotonic()
+        entrada['versao'] += 1
+        if self.compartilhado:
+            self._gravar_transcricao(session_id, entrada['chat'], entrada['versao'])
+            entrada['gravada'] = True
+        else:
+            entrada['gravada'] = False
+        self._aplicar_limites(manter=session_id)
+
+    def _descartar(self, session_id):
+        entrada = self._sessoes.pop(session_id, None)
+        if entrada is not None:
+            self._total_bytes -= entrada['bytes']
+
+    def remover(self, session_id):
+        """Tira a sessão da memória, gravando a transcrição no SQLite"""
+        entrada = self._sessoes.pop(session_id, None)
+        if entrada is None:
+            return
+        self._total_bytes -= entrada['bytes']
+        self._remocoes += 1
+        if not entrada.get('gravada'):
+            self._gravar_transcricao(session_id, entrada['chat'], entrada['versao'])
+
+    def _aplicar_limites(self, manter=None):
+        """Remove as sessões menos usadas até respeitar os limites de quantidade e memória"""
+        while self._sessoes and (len(self._sessoes) > self.max_sessoes or self._total_bytes > self.max_bytes):
+            # Sessões fixadas (resposta em andamento) ficam de fora
+            mais_antiga = next(
+                (sid for sid, entrada in self._sessoes.items() if sid != manter and not entrada['em_uso']),
+                None
+            )
+            if mais_antiga is None:
+                break
+            self.remover(mais_antiga)
+
+    def varrer_ociosos(self):
+        """Remove da memória as sessões sem uso há mais de tempo_ocioso segundos"""
+        limite = time.monotonic() - self.tempo_ocioso
+        ociosas = []
+        for session_id, entrada in self._sessoes.items():
+            if entrada['ultimo_acesso'] >= limite:
+                # OrderedDict em ordem de uso: as demais são mais recentes
+                break
+            if not entrada['em_uso']:
+                ociosas.append(session_id)
+
+        for session_id in ociosas:
+            self.remover(session_id)
+        return len(ociosas)
+
+    def persistir_todas(self):
+        """Grava todas as sessões em memória (usado no encerramento do processo)"""
+        for session_id, entrada in list(self._sessoes.items()):
+            if not entrada.get('gravada'):
+                self._gravar_transcricao(session_id, entrada['chat'], entrada['versao'])
+
+    def _laco_varredura(self):
+        while True:
+            pausar(60)
+            try:
+                removidas = self.varrer_ociosos()
+                if removidas:
+                    print(f"🧹 {removidas} sessão(ões) de chat ociosa(s) removida(s) da memória")
+            except Exception as e:
+                print(f"❌ Erro na varredura de sessões de chat: {e}")
+
+    def iniciar_varredura(self):
+        """Inicia (uma única vez) a remoção periódica de sessões ociosas"""
+        if self._tarefa_varredura is None:
+            self._tarefa_varredura = iniciar_em_segundo_plano(self._laco_varredura)
+        return self._tarefa_varredura
+
+    def estatisticas(self):
+        return {
+            'sessoes_em_memoria': len(self._sessoes),
+            'max_sessoes': self.max_sessoes,
+            'bytes_em_memoria': self._total_bytes,
+            'max_bytes': self.max_bytes,
+            'remocoes': self._remocoes,
+            'reidratacoes': self._reidratacoes,
+            'compartilhado': self.compartilhado
+        }
@@ -0,0 +1,99 @@
+"""
+Despacho das mensagens do chatbot
+As chamadas ao Gemini rodam em segundo plano (pool limitado), com no máximo uma
+mensagem em andamento por aluno; mensagens enviadas enquanto isso são agrupadas
+e respondidas em seguida. Com um controle de admissão, o chat disputa as vagas do
+Gemini com as rotas Premium e pode ser recusado quando a fila está cheia
+"""
+from contextlib import nullcontext
+import os
+
+from admissao import Sobrecarga
+from tarefas import iniciar_em_segundo_plano, novo_semaforo
+
+
+class ChatDispatcher:
+    def __init__(self, processar, max_workers=None, ao_enfileirar=None, admissao=None,
+                 ao_aguardar_vaga=None, ao_recusar=None):
+        """
+        Inicializa o despachante
+
+        Args:
+            processar: Função (session_id, destino, mensagem) que gera e emite a resposta
+            max_workers: Máximo de mensagens sendo processadas ao mesmo tempo no worker
+            ao_enfileirar: Função (destino, pendentes) chamada quando uma mensagem aguarda a anterior
+            admissao: Admissao compartilhada com as outras chamadas ao Gemini (opcional)
+            ao_aguardar_vaga: Função (destino, posição) chamada enquanto a mensagem espera vaga
+            ao_recusar: Função (destino, Sobrecarga) chamada quando a mensagem é recusada
+        """
+        self.processar = processar
+        self.ao_enfileirar = ao_enfileirar
+        self.admissao = admissao
+        self.ao_aguardar_vaga = ao_aguardar_vaga
+        self.ao_recusar = ao_recusar
+        self.max_workers = max_workers or int(os.getenv('CHAT_MAX_WORKERS', 8))
+        self._semaforo = novo_semaforo(self.max_workers)
+
+        # session_id -> {'destino', 'pendentes': [mensagens]} das sessões com mensagem em andamento
+        self._em_andamento = {}
+
+    def enviar(self, session_id, destino, mensagem):
+        """
+        Agenda a mensagem sem bloquear o handler do socket
+
+        Args:
+            destino: Sid ou sala Socket.IO que recebe a resposta
+
+        Returns:
+            bool: True se começou a ser processada agora, False se foi enfileirada
+        """
+        estado = self._em_andamento.get(session_id)
+        if estado is not None:
+            estado['destino'] = destino
+            estado['pendentes'].append(mensagem)
+            if self.ao_enfileirar:
+                self.ao_enfileirar(destino, len(estado['pendentes']))
+            return False
+
+        self._em_andamento[session_id] = {'destino': destino, 'pendentes': []}
+        iniciar_em_segundo_plano(self._executar, session_id, mensagem)
+        return True
+
+    def _executar(self, session_id, mensagem):
+        try:
+            while mensagem is not None:
+                estado = self._em_andamento[session_id]
+                try:
+                    with self._semaforo, self._vaga(estado):
+                        try:
+                            self.processar(session_id, estado['destino'], mensagem)
+                        except Exception as e:
+                            print(f"❌ Erro ao processar mensagem da sessão {session_id}: {e}")
+                except Sobrecarga as e:
+                    # Sob sobrecarga descarta também as pendentes: o aluno é avisado e reenvia
+                    if self.ao_recusar:
+                        self.ao_recusar(estado['destino'], e)
+                    return
+
+                # Mensagens que chegaram durante a resposta viram uma só
+                pendentes = estado['pendentes']
+                estado['pendentes'] = []
+                mensagem = "\n\n".join(pendentes) if pendentes else None
+        finally:
+            self._em_andamento.pop(session_id, None)
+
+    def _vaga(self, estado):
+        if self.admissao is None:
+            return nullcontext()
+
+        def ao_aguardar(posicao):
+            if self.ao_aguardar_vaga:
+                self.ao_aguardar_vaga(estado['destino'], posicao)
+        return self.admissao.vaga(ao_aguardar)
+
+    def estatisticas(self):
+        return {
+            'em_andamento': len(self._em_andamento),
+            'pendentes': sum(len(e['pendentes']) for e in self._em_andamento.values()),
+            'max_workers': self.max_workers
+        }
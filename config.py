@@ -1,32 +1,128 @@
 import sqlite3
 import os
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from flask import g
 
 load_dotenv()
 
 # --- Configuração do SQLite ---
-DB_NAME = "repensei.db" # O arquivo que o init_db.py criou
+DB_NAME = os.getenv("DB_NAME", "repensei.db") # O arquivo que o init_db.py criou
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+
+# Aplicados a toda conexão nova:
+# - WAL: leitores não bloqueiam o escritor (e vice-versa)
+# - synchronous=NORMAL: seguro com WAL e bem mais barato que FULL
+# - busy_timeout: espera o lock em vez de falhar com "database is locked"
+# - mmap_size: leituras direto do page cache do SO
+# - foreign_keys: ativa os ON DELETE CASCADE do schema
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    f"PRAGMA mmap_size={int(os.getenv('DB_MMAP_SIZE', 256 * 1024 * 1024))}",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+]
 
 def get_db_connection():
     """Cria uma conexão com o banco de dados SQLite."""
     try:
-        # check_same_thread=False é necessário para o Flask
-        conn = sqlite3.connect(DB_NAME, check_same_thread=False)
-        
+        # check_same_thread=False: a conexão volta ao pool e pode ser usada por outra green-thread
+        conn = sqlite3.connect(DB_NAME, check_same_thread=False, timeout=5)
+
         # Define o row_factory para retornar dicionários (como o mysql-connector)
         conn.row_factory = sqlite3.Row
-        
+
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+
         return conn
     except sqlite3.Error as e:
         print(f">>> ERRO ao conectar com o banco SQLite: {e}")
         return None
 
-# --- Variáveis de Conexão Globais ---
-conn = get_db_connection()
 
-if conn:
-    cursor = conn.cursor()
-    print(">>> Conexão com o banco de dados SQLite estabelecida com sucesso!")
-else:
-    cursor = None
-    print(">>> FALHA ao conectar com o banco de dados SQLite.")
\ No newline at end of file
+class ConnectionPool:
+    """
+    Pool de conexões SQLite
+
+    Nunca bloqueia: se todas as conexões estiverem emprestadas, cria uma extra,
+    que é fechada na devolução caso o pool já esteja cheio.
+    """
+
+    def __init__(self, tamanho=DB_POOL_SIZE):
+        self.tamanho = tamanho
+        self._livres = []
+        self._emprestadas = 0
+        self._criadas = 0
+
+    def obter(self):
+        try:
+            conn = self._livres.pop()
+        except IndexError:
+            conn = get_db_connection()
+            if conn is None:
+                return None
+            self._criadas += 1
+        self._emprestadas += 1
+        return conn
+
+    def devolver(self, conn):
+        if conn is None:
+            return
+        self._emprestadas -= 1
+        try:
+            # Não deixa transação pendente passar para o próximo uso
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+
+        if len(self._livres) < self.tamanho:
+            self._livres.append(conn)
+        else:
+            conn.close()
+
+    def estatisticas(self):
+        return {
+            'livres': len(self._livres),
+            'emprestadas': self._emprestadas,
+            'criadas': self._criadas,
+            'tamanho': self.tamanho
+        }
+
+    @contextmanager
+    def conexao(self):
+        """Empresta uma conexão fora de requisições (tarefas em segundo plano, scripts)"""
+        conn = self.obter()
+        try:
+            yield conn
+        finally:
+            self.devolver(conn)
+
+
+pool = ConnectionPool()
+
+def get_db():
+    """Conexão da requisição atual (emprestada do pool na primeira chamada)"""
+    if 'db' not in g:
+        g.db = pool.obter()
+    return g.db
+
+def close_db(e=None):
+    """Devolve ao pool a conexão da requisição"""
+    conn = g.pop('db', None)
+    pool.devolver(conn)
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+
+
+# --- Verificação inicial ---
+with pool.conexao() as _conn:
+    if _conn:
+        print(">>> Conexão com o banco de dados SQLite estabelecida com sucesso!")
+    else:
+        print(">>> FALHA ao conectar com o banco de dados SQLite.")
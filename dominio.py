@@ -0,0 +1,121 @@
+"""
+Domínio do aluno por matéria e tema
+Cada quiz salvo atualiza contadores acumulados e uma precisão com média móvel
+exponencial (EWMA), que pesa mais os quizzes recentes. O progresso do aluno é
+lido desta tabela, sem percorrer o histórico de resultados
+"""
+import os
+
+from utils import classificar_materia, normalizar_tema
+
+ALFA_DOMINIO = float(os.getenv('DOMINIO_ALFA', 0.3))
+
+SQL_REGISTRAR_DOMINIO = """
+INSERT INTO dominio_aluno (id_aluno, materia, tema, tentativas, acertos, total_perguntas, precisao_ewma, ultima_tentativa)
+VALUES (:id_aluno, :materia, :tema, 1, :acertos, :total_perguntas, :precisao, :data)
+ON CONFLICT(id_aluno, materia, tema) DO UPDATE SET
+    tentativas = tentativas + 1,
+    acertos = acertos + excluded.acertos,
+    total_perguntas = total_perguntas + excluded.total_perguntas,
+    precisao_ewma = :alfa * excluded.precisao_ewma + (1 - :alfa) * precisao_ewma,
+    ultima_tentativa = MAX(ultima_tentativa, excluded.ultima_tentativa)
+"""
+
+
+def parametros_dominio(id_aluno, tema, acertos, total_perguntas, data):
+    """
+    Parâmetros de SQL_REGISTRAR_DOMINIO para um resultado
+
+    As rotas já validam o placar (utils.validar_placar); aqui os valores ainda são
+    convertidos para int porque a migração e a importação trazem dados antigos
+
+    Returns:
+        dict ou None: None para quizzes sem perguntas ou com placar inválido
+        (não dizem nada sobre o domínio)
+    """
+    try:
+        acertos, total_perguntas = int(acertos), int(total_perguntas)
+    except (TypeError, ValueError):
+        return None
+    if total_perguntas <= 0 or not 0 <= acertos <= total_perguntas:
+        return None
+    return {
+        'id_aluno': id_aluno,
+        'materia': classificar_materia(tema),
+        'tema': normalizar_tema(tema),
+        'acertos': acertos,
+        'total_perguntas': total_perguntas,
+        'precisao': acertos / total_perguntas,
+        'data': str(data),
+        'alfa': ALFA_DOMINIO
+    }
+
+
+def registrar_dominio(conn, id_aluno, tema, acertos, total_perguntas, data):
+    """Atualiza o domínio com um resultado (na transação do chamador, sem commit)"""
+    parametros = parametros_dominio(id_aluno, tema, acertos, total_perguntas, data)
+    if parametros:
+        conn.execute(SQL_REGISTRAR_DOMINIO, parametros)
+
+
+def registrar_dominio_lote(conn, resultados):
+    """
+    Atualiza o domínio com vários resultados, na ordem recebida
+
+    Args:
+        resultados: Iterável de (id_aluno, tema, acertos, total_perguntas, data)
+    """
+    parametros = [p for p in (parametros_dominio(*r) for r in resultados) if p]
+    if parametros:
+        conn.executemany(SQL_REGISTRAR_DOMINIO, parametros)
+
+
+def progresso_aluno(conn, id_aluno):
+    """
+    Domínio do aluno agrupado por matéria
+
+    Returns:
+        list: [{'materia', 'tentativas', 'precisao', 'precisao_recente', 'temas': [...]}]
+    """
+    linhas = conn.execute(
+        '''
+        SELECT materia, tema, tentativas, acertos, total_perguntas, precisao_ewma, ultima_tentativa
+        FROM dominio_aluno
+        WHERE id_aluno = ?
+        ORDER BY materia, precisao_ewma
+        ''', (id_aluno,)
+    ).fetchall()
+
+    materias = {}
+    for linha in linhas:
+        materia = materias.setdefault(linha['materia'], {
+            'materia': linha['materia'],
+            'tentativas': 0,
+            'acertos': 0,
+            'total_perguntas': 0,
+            'soma_ewma': 0.0,
+            'temas': []
+        })
+        materia['tentativas'] += linha['tentativas']
+        materia['acertos'] += linha['acertos']
+        materia['total_perguntas'] += linha['total_perguntas']
+        materia['soma_ewma'] += linha['precisao_ewma'] * linha['tentativas']
+        materia['temas'].append({
+            'tema': linha['tema'],
+            'tentativas': linha['tentativas'],
+            'precisao': linha['acertos'] / linha['total_perguntas'],
+            'precisao_recente': linha['precisao_ewma'],
+            'ultima_tentativa': linha['ultima_tentativa']
+        })
+
+    resultado = []
+    for materia in materias.values():
+        resultado.append({
+            'materia': materia['materia'],
+            'tentativas': materia['tentativas'],
+            'precisao': materia['acertos'] / materia['total_perguntas'],
+            # Média das precisões recentes dos temas, ponderada pelas tentativas
+            'precisao_recente': materia['soma_ewma'] / materia['tentativas'],
+            'temas': materia['temas']  # do tema mais fraco para o mais forte
+        })
+    return resultado
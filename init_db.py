@@ -1,66 +1,14 @@
 # comando para iniciar o banco: python init_db.py
 import sqlite3
-import datetime
+import os
 
-# Nome do arquivo do banco de dados
-DB_NAME = "repensei.db"
-
-# SQL adaptado para SQLite
-SQL_SCRIPT = """
-DROP TABLE IF EXISTS aluno;
-DROP TABLE IF EXISTS quiz_resultado;
-DROP TABLE IF EXISTS Admin;
-DROP TABLE IF EXISTS historico_premium;
-
-CREATE TABLE aluno (
-    id_aluno INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT NOT NULL,
-    email TEXT NOT NULL UNIQUE,
-    senha TEXT NOT NULL,
-    plano TEXT NOT NULL DEFAULT 'freemium' CHECK(plano IN ('freemium', 'premium')),
-    url_foto TEXT
-);
-
-CREATE TABLE quiz_resultado (
-    id_resultado INTEGER PRIMARY KEY AUTOINCREMENT,
-    id_aluno INTEGER NOT NULL, -- <--- ADICIONE ESTA LINHA
-    tema TEXT NOT NULL,
-    acertos INTEGER NOT NULL,
-    total_perguntas INTEGER NOT NULL,
-    data_criacao DATE NOT NULL,
-    FOREIGN KEY(id_aluno) REFERENCES aluno(id_aluno) ON DELETE CASCADE 
-);
-
-/* Tabela Admin que estava faltando */
-CREATE TABLE Admin (
-    id_admin INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT NOT NULL,
-    email TEXT NOT NULL UNIQUE,
-    senha TEXT NOT NULL
-);
-
-/* Tabela para salvar o CONTEÚDO das atividades premium */
-CREATE TABLE historico_premium (
-    id_historico INTEGER PRIMARY KEY AUTOINCREMENT,
-    id_aluno INTEGER NOT NULL,
-    tipo_atividade TEXT NOT NULL CHECK(tipo_atividade IN ('quiz', 'flashcard', 'resumo', 'correcao')),
-    tema TEXT NOT NULL,
-    conteudo_gerado TEXT,
-    texto_original TEXT, /* Usado para salvar o texto do aluno em 'correcao' */
-    
-    /* === NOVAS COLUNAS PARA QUIZZES === */
-    acertos INTEGER, 
-    total_perguntas INTEGER,
-    respostas_usuario TEXT, /* JSON string com as respostas do usuário */
-    /* ================================== */
+from migrations import migrar
 
-    data_criacao DATETIME NOT NULL DEFAULT (datetime('now','localtime')),
-    FOREIGN KEY(id_aluno) REFERENCES aluno(id_aluno) ON DELETE CASCADE
-);
-
-
-/* --- Dados iniciais --- */
+# Nome do arquivo do banco de dados
+DB_NAME = os.getenv("DB_NAME", "repensei.db")
 
+# As tabelas são criadas pelas migrações (migrations.py); aqui ficam só os dados iniciais
+SQL_DADOS_INICIAIS = """
 /* Usuários de teste */
 INSERT INTO aluno (nome, email, senha, plano) VALUES
 ('Aluno Teste', 'premium@email.com', '123', 'premium'),
@@ -73,25 +21,28 @@ INSERT INTO Admin (nome, email, senha) VALUES
 
 def initialize_database():
     """
-    Cria e inicializa o banco de dados SQLite.
+    Cria ou atualiza o banco de dados SQLite sem apagar dados existentes.
+    Os usuários de teste só são inseridos em um banco vazio.
     """
     try:
         # Conecta (ou cria o arquivo .db)
         conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        
-        # Executa os comandos SQL (permite múltiplos comandos)
-        cursor.executescript(SQL_SCRIPT)
-        
-        conn.commit()
+
+        versao = migrar(conn)
+        print(f"Banco de dados '{DB_NAME}' na versão {versao} do schema.")
+
+        vazio = conn.execute('SELECT (SELECT COUNT(*) FROM aluno) + (SELECT COUNT(*) FROM Admin)').fetchone()[0] == 0
+        if vazio:
+            conn.executescript(SQL_DADOS_INICIAIS)
+            conn.commit()
+            print("Usuários e Admin de teste inseridos.")
+        else:
+            print("Banco já possui usuários; dados iniciais não foram inseridos.")
+
         conn.close()
-        
-        print(f"Banco de dados '{DB_NAME}' inicializado com sucesso.")
-        print("Tabelas 'aluno', 'quiz_resultado', 'Admin' e 'historico_premium' criadas.")
-        print("Usuários e Admin de teste inseridos.")
 
     except sqlite3.Error as e:
         print(f"ERRO ao inicializar o banco de dados: {e}")
 
 if __name__ == "__main__":
-    initialize_database()
\ No newline at end of file
+    initialize_database()
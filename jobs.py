@@ -0,0 +1,253 @@
+"""
+Jobs de geração Premium (quiz, flashcards, resumo e correção)
+No modo assíncrono a rota grava o pedido na tabela job_geracao e responde na hora
+com o id do job; um pool limitado de workers executa as gerações por classe de
+prioridade. O resultado fica no job (GET /premium/jobs/<id>) e é emitido pelo
+socket, então sobrevive a reconexões do aluno e a reinícios do servidor
+"""
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import json
+import math
+import os
+import sqlite3
+import time
+from uuid import uuid4
+
+from admissao import Sobrecarga
+from config import pool
+from tarefas import iniciar_em_segundo_plano, novo_semaforo, pausar
+
+# Classes de prioridade (menor = antes). A correção é a resposta ao texto que o
+# aluno acabou de escrever; o resumo é o mais longo e o que menos tem pressa
+PRIORIDADES = {'alta': 0, 'normal': 1, 'baixa': 2}
+PRIORIDADE_POR_TIPO = {
+    'correcao': PRIORIDADES['alta'],
+    'quiz': PRIORIDADES['normal'],
+    'flashcard': PRIORIDADES['normal'],
+    'resumo': PRIORIDADES['baixa'],
+}
+
+SQL_INSERIR_JOB = """
+INSERT INTO job_geracao (id_job, id_aluno, tipo, tema, texto_original, prioridade, estado, criado_em)
+VALUES (?, ?, ?, ?, ?, ?, 'pendente', ?)
+"""
+
+# Só um worker (de qualquer processo) consegue passar o job de pendente para executando
+SQL_ASSUMIR_JOB = """
+UPDATE job_geracao SET estado = 'executando', iniciado_em = ?
+WHERE id_job = ? AND estado = 'pendente'
+RETURNING id_aluno, tipo, tema, texto_original
+"""
+
+
+class FilaDeJobs:
+    def __init__(self, gerar, admissao=None, ao_concluir=None, max_workers=None, max_fila=None):
+        """
+        Inicializa a fila de jobs
+
+        Args:
+            gerar: Função (tipo, id_aluno, tema, texto) -> (resposta, status, id_historico)
+            admissao: Admissao compartilhada com as rotas e o chat (opcional)
+            ao_concluir: Função (id_aluno, dados) chamada ao fim de cada job
+            max_workers: Gerações em andamento ao mesmo tempo neste processo
+            max_fila: Jobs aguardando neste processo; acima disso o pedido é recusado
+        """
+        self.gerar = gerar
+        self.admissao = admissao
+        self.ao_concluir = ao_concluir
+        self.max_workers = max_workers or int(os.getenv('JOBS_MAX_WORKERS', 4))
+        self.max_fila = max_fila or int(os.getenv('JOBS_MAX_FILA', 100))
+        # Job "executando" há mais tempo que isso é de um processo que morreu
+        self.tempo_maximo = int(os.getenv('JOBS_TEMPO_MAXIMO', 600))
+        self.retencao_dias = int(os.getenv('JOBS_RETENCAO_DIAS', 7))
+
+        # heap de (prioridade, ordem de chegada, id_job)
+        self._fila = []
+        self._ordem = itertools.count()
+        self._sinal = novo_semaforo(0)
+        self._workers = []
+        self._app = None
+
+        self._em_andamento = 0
+        self._duracao_media = 10.0
+        self._concluidos = 0
+        self._com_erro = 0
+
+    def init_app(self, app):
+        self._app = app
+        app.config['JOBS'] = self
+
+    def iniciar(self):
+        """Inicia (uma única vez) os workers e retoma os jobs pendentes do banco"""
+        if self._workers:
+            return
+        self._workers = [iniciar_em_segundo_plano(self._laco) for _ in range(self.max_workers)]
+        self.retomar()
+
+    def verificar_fila(self):
+        """
+        Raises:
+            Sobrecarga: Fila cheia (checado antes de reservar o uso do aluno)
+        """
+        if len(self._fila) >= self.max_fila:
+            rodadas = (len(self._fila) + 1) / self.max_workers
+            raise Sobrecarga(max(1, math.ceil(self._duracao_media * rodadas)), 'fila de jobs cheia')
+
+    def enfileirar(self, tipo, id_aluno, tema, texto=None, prioridade=None):
+        """
+        Grava o job e o coloca na fila
+
+        Returns:
+            str: id do job
+        """
+        if prioridade is None:
+            prioridade = PRIORIDADE_POR_TIPO.get(tipo, PRIORIDADES['normal'])
+        id_job = uuid4().hex
+        with pool.conexao() as conn:
+            conn.execute(SQL_INSERIR_JOB, (id_job, id_aluno, tipo, tema, texto, prioridade, datetime.now()))
+            conn.commit()
+        self._colocar(prioridade, id_job)
+        return id_job
+
+    def _colocar(self, prioridade, id_job):
+        heapq.heappush(self._fila, (prioridade, next(self._ordem), id_job))
+        self._sinal.release()
+
+    def retomar(self):
+        """
+        Recoloca na fila os jobs pendentes gravados no banco (reinício do servidor)
+
+        Jobs presos em "executando" por mais de tempo_maximo voltam a pendente, e os
+        concluídos há mais de retencao_dias são apagados. Com vários processos, todos
+        retomam os mesmos jobs, mas só um consegue assumir cada um.
+        """
+        agora = datetime.now()
+        with pool.conexao() as conn:
+            try:
+                conn.execute(
+                    "UPDATE job_geracao SET estado = 'pendente', iniciado_em = NULL "
+                    "WHERE estado = 'executando' AND iniciado_em < ?",
+                    (agora - timedelta(seconds=self.tempo_maximo),)
+                )
+                conn.execute(
+                    "DELETE FROM job_geracao WHERE estado IN ('concluido', 'erro') AND concluido_em < ?",
+                    (agora - timedelta(days=self.retencao_dias),)
+                )
+                pendentes = conn.execute(
+                    "SELECT id_job, prioridade FROM job_geracao WHERE estado = 'pendente' ORDER BY prioridade, criado_em"
+                ).fetchall()
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"❌ Erro ao retomar jobs de geração: {e}")
+                conn.rollback()
+                return 0
+
+        for linha in pendentes:
+            self._colocar(linha['prioridade'], linha['id_job'])
+        if pendentes:
+            print(f"📋 {len(pendentes)} job(s) de geração retomado(s)")
+        return len(pendentes)
+
+    def _laco(self):
+        while True:
+            self._sinal.acquire()
+            _, _, id_job = heapq.heappop(self._fila)
+            try:
+                self._executar(id_job)
+            except Exception as e:
+                print(f"❌ Erro no job de geração {id_job}: {e}")
+
+    def _executar(self, id_job):
+        with pool.conexao() as conn:
+            job = conn.execute(SQL_ASSUMIR_JOB, (datetime.now(), id_job)).fetchone()
+            conn.commit()
+        if job is None:
+            # Já assumido por outro processo (ou apagado)
+            return
+
+        self._em_andamento += 1
+        inicio = time.monotonic()
+        try:
+            with self._app.app_context():
+                resposta, status, id_historico = self._gerar_com_vaga(job)
+        except Exception as e:
+            resposta, status, id_historico = {'erro': str(e)}, 500, None
+        finally:
+            self._em_andamento -= 1
+        self._duracao_media = 0.8 * self._duracao_media + 0.2 * (time.monotonic() - inicio)
+
+        estado = 'concluido' if status < 400 else 'erro'
+        concluido_em = datetime.now()
+        with pool.conexao() as conn:
+            conn.execute(
+                '''
+                UPDATE job_geracao SET estado = ?, status_http = ?, resultado = ?, id_historico = ?, concluido_em = ?
+                WHERE id_job = ?
+                ''', (estado, status, json.dumps(resposta), id_historico, concluido_em, id_job)
+            )
+            conn.commit()
+
+        if estado == 'concluido':
+            self._concluidos += 1
+        else:
+            self._com_erro += 1
+
+        if self.ao_concluir:
+            self.ao_concluir(job['id_aluno'], {
+                'id_job': id_job,
+                'tipo': job['tipo'],
+                'tema': job['tema'],
+                'estado': estado,
+                'status': status,
+                'id_historico': id_historico,
+                'resultado': resposta
+            })
+
+    def _gerar_com_vaga(self, job):
+        """Gera dentro de uma vaga da admissão; sem vaga, espera e tenta de novo (o job não é recusado)"""
+        while True:
+            try:
+                with self.admissao.vaga() if self.admissao else nullcontext():
+                    return self.gerar(job['tipo'], job['id_aluno'], job['tema'], job['texto_original'])
+            except Sobrecarga as e:
+                pausar(e.retry_after)
+
+    def posicao(self, id_job):
+        """Posição (1 = próximo) de um job aguardando neste processo, ou None"""
+        for posicao, (_, _, outro) in enumerate(sorted(self._fila), start=1):
+            if outro == id_job:
+                return posicao
+        return None
+
+    def consultar(self, id_job):
+        """Estado do job gravado no banco (com o resultado, quando concluído) ou None"""
+        with pool.conexao() as conn:
+            linha = conn.execute(
+                '''
+                SELECT id_job, id_aluno, tipo, tema, estado, status_http, resultado, id_historico,
+                       criado_em, iniciado_em, concluido_em
+                FROM job_geracao WHERE id_job = ?
+                ''', (id_job,)
+            ).fetchone()
+        if linha is None:
+            return None
+
+        job = dict(linha)
+        job['resultado'] = json.loads(job['resultado']) if job['resultado'] else None
+        if job['estado'] == 'pendente':
+            job['posicao'] = self.posicao(id_job)
+        return job
+
+    def estatisticas(self):
+        return {
+            'na_fila': len(self._fila),
+            'em_andamento': self._em_andamento,
+            'max_workers': self.max_workers,
+            'max_fila': self.max_fila,
+            'duracao_media': round(self._duracao_media, 2),
+            'concluidos': self._concluidos,
+            'com_erro': self._com_erro
+        }
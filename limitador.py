@@ -0,0 +1,231 @@
+"""
+Limite de requisições por aluno/IP (token bucket)
+Cada regra tem uma capacidade (rajada máxima) e um período em que ela é reposta.
+O controle fica em memória (um worker) ou em uma tabela SQLite compartilhada
+entre os workers da mesma máquina. O excesso é recusado com 429 e Retry-After
+antes de chegar ao banco ou ao Gemini
+"""
+import math
+import os
+import sqlite3
+import time
+
+from flask import jsonify, request, session
+
+# regra -> (capacidade, período em segundos). A regra é o endpoint ('auth_bp.login'),
+# o blueprint ('premium_bp') ou um evento do socket ('socket.enviar_mensagem')
+REGRAS_PADRAO = {
+    'auth_bp.login': (10, 60),
+    'auth_bp.cadastrar_usuario': (5, 60),
+    'premium_bp': (30, 60),
+    # Consulta de job (polling enquanto a geração roda)
+    'premium_bp.get_job': (120, 60),
+    'freemium_bp': (60, 60),
+    'socket.enviar_mensagem': (20, 60),
+}
+
+# Regras contadas sempre por IP: antes do login a sessão não identifica ninguém
+REGRAS_POR_IP = {'auth_bp.login', 'auth_bp.cadastrar_usuario'}
+
+INTERVALO_LIMPEZA = 60
+
+
+def carregar_regras(texto=None):
+    """
+    Regras padrão com as substituições de RATE_LIMITES
+
+    Formato: "regra=capacidade/segundos;..." (ex.: "auth_bp.login=5/60;premium_bp=0/60").
+    Capacidade 0 desliga o limite da regra.
+    """
+    regras = dict(REGRAS_PADRAO)
+    texto = os.getenv('RATE_LIMITES', '') if texto is None else texto
+    for item in texto.split(';'):
+        if not item.strip():
+            continue
+        try:
+            nome, valor = item.split('=')
+            capacidade, periodo = valor.split('/')
+            regras[nome.strip()] = (int(capacidade), float(periodo))
+        except ValueError:
+            print(f"⚠️ Regra de limite inválida ignorada: '{item}'")
+    return {nome: regra for nome, regra in regras.items() if regra[0] > 0}
+
+
+class BaldesMemoria:
+    """Baldes em um dicionário do processo"""
+
+    def __init__(self, retencao):
+        """
+        Args:
+            retencao: Segundos parado após os quais um balde está cheio e pode ser
+                descartado (o maior período entre as regras)
+        """
+        self.retencao = retencao
+        # chave -> (tokens, atualizado_em)
+        self._baldes = {}
+        self._ultima_limpeza = time.monotonic()
+
+    def consumir(self, chave, capacidade, taxa):
+        """
+        Returns:
+            float: 0 se a requisição pode seguir, senão os segundos até haver um token
+        """
+        agora = time.monotonic()
+        tokens, atualizado_em = self._baldes.get(chave, (capacidade, agora))
+        tokens = min(capacidade, tokens + (agora - atualizado_em) * taxa)
+
+        if agora - self._ultima_limpeza > INTERVALO_LIMPEZA:
+            self._limpar(agora)
+
+        if tokens >= 1:
+            self._baldes[chave] = (tokens - 1, agora)
+            return 0
+        self._baldes[chave] = (tokens, agora)
+        return (1 - tokens) / taxa
+
+    def _limpar(self, agora):
+        # Balde parado há mais tempo que uma recarga completa equivale a um balde cheio
+        for chave in [c for c, (_, t) in self._baldes.items() if agora - t > self.retencao]:
+            del self._baldes[chave]
+        self._ultima_limpeza = agora
+
+    def estatisticas(self):
+        return {'backend': 'memoria', 'baldes': len(self._baldes)}
+
+
+class BaldesSQLite:
+    """Baldes em uma tabela SQLite (vários workers na mesma máquina)"""
+
+    # Reposição e consumo em um único UPSERT: atômico mesmo com vários processos
+    SQL_CONSUMIR = """
+    INSERT INTO limite_balde (chave, tokens, atualizado_em, permitido)
+    VALUES (:chave, :capacidade - 1, :agora, 1)
+    ON CONFLICT(chave) DO UPDATE SET
+        tokens = CASE
+            WHEN MIN(:capacidade, tokens + (:agora - atualizado_em) * :taxa) >= 1
+            THEN MIN(:capacidade, tokens + (:agora - atualizado_em) * :taxa) - 1
+            ELSE MIN(:capacidade, tokens + (:agora - atualizado_em) * :taxa)
+        END,
+        permitido = MIN(:capacidade, tokens + (:agora - atualizado_em) * :taxa) >= 1,
+        atualizado_em = :agora
+    RETURNING tokens, permitido
+    """
+
+    def __init__(self, retencao, db_path=None):
+        self.retencao = retencao
+        self.db_path = db_path or os.getenv('RATE_LIMIT_DB', 'limites.db')
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS limite_balde (
+                chave TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                atualizado_em REAL NOT NULL,
+                permitido INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._ultima_limpeza = time.time()
+
+    def consumir(self, chave, capacidade, taxa):
+        agora = time.time()
+        try:
+            tokens, permitido = self._conn.execute(
+                self.SQL_CONSUMIR, {'chave': chave, 'capacidade': capacidade, 'taxa': taxa, 'agora': agora}
+            ).fetchone()
+            if agora - self._ultima_limpeza > INTERVALO_LIMPEZA:
+                self._conn.execute('DELETE FROM limite_balde WHERE atualizado_em < ?', (agora - self.retencao,))
+                self._ultima_limpeza = agora
+        except sqlite3.Error as e:
+            # Sem o banco de limites, melhor deixar passar do que derrubar as rotas
+            print(f"⚠️ Falha no limitador SQLite: {e}")
+            return 0
+        return 0 if permitido else (1 - tokens) / taxa
+
+    def estatisticas(self):
+        try:
+            baldes = self._conn.execute('SELECT COUNT(*) FROM limite_balde').fetchone()[0]
+        except sqlite3.Error:
+            baldes = None
+        return {'backend': 'sqlite', 'arquivo': self.db_path, 'baldes': baldes}
+
+
+class Limitador:
+    def __init__(self, regras=None, backend=None, confiar_proxy=False):
+        """
+        Inicializa o limitador
+
+        Args:
+            regras: regra -> (capacidade, período em segundos); padrão: carregar_regras()
+            backend: 'memoria' ou 'sqlite' (padrão: RATE_LIMIT_BACKEND ou 'memoria')
+            confiar_proxy: Usa o IP que o proxy do Render acrescentou ao X-Forwarded-For
+        """
+        self.regras = carregar_regras() if regras is None else regras
+        backend = backend or os.getenv('RATE_LIMIT_BACKEND', 'memoria')
+        retencao = max((periodo for _, periodo in self.regras.values()), default=60)
+        self.baldes = BaldesSQLite(retencao) if backend == 'sqlite' else BaldesMemoria(retencao)
+        self.confiar_proxy = confiar_proxy
+        self._recusadas = 0
+
+    def init_app(self, app):
+        app.before_request(self._antes_da_requisicao)
+        app.config['LIMITADOR'] = self
+
+    def verificar(self, regra, identidade):
+        """
+        Consome um token da regra para a identidade
+
+        Returns:
+            int ou None: segundos de Retry-After quando o limite foi excedido
+        """
+        limite = self.regras.get(regra)
+        if limite is None:
+            return None
+
+        capacidade, periodo = limite
+        espera = self.baldes.consumir(f"{regra}|{identidade}", capacidade, capacidade / periodo)
+        if not espera:
+            return None
+        self._recusadas += 1
+        return max(1, math.ceil(espera))
+
+    def identidade(self, por_ip=False):
+        """Aluno/admin logado ou, sem sessão (ou com por_ip), o IP do cliente"""
+        if not por_ip and 'id_aluno' in session:
+            return f"aluno:{session['id_aluno']}"
+        if not por_ip and 'admin_id' in session:
+            return f"admin:{session['admin_id']}"
+
+        ip = request.remote_addr
+        if self.confiar_proxy:
+            # Só o último item é confiável: é o que o proxy acrescenta. Os anteriores
+            # vêm do cliente, que poderia trocar de "IP" a cada tentativa de login
+            encaminhado = ','.join(request.headers.getlist('X-Forwarded-For'))
+            ultimo = encaminhado.rsplit(',', 1)[-1].strip()
+            if ultimo:
+                ip = ultimo
+        return f"ip:{ip}"
+
+    def _antes_da_requisicao(self):
+        if request.method == 'OPTIONS' or request.endpoint is None:
+            return None
+
+        # Regra da rota tem prioridade sobre a do blueprint
+        if request.endpoint in self.regras:
+            regra = request.endpoint
+        elif request.blueprint in self.regras:
+            regra = request.blueprint
+        else:
+            return None
+
+        espera = self.verificar(regra, self.identidade(por_ip=regra in REGRAS_POR_IP))
+        if espera is None:
+            return None
+
+        response = jsonify({'error': 'Muitas requisições. Tente novamente em instantes.', 'retry_after': espera})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(espera)
+        return response
+
+    def estatisticas(self):
+        return {**self.baldes.estatisticas(), 'recusadas': self._recusadas, 'regras': len(self.regras)}
@@ -0,0 +1,661 @@
+# comando para migrar o banco: python migrations.py  (ou python migrations.py --plano)
+"""
+Migrações versionadas do schema SQLite
+A versão aplicada fica em PRAGMA user_version; cada migração roda uma única vez,
+em transação, e nunca apaga dados. Novas alterações entram no fim de MIGRATIONS
+"""
+import sqlite3
+import sys
+
+SQL_SCHEMA_BASE = """
+CREATE TABLE IF NOT EXISTS aluno (
+    id_aluno INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    senha TEXT NOT NULL,
+    plano TEXT NOT NULL DEFAULT 'freemium' CHECK(plano IN ('freemium', 'premium')),
+    url_foto TEXT
+);
+
+CREATE TABLE IF NOT EXISTS quiz_resultado (
+    id_resultado INTEGER PRIMARY KEY AUTOINCREMENT,
+    id_aluno INTEGER NOT NULL,
+    tema TEXT NOT NULL,
+    acertos INTEGER NOT NULL,
+    total_perguntas INTEGER NOT NULL,
+    data_criacao DATE NOT NULL,
+    FOREIGN KEY(id_aluno) REFERENCES aluno(id_aluno) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS Admin (
+    id_admin INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    senha TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS historico_premium (
+    id_historico INTEGER PRIMARY KEY AUTOINCREMENT,
+    id_aluno INTEGER NOT NULL,
+    tipo_atividade TEXT NOT NULL CHECK(tipo_atividade IN ('quiz', 'flashcard', 'resumo', 'correcao')),
+    tema TEXT NOT NULL,
+    conteudo_gerado TEXT,
+    texto_original TEXT,
+    acertos INTEGER,
+    total_perguntas INTEGER,
+    respostas_usuario TEXT,
+    data_criacao DATETIME NOT NULL DEFAULT (datetime('now','localtime')),
+    FOREIGN KEY(id_aluno) REFERENCES aluno(id_aluno) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS uso_diario (
+    id_aluno INTEGER NOT NULL,
+    dia DATE NOT NULL,
+    chamadas INTEGER NOT NULL DEFAULT 0,
+    tokens_estimados INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_aluno, dia),
+    FOREIGN KEY(id_aluno) REFERENCES aluno(id_aluno) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS chat_transcricao (
+    session_id TEXT PRIMARY KEY,
+    historico TEXT NOT NULL,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    versao INTEGER NOT NULL DEFAULT 0,
+    atualizado_em DATETIME NOT NULL
+);
+"""
+
+SQL_INDICES_CONSULTAS = """
+/* Resultados do aluno (admin e progresso), já ordenados por data */
+CREATE INDEX IF NOT EXISTS idx_quiz_resultado_aluno_data ON quiz_resultado(id_aluno, data_criacao);
+/* Filtros por período (dashboard) */
+CREATE INDEX IF NOT EXISTS idx_quiz_resultado_data ON quiz_resultado(data_criacao);
+/* Histórico premium do aluno, do mais recente ao mais antigo */
+CREATE INDEX IF NOT EXISTS idx_historico_premium_aluno_data ON historico_premium(id_aluno, data_criacao);
+/* Login e verificação de e-mail sem diferenciar maiúsculas */
+CREATE INDEX IF NOT EXISTS idx_aluno_email_lower ON aluno(LOWER(email));
+CREATE INDEX IF NOT EXISTS idx_admin_email_lower ON Admin(LOWER(email));
+"""
+
+
+def _coluna_versao_transcricao(conn):
+    """Bancos criados antes do chat com vários workers não têm chat_transcricao.versao"""
+    colunas = [row[1] for row in conn.execute('PRAGMA table_info(chat_transcricao)')]
+    if 'versao' not in colunas:
+        conn.execute('ALTER TABLE chat_transcricao ADD COLUMN versao INTEGER NOT NULL DEFAULT 0')
+
+
+SQL_CLASSIFICAR_MATERIA = """CASE
+        WHEN LOWER(tema) LIKE '%filosofia%' THEN 'Filosofia'
+        WHEN LOWER(tema) LIKE '%sociologia%' THEN 'Sociologia'
+        ELSE 'Outros'
+    END"""
+
+
+def _coluna_materia_quiz(conn):
+    """Matéria normalizada do resultado (mesma regra de utils.classificar_materia)"""
+    colunas = [row[1] for row in conn.execute('PRAGMA table_info(quiz_resultado)')]
+    if 'materia' not in colunas:
+        conn.execute("ALTER TABLE quiz_resultado ADD COLUMN materia TEXT NOT NULL DEFAULT 'Outros'")
+    conn.execute(f"UPDATE quiz_resultado SET materia = {SQL_CLASSIFICAR_MATERIA}")
+
+
+# Agregados do dashboard do admin, mantidos por triggers a cada escrita.
+# Percentual de um resultado = acertos / total_perguntas (só quando total_perguntas > 0)
+SQL_RESUMOS_DASHBOARD = """
+/* Resultados por plano do aluno e matéria (desde sempre) */
+CREATE TABLE IF NOT EXISTS resumo_quiz (
+    plano TEXT NOT NULL,
+    materia TEXT NOT NULL,
+    quantidade INTEGER NOT NULL DEFAULT 0,
+    quantidade_validos INTEGER NOT NULL DEFAULT 0,
+    soma_percentual REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (plano, materia)
+) WITHOUT ROWID;
+
+/* Resultados por dia, plano e matéria (gráfico dos últimos dias) */
+CREATE TABLE IF NOT EXISTS resumo_quiz_dia (
+    dia DATE NOT NULL,
+    plano TEXT NOT NULL,
+    materia TEXT NOT NULL,
+    quantidade INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dia, plano, materia)
+) WITHOUT ROWID;
+
+/* Alunos por plano */
+CREATE TABLE IF NOT EXISTS resumo_alunos_plano (
+    plano TEXT PRIMARY KEY,
+    quantidade INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+/* --- Carga inicial a partir dos dados existentes --- */
+DELETE FROM resumo_quiz;
+INSERT INTO resumo_quiz (plano, materia, quantidade, quantidade_validos, soma_percentual)
+SELECT a.plano, q.materia, COUNT(*),
+       SUM(q.total_perguntas > 0),
+       COALESCE(SUM(CASE WHEN q.total_perguntas > 0 THEN CAST(q.acertos AS REAL) / q.total_perguntas END), 0)
+FROM quiz_resultado q
+JOIN aluno a ON a.id_aluno = q.id_aluno
+GROUP BY a.plano, q.materia;
+
+DELETE FROM resumo_quiz_dia;
+INSERT INTO resumo_quiz_dia (dia, plano, materia, quantidade)
+SELECT date(q.data_criacao), a.plano, q.materia, COUNT(*)
+FROM quiz_resultado q
+JOIN aluno a ON a.id_aluno = q.id_aluno
+GROUP BY date(q.data_criacao), a.plano, q.materia;
+
+DELETE FROM resumo_alunos_plano;
+INSERT INTO resumo_alunos_plano (plano, quantidade)
+SELECT plano, COUNT(*) FROM aluno GROUP BY plano;
+
+/* --- Novo resultado --- */
+CREATE TRIGGER IF NOT EXISTS trg_quiz_resultado_resumo_insert
+AFTER INSERT ON quiz_resultado
+WHEN EXISTS (SELECT 1 FROM aluno WHERE id_aluno = NEW.id_aluno)
+BEGIN
+    INSERT INTO resumo_quiz (plano, materia, quantidade, quantidade_validos, soma_percentual)
+    VALUES (
+        (SELECT plano FROM aluno WHERE id_aluno = NEW.id_aluno), NEW.materia, 1,
+        NEW.total_perguntas > 0,
+        CASE WHEN NEW.total_perguntas > 0 THEN CAST(NEW.acertos AS REAL) / NEW.total_perguntas ELSE 0 END
+    )
+    ON CONFLICT(plano, materia) DO UPDATE SET
+        quantidade = quantidade + 1,
+        quantidade_validos = quantidade_validos + excluded.quantidade_validos,
+        soma_percentual = soma_percentual + excluded.soma_percentual;
+
+    INSERT INTO resumo_quiz_dia (dia, plano, materia, quantidade)
+    VALUES (date(NEW.data_criacao), (SELECT plano FROM aluno WHERE id_aluno = NEW.id_aluno), NEW.materia, 1)
+    ON CONFLICT(dia, plano, materia) DO UPDATE SET quantidade = quantidade + 1;
+END;
+
+/* --- Resultado removido (a exclusão do aluno é tratada no trigger do aluno) --- */
+CREATE TRIGGER IF NOT EXISTS trg_quiz_resultado_resumo_delete
+AFTER DELETE ON quiz_resultado
+WHEN EXISTS (SELECT 1 FROM aluno WHERE id_aluno = OLD.id_aluno)
+BEGIN
+    UPDATE resumo_quiz SET
+        quantidade = quantidade - 1,
+        quantidade_validos = quantidade_validos - (OLD.total_perguntas > 0),
+        soma_percentual = soma_percentual - CASE WHEN OLD.total_perguntas > 0 THEN CAST(OLD.acertos AS REAL) / OLD.total_perguntas ELSE 0 END
+    WHERE plano = (SELECT plano FROM aluno WHERE id_aluno = OLD.id_aluno) AND materia = OLD.materia;
+
+    UPDATE resumo_quiz_dia SET quantidade = quantidade - 1
+    WHERE dia = date(OLD.data_criacao)
+      AND plano = (SELECT plano FROM aluno WHERE id_aluno = OLD.id_aluno)
+      AND materia = OLD.materia;
+END;
+
+/* --- Alunos por plano --- */
+CREATE TRIGGER IF NOT EXISTS trg_aluno_resumo_insert
+AFTER INSERT ON aluno
+BEGIN
+    INSERT INTO resumo_alunos_plano (plano, quantidade) VALUES (NEW.plano, 1)
+    ON CONFLICT(plano) DO UPDATE SET quantidade = quantidade + 1;
+END;
+
+/* Antes de excluir: os resultados do aluno saem dos agregados (o CASCADE já não enxerga o plano) */
+CREATE TRIGGER IF NOT EXISTS trg_aluno_resumo_delete
+BEFORE DELETE ON aluno
+BEGIN
+    UPDATE resumo_alunos_plano SET quantidade = quantidade - 1 WHERE plano = OLD.plano;
+
+    UPDATE resumo_quiz SET
+        quantidade = resumo_quiz.quantidade - d.quantidade,
+        quantidade_validos = resumo_quiz.quantidade_validos - d.validos,
+        soma_percentual = resumo_quiz.soma_percentual - d.soma
+    FROM (
+        SELECT materia, COUNT(*) AS quantidade, SUM(total_perguntas > 0) AS validos,
+               COALESCE(SUM(CASE WHEN total_perguntas > 0 THEN CAST(acertos AS REAL) / total_perguntas END), 0) AS soma
+        FROM quiz_resultado WHERE id_aluno = OLD.id_aluno GROUP BY materia
+    ) AS d
+    WHERE resumo_quiz.plano = OLD.plano AND resumo_quiz.materia = d.materia;
+
+    UPDATE resumo_quiz_dia SET quantidade = resumo_quiz_dia.quantidade - d.quantidade
+    FROM (
+        SELECT date(data_criacao) AS dia, materia, COUNT(*) AS quantidade
+        FROM quiz_resultado WHERE id_aluno = OLD.id_aluno GROUP BY date(data_criacao), materia
+    ) AS d
+    WHERE resumo_quiz_dia.dia = d.dia AND resumo_quiz_dia.plano = OLD.plano AND resumo_quiz_dia.materia = d.materia;
+END;
+
+/* Troca de plano: contagem de alunos e resultados do aluno mudam de plano */
+CREATE TRIGGER IF NOT EXISTS trg_aluno_resumo_plano
+AFTER UPDATE OF plano ON aluno
+WHEN OLD.plano != NEW.plano
+BEGIN
+    UPDATE resumo_alunos_plano SET quantidade = quantidade - 1 WHERE plano = OLD.plano;
+    INSERT INTO resumo_alunos_plano (plano, quantidade) VALUES (NEW.plano, 1)
+    ON CONFLICT(plano) DO UPDATE SET quantidade = quantidade + 1;
+
+    UPDATE resumo_quiz SET
+        quantidade = resumo_quiz.quantidade - d.quantidade,
+        quantidade_validos = resumo_quiz.quantidade_validos - d.validos,
+        soma_percentual = resumo_quiz.soma_percentual - d.soma
+    FROM (
+        SELECT materia, COUNT(*) AS quantidade, SUM(total_perguntas > 0) AS validos,
+               COALESCE(SUM(CASE WHEN total_perguntas > 0 THEN CAST(acertos AS REAL) / total_perguntas END), 0) AS soma
+        FROM quiz_resultado WHERE id_aluno = NEW.id_aluno GROUP BY materia
+    ) AS d
+    WHERE resumo_quiz.plano = OLD.plano AND resumo_quiz.materia = d.materia;
+
+    INSERT INTO resumo_quiz (plano, materia, quantidade, quantidade_validos, soma_percentual)
+    SELECT NEW.plano, materia, COUNT(*), SUM(total_perguntas > 0),
+           COALESCE(SUM(CASE WHEN total_perguntas > 0 THEN CAST(acertos AS REAL) / total_perguntas END), 0)
+    FROM quiz_resultado WHERE id_aluno = NEW.id_aluno GROUP BY materia
+    ON CONFLICT(plano, materia) DO UPDATE SET
+        quantidade = quantidade + excluded.quantidade,
+        quantidade_validos = quantidade_validos + excluded.quantidade_validos,
+        soma_percentual = soma_percentual + excluded.soma_percentual;
+
+    UPDATE resumo_quiz_dia SET quantidade = resumo_quiz_dia.quantidade - d.quantidade
+    FROM (
+        SELECT date(data_criacao) AS dia, materia, COUNT(*) AS quantidade
+        FROM quiz_resultado WHERE id_aluno = NEW.id_aluno GROUP BY date(data_criacao), materia
+    ) AS d
+    WHERE resumo_quiz_dia.dia = d.dia AND resumo_quiz_dia.plano = OLD.plano AND resumo_quiz_dia.materia = d.materia;
+
+    INSERT INTO resumo_quiz_dia (dia, plano, materia, quantidade)
+    SELECT date(data_criacao), NEW.plano, materia, COUNT(*)
+    FROM quiz_resultado WHERE id_aluno = NEW.id_aluno GROUP BY date(data_criacao), materia
+    ON CONFLICT(dia, plano, materia) DO UPDATE SET quantidade = quantidade + excluded.quantidade;
+END;
+"""
+
+
+# Listagem de alunos do admin: agregados por aluno (mantidos por triggers) e
+# busca por trecho de nome/e-mail em um índice FTS5 de trigramas
+SQL_LISTAGEM_ALUNOS = """
+CREATE TABLE IF NOT EXISTS resumo_aluno (
+    id_aluno INTEGER PRIMARY KEY,
+    total_quizzes INTEGER NOT NULL DEFAULT 0,
+    quantidade_validos INTEGER NOT NULL DEFAULT 0,
+    soma_percentual REAL NOT NULL DEFAULT 0,
+    validos_filosofia INTEGER NOT NULL DEFAULT 0,
+    soma_filosofia REAL NOT NULL DEFAULT 0,
+    validos_sociologia INTEGER NOT NULL DEFAULT 0,
+    soma_sociologia REAL NOT NULL DEFAULT 0,
+    media_geral REAL, /* soma_percentual / quantidade_validos (NULL sem resultados válidos) */
+    FOREIGN KEY(id_aluno) REFERENCES aluno(id_aluno) ON DELETE CASCADE
+);
+
+/* Ordenações da listagem (o id desempata e serve de cursor) */
+CREATE INDEX IF NOT EXISTS idx_aluno_nome ON aluno(nome, id_aluno);
+CREATE INDEX IF NOT EXISTS idx_resumo_aluno_total ON resumo_aluno(total_quizzes, id_aluno);
+CREATE INDEX IF NOT EXISTS idx_resumo_aluno_media ON resumo_aluno(IFNULL(media_geral, -1), id_aluno);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS aluno_busca USING fts5(
+    nome, email, content='aluno', content_rowid='id_aluno', tokenize='trigram'
+);
+
+/* --- Carga inicial --- */
+DELETE FROM resumo_aluno;
+INSERT INTO resumo_aluno (id_aluno, total_quizzes, quantidade_validos, soma_percentual,
+                          validos_filosofia, soma_filosofia, validos_sociologia, soma_sociologia, media_geral)
+SELECT a.id_aluno,
+       COUNT(q.id_resultado),
+       COALESCE(SUM(q.total_perguntas > 0), 0),
+       COALESCE(SUM(CASE WHEN q.total_perguntas > 0 THEN CAST(q.acertos AS REAL) / q.total_perguntas ELSE 0 END), 0),
+       COALESCE(SUM(q.materia = 'Filosofia' AND q.total_perguntas > 0), 0),
+       COALESCE(SUM(CASE WHEN q.materia = 'Filosofia' THEN CASE WHEN q.total_perguntas > 0 THEN CAST(q.acertos AS REAL) / q.total_perguntas ELSE 0 END ELSE 0 END), 0),
+       COALESCE(SUM(q.materia = 'Sociologia' AND q.total_perguntas > 0), 0),
+       COALESCE(SUM(CASE WHEN q.materia = 'Sociologia' THEN CASE WHEN q.total_perguntas > 0 THEN CAST(q.acertos AS REAL) / q.total_perguntas ELSE 0 END ELSE 0 END), 0),
+       AVG(CASE WHEN q.total_perguntas > 0 THEN CAST(q.acertos AS REAL) / q.total_perguntas END)
+FROM aluno a
+LEFT JOIN quiz_resultado q ON q.id_aluno = a.id_aluno
+GROUP BY a.id_aluno;
+
+INSERT INTO aluno_busca(aluno_busca) VALUES ('rebuild');
+
+/* --- Alunos --- */
+CREATE TRIGGER IF NOT EXISTS trg_aluno_listagem_insert
+AFTER INSERT ON aluno
+BEGIN
+    INSERT OR IGNORE INTO resumo_aluno (id_aluno) VALUES (NEW.id_aluno);
+    INSERT INTO aluno_busca (rowid, nome, email) VALUES (NEW.id_aluno, NEW.nome, NEW.email);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_aluno_listagem_delete
+AFTER DELETE ON aluno
+BEGIN
+    DELETE FROM resumo_aluno WHERE id_aluno = OLD.id_aluno;
+    INSERT INTO aluno_busca (aluno_busca, rowid, nome, email) VALUES ('delete', OLD.id_aluno, OLD.nome, OLD.email);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_aluno_listagem_update
+AFTER UPDATE OF nome, email ON aluno
+BEGIN
+    INSERT INTO aluno_busca (aluno_busca, rowid, nome, email) VALUES ('delete', OLD.id_aluno, OLD.nome, OLD.email);
+    INSERT INTO aluno_busca (rowid, nome, email) VALUES (NEW.id_aluno, NEW.nome, NEW.email);
+END;
+
+/* --- Resultados (os SETs enxergam os valores anteriores da linha) --- */
+CREATE TRIGGER IF NOT EXISTS trg_quiz_resultado_aluno_insert
+AFTER INSERT ON quiz_resultado
+BEGIN
+    UPDATE resumo_aluno SET
+        total_quizzes = total_quizzes + 1,
+        quantidade_validos = quantidade_validos + (NEW.total_perguntas > 0),
+        soma_percentual = soma_percentual + CASE WHEN NEW.total_perguntas > 0 THEN CAST(NEW.acertos AS REAL) / NEW.total_perguntas ELSE 0 END,
+        validos_filosofia = validos_filosofia + (NEW.materia = 'Filosofia' AND NEW.total_perguntas > 0),
+        soma_filosofia = soma_filosofia + CASE WHEN NEW.materia = 'Filosofia' THEN CASE WHEN NEW.total_perguntas > 0 THEN CAST(NEW.acertos AS REAL) / NEW.total_perguntas ELSE 0 END ELSE 0 END,
+        validos_sociologia = validos_sociologia + (NEW.materia = 'Sociologia' AND NEW.total_perguntas > 0),
+        soma_sociologia = soma_sociologia + CASE WHEN NEW.materia = 'Sociologia' THEN CASE WHEN NEW.total_perguntas > 0 THEN CAST(NEW.acertos AS REAL) / NEW.total_perguntas ELSE 0 END ELSE 0 END,
+        media_geral = CASE WHEN quantidade_validos + (NEW.total_perguntas > 0) > 0
+            THEN (soma_percentual + CASE WHEN NEW.total_perguntas > 0 THEN CAST(NEW.acertos AS REAL) / NEW.total_perguntas ELSE 0 END) / (quantidade_validos + (NEW.total_perguntas > 0)) END
+    WHERE id_aluno = NEW.id_aluno;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_quiz_resultado_aluno_delete
+AFTER DELETE ON quiz_resultado
+BEGIN
+    UPDATE resumo_aluno SET
+        total_quizzes = total_quizzes - 1,
+        quantidade_validos = quantidade_validos - (OLD.total_perguntas > 0),
+        soma_percentual = soma_percentual - CASE WHEN OLD.total_perguntas > 0 THEN CAST(OLD.acertos AS REAL) / OLD.total_perguntas ELSE 0 END,
+        validos_filosofia = validos_filosofia - (OLD.materia = 'Filosofia' AND OLD.total_perguntas > 0),
+        soma_filosofia = soma_filosofia - CASE WHEN OLD.materia = 'Filosofia' THEN CASE WHEN OLD.total_perguntas > 0 THEN CAST(OLD.acertos AS REAL) / OLD.total_perguntas ELSE 0 END ELSE 0 END,
+        validos_sociologia = validos_sociologia - (OLD.materia = 'Sociologia' AND OLD.total_perguntas > 0),
+        soma_sociologia = soma_sociologia - CASE WHEN OLD.materia = 'Sociologia' THEN CASE WHEN OLD.total_perguntas > 0 THEN CAST(OLD.acertos AS REAL) / OLD.total_perguntas ELSE 0 END ELSE 0 END,
+        media_geral = CASE WHEN quantidade_validos - (OLD.total_perguntas > 0) > 0
+            THEN (soma_percentual - CASE WHEN OLD.total_perguntas > 0 THEN CAST(OLD.acertos AS REAL) / OLD.total_perguntas ELSE 0 END) / (quantidade_validos - (OLD.total_perguntas > 0)) END
+    WHERE id_aluno = OLD.id_aluno;
+END;
+"""
+
+
+SQL_DOMINIO_ALUNO = """
+CREATE TABLE IF NOT EXISTS dominio_aluno (
+    id_aluno INTEGER NOT NULL,
+    materia TEXT NOT NULL,
+    tema TEXT NOT NULL, /* normalizado: minúsculas e espaços simples */
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    acertos INTEGER NOT NULL DEFAULT 0,
+    total_perguntas INTEGER NOT NULL DEFAULT 0,
+    precisao_ewma REAL NOT NULL, /* média móvel exponencial de acertos / total_perguntas */
+    ultima_tentativa DATETIME,
+    PRIMARY KEY (id_aluno, materia, tema),
+    FOREIGN KEY(id_aluno) REFERENCES aluno(id_aluno) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+
+
+def _dominio_aluno(conn):
+    """Cria a tabela de domínio e a preenche com os quizzes já feitos, em ordem cronológica"""
+    from dominio import registrar_dominio_lote
+
+    for comando in SQL_DOMINIO_ALUNO.split(';'):
+        if comando.strip():
+            conn.execute(comando)
+    conn.execute('DELETE FROM dominio_aluno')
+
+    resultados = conn.execute(
+        '''
+        SELECT id_aluno, tema, acertos, total_perguntas, data_criacao FROM (
+            SELECT id_aluno, tema, acertos, total_perguntas, data_criacao, id_resultado AS ordem
+            FROM quiz_resultado
+            UNION ALL
+            SELECT id_aluno, tema, acertos, total_perguntas, data_criacao, id_historico
+            FROM historico_premium
+            WHERE tipo_atividade = 'quiz' AND acertos IS NOT NULL AND total_perguntas > 0
+        )
+        -- Bancos antigos (sem foreign_keys) podem ter resultados de alunos já removidos
+        WHERE id_aluno IN (SELECT id_aluno FROM aluno)
+        ORDER BY data_criacao, ordem
+        '''
+    )
+    registrar_dominio_lote(conn, (tuple(r) for r in resultados))
+
+
+# Ranking semanal: pontos = soma dos acertos na semana (segunda a domingo), por
+# matéria e no geral. A semana é a segunda-feira: date(d, 'weekday 0', '-6 days')
+SQL_RANKING_SEMANAL = f"""
+CREATE TABLE IF NOT EXISTS ranking_semanal (
+    semana DATE NOT NULL,
+    materia TEXT NOT NULL, /* 'Geral' soma todas as matérias */
+    id_aluno INTEGER NOT NULL,
+    pontos INTEGER NOT NULL DEFAULT 0,
+    quizzes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (semana, materia, id_aluno),
+    FOREIGN KEY(id_aluno) REFERENCES aluno(id_aluno) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_ranking_pontos ON ranking_semanal(semana, materia, pontos DESC, id_aluno);
+
+DELETE FROM ranking_semanal;
+
+WITH resultados AS (
+    SELECT date(data_criacao, 'weekday 0', '-6 days') AS semana, materia, id_aluno, acertos
+    FROM quiz_resultado
+    UNION ALL
+    SELECT date(data_criacao, 'weekday 0', '-6 days'), {SQL_CLASSIFICAR_MATERIA}, id_aluno, acertos
+    FROM historico_premium
+    WHERE tipo_atividade = 'quiz' AND acertos IS NOT NULL AND total_perguntas > 0
+),
+placares AS (
+    SELECT semana, materia, id_aluno, acertos FROM resultados
+    UNION ALL
+    SELECT semana, 'Geral', id_aluno, acertos FROM resultados
+)
+INSERT INTO ranking_semanal (semana, materia, id_aluno, pontos, quizzes)
+SELECT semana, materia, id_aluno, SUM(acertos), COUNT(*)
+FROM placares
+WHERE semana IS NOT NULL AND id_aluno IN (SELECT id_aluno FROM aluno)
+GROUP BY semana, materia, id_aluno;
+"""
+
+
+# Jobs de geração Premium (modo assíncrono): o pedido, o estado e o resultado
+SQL_JOB_GERACAO = """
+CREATE TABLE IF NOT EXISTS job_geracao (
+    id_job TEXT PRIMARY KEY,
+    id_aluno INTEGER NOT NULL,
+    tipo TEXT NOT NULL, /* quiz | flashcard | resumo | correcao */
+    tema TEXT NOT NULL,
+    texto_original TEXT,
+    prioridade INTEGER NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendente', /* pendente | executando | concluido | erro */
+    status_http INTEGER,
+    resultado TEXT, /* JSON da mesma resposta do modo síncrono */
+    id_historico INTEGER,
+    criado_em DATETIME NOT NULL,
+    iniciado_em DATETIME,
+    concluido_em DATETIME,
+    FOREIGN KEY(id_aluno) REFERENCES aluno(id_aluno) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_geracao_estado ON job_geracao(estado, prioridade, criado_em);
+"""
+
+
+# Conteúdo pré-gerado dos temas populares/do currículo, servido antes de chamar o Gemini
+SQL_CONTEUDO_PRONTO = """
+CREATE TABLE IF NOT EXISTS conteudo_pronto (
+    tipo TEXT NOT NULL, /* quiz | flashcard | resumo */
+    tema_normalizado TEXT NOT NULL,
+    tema TEXT NOT NULL,
+    origem TEXT NOT NULL, /* popular | curriculo */
+    conteudo TEXT, /* NULL até a primeira geração */
+    gerado_em DATETIME,
+    expira_em DATETIME,
+    reservado_ate DATETIME, /* outro worker gerando, ou tema recusado pela IA */
+    servido INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tipo, tema_normalizado)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_historico_premium_data ON historico_premium(data_criacao);
+"""
+
+
+# (versão, descrição, SQL ou função(conn)) — sempre idempotentes e em ordem crescente
+MIGRATIONS = [
+    (1, "Schema base", SQL_SCHEMA_BASE),
+    (2, "Coluna versao em chat_transcricao", _coluna_versao_transcricao),
+    (3, "Índices das consultas das rotas", SQL_INDICES_CONSULTAS),
+    (4, "Coluna materia em quiz_resultado", _coluna_materia_quiz),
+    (5, "Agregados do dashboard do admin", SQL_RESUMOS_DASHBOARD),
+    (6, "Listagem paginada e busca de alunos", SQL_LISTAGEM_ALUNOS),
+    (7, "Domínio do aluno por matéria e tema", _dominio_aluno),
+    (8, "Ranking semanal por matéria", SQL_RANKING_SEMANAL),
+    (9, "Jobs de geração Premium", SQL_JOB_GERACAO),
+    (10, "Conteúdo Premium pré-gerado", SQL_CONTEUDO_PRONTO),
+]
+
+
+def versao_atual(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def _comandos(script):
+    """Divide um script SQL em comandos, sem quebrar o corpo dos triggers"""
+    comandos, atual = [], ''
+    for linha in script.splitlines(keepends=True):
+        atual += linha
+        if sqlite3.complete_statement(atual):
+            comandos.append(atual)
+            atual = ''
+    if atual.strip():
+        comandos.append(atual)
+    return comandos
+
+
+def migrar(conn):
+    """
+    Aplica as migrações pendentes
+
+    Cada uma roda em BEGIN IMMEDIATE junto com a atualização de user_version;
+    se falhar, nada dela fica no banco e as seguintes não são aplicadas. A versão
+    é relida depois de obter o lock: com vários processos subindo juntos, quem
+    esperou pelo lock pula a migração que o outro acabou de aplicar.
+
+    Returns:
+        int: Versão do schema ao final
+    """
+    for versao, descricao, passo in MIGRATIONS:
+        if versao <= versao_atual(conn):
+            continue
+
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            if versao <= versao_atual(conn):
+                conn.rollback()
+                continue
+
+            if callable(passo):
+                passo(conn)
+            else:
+                # executescript faria COMMIT antes de começar; os comandos vão um a um na mesma transação
+                for comando in _comandos(passo):
+                    conn.execute(comando)
+            conn.execute(f'PRAGMA user_version = {versao}')
+            conn.commit()
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"❌ Erro na migração {versao} ({descricao}): {e}")
+            raise
+
+        print(f"🗄️ Migração {versao} aplicada: {descricao}")
+
+    return versao_atual(conn)
+
+
+# ============================================
+# VERIFICAÇÃO DOS PLANOS DE CONSULTA
+# ============================================
+
+# (descrição, SQL com os mesmos filtros usados nas rotas, tabelas em que um SCAN é esperado)
+CONSULTAS_VERIFICADAS = [
+    ("auth.login (aluno e admin)",
+     "SELECT 'aluno', id_aluno, senha FROM Aluno WHERE LOWER(email) = ? "
+     "UNION ALL SELECT 'admin', id_admin, senha FROM Admin WHERE LOWER(email) = ?", ()),
+    ("auth.email_ja_existe",
+     "SELECT id_aluno FROM Aluno WHERE LOWER(email) = ?", ()),
+    ("utils.get_user_plan",
+     "SELECT plano FROM Aluno WHERE id_aluno = ?", ()),
+    ("admin.get_resultados_aluno",
+     "SELECT tema, acertos, total_perguntas, data_criacao FROM quiz_resultado WHERE id_aluno = ? ORDER BY data_criacao DESC", ()),
+    ("admin.get_alunos (ordem=nome, página seguinte)",
+     "SELECT a.id_aluno, r.media_geral FROM Aluno a JOIN resumo_aluno r ON r.id_aluno = a.id_aluno "
+     "WHERE (a.nome, a.id_aluno) > (?, ?) ORDER BY a.nome, a.id_aluno LIMIT ?", ()),
+    ("admin.get_alunos (ordem=total_quizzes)",
+     "SELECT a.id_aluno FROM Aluno a JOIN resumo_aluno r ON r.id_aluno = a.id_aluno "
+     "ORDER BY r.total_quizzes DESC, r.id_aluno DESC LIMIT ?", ()),
+    ("admin.get_alunos (ordem=media_geral)",
+     "SELECT a.id_aluno FROM Aluno a JOIN resumo_aluno r ON r.id_aluno = a.id_aluno "
+     "ORDER BY IFNULL(r.media_geral, -1) DESC, r.id_aluno DESC LIMIT ?", ()),
+    ("admin.get_alunos (busca)",
+     "SELECT a.id_aluno FROM Aluno a JOIN resumo_aluno r ON r.id_aluno = a.id_aluno "
+     "WHERE a.id_aluno IN (SELECT rowid FROM aluno_busca WHERE aluno_busca MATCH ?) ORDER BY a.nome, a.id_aluno LIMIT ?",
+     ("a",)),
+    ("admin.get_admin_stats (totais)",
+     "SELECT plano, materia, quantidade, quantidade_validos, soma_percentual FROM resumo_quiz", ("resumo_quiz",)),
+    ("admin.get_admin_stats (últimos 7 dias)",
+     "SELECT plano, materia, SUM(quantidade) FROM resumo_quiz_dia WHERE dia >= ? GROUP BY plano, materia", ()),
+    ("quiz.progresso",
+     "SELECT materia, tema, tentativas FROM dominio_aluno WHERE id_aluno = ? ORDER BY materia, precisao_ewma", ()),
+    ("quiz.ranking (topo)",
+     "SELECT r.id_aluno, a.nome, r.pontos FROM ranking_semanal r JOIN aluno a ON a.id_aluno = r.id_aluno "
+     "WHERE r.semana = ? AND r.materia = ? ORDER BY r.pontos DESC, r.id_aluno LIMIT ?", ()),
+    ("quiz.ranking (alunos ultrapassados)",
+     "SELECT id_aluno FROM ranking_semanal WHERE semana = ? AND materia = ? AND pontos >= ? AND pontos < ? "
+     "AND id_aluno != ? LIMIT ?", ()),
+    ("premium.jobs (retomar pendentes)",
+     "SELECT id_job, prioridade FROM job_geracao WHERE estado = 'pendente' ORDER BY prioridade, criado_em", ()),
+    ("pregeracao.popularidade",
+     "SELECT tipo_atividade, tema, COUNT(*) FROM historico_premium WHERE data_criacao >= ? "
+     "AND tipo_atividade IN ('quiz', 'flashcard', 'resumo') GROUP BY tipo_atividade, tema", ()),
+    ("premium.conteudo_pronto",
+     "SELECT conteudo FROM conteudo_pronto WHERE tipo = ? AND tema_normalizado = ? AND expira_em > ?", ()),
+    ("premium.get_historico",
+     "SELECT id_historico, tipo_atividade, tema, data_criacao FROM historico_premium WHERE id_aluno = ? ORDER BY data_criacao DESC", ()),
+    ("premium.get_historico_item",
+     "SELECT * FROM historico_premium WHERE id_historico = ? AND id_aluno = ?", ()),
+]
+
+
+def verificar_planos(conn):
+    """
+    Roda EXPLAIN QUERY PLAN nas consultas das rotas
+
+    Returns:
+        list: (descrição, ok, detalhes do plano); ok é False quando alguma tabela
+        não esperada é lida por completo (SCAN sem índice)
+    """
+    resultado = []
+    for descricao, sql, scans_esperados in CONSULTAS_VERIFICADAS:
+        parametros = [None] * sql.count('?')
+        plano = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', parametros)]
+        ok = True
+        for detalhe in plano:
+            if detalhe.startswith('SCAN ') and ' INDEX ' not in detalhe:
+                tabela = detalhe.split()[1]
+                if tabela not in scans_esperados:
+                    ok = False
+        resultado.append((descricao, ok, plano))
+    return resultado
+
+
+if __name__ == "__main__":
+    from config import get_db_connection
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit(1)
+
+    versao = migrar(conn)
+    print(f"Schema na versão {versao}.")
+
+    if '--plano' in sys.argv:
+        falhas = 0
+        for descricao, ok, plano in verificar_planos(conn):
+            print(f"{'✅' if ok else '❌'} {descricao}")
+            for detalhe in plano:
+                print(f"     {detalhe}")
+            falhas += not ok
+        conn.close()
+        sys.exit(1 if falhas else 0)
+
+    conn.close()
@@ -0,0 +1,339 @@
+"""
+Pré-geração dos temas Premium mais pedidos
+Nas horas de pouco movimento, e só com folga de quota nas chaves, gera quiz,
+flashcards e resumo dos temas mais pedidos em historico_premium e dos temas do
+currículo, e guarda o texto na tabela conteudo_pronto. As rotas de geração servem
+esse conteúdo na hora, sem chamar o Gemini, mesmo no primeiro pedido do dia
+"""
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+import os
+import sqlite3
+
+from admissao import Sobrecarga
+from config import pool
+from tarefas import iniciar_em_segundo_plano, pausar
+from utils import normalizar_tema
+
+TIPOS_PREGERADOS = ('quiz', 'flashcard', 'resumo')
+
+# Temas do currículo do Ensino Médio (PREGERACAO_CURRICULO="tema;tema;..." substitui)
+TEMAS_CURRICULO = (
+    'Mito e Filosofia',
+    'Pré-socráticos',
+    'Sócrates e a maiêutica',
+    'Platão e o mundo das ideias',
+    'Ética de Aristóteles',
+    'Contratualismo',
+    'Ética kantiana',
+    'Utilitarismo',
+    'Existencialismo',
+    'Karl Marx e a luta de classes',
+    'Émile Durkheim e o fato social',
+    'Max Weber e a ação social',
+    'Indústria cultural',
+    'Cidadania e direitos humanos',
+)
+
+SQL_POPULARIDADE = """
+SELECT tipo_atividade, tema, COUNT(*) AS pedidos
+FROM historico_premium
+WHERE data_criacao >= ? AND tipo_atividade IN ('quiz', 'flashcard', 'resumo')
+GROUP BY tipo_atividade, tema
+"""
+
+# Só um worker (de qualquer processo) reserva cada (tipo, tema) por vez
+SQL_RESERVAR = """
+INSERT INTO conteudo_pronto (tipo, tema_normalizado, tema, origem, reservado_ate)
+VALUES (:tipo, :tema_normalizado, :tema, :origem, :reservado_ate)
+ON CONFLICT(tipo, tema_normalizado) DO UPDATE SET reservado_ate = excluded.reservado_ate
+WHERE reservado_ate IS NULL OR reservado_ate < :agora
+RETURNING tipo
+"""
+
+
+def carregar_curriculo(texto=None):
+    texto = os.getenv('PREGERACAO_CURRICULO', '') if texto is None else texto
+    temas = [tema.strip() for tema in texto.split(';') if tema.strip()]
+    return temas or list(TEMAS_CURRICULO)
+
+
+def carregar_horario(texto=None):
+    """'2-6' -> (2, 6): das 2h às 6h (aceita virar a meia-noite, ex.: '23-5')"""
+    texto = os.getenv('PREGERACAO_HORARIO', '2-6') if texto is None else texto
+    try:
+        inicio, fim = (int(hora) % 24 for hora in texto.split('-'))
+        return inicio, fim
+    except ValueError:
+        print(f"⚠️ PREGERACAO_HORARIO inválido: '{texto}' (usando 2-6)")
+        return 2, 6
+
+
+class PreGeracao:
+    def __init__(self, gerar, recusado, key_manager=None, admissao=None, intervalo=None, max_por_dia=None):
+        """
+        Inicializa o agendador
+
+        Args:
+            gerar: Função (tipo, tema) -> texto gerado, ou None se a chamada falhou
+            recusado: Função (tipo, texto) -> True se a IA recusou o tema
+            key_manager: APIKeyManager (só gera quando há folga de quota)
+            admissao: Admissao das chamadas ao Gemini (só gera com vagas sobrando)
+            intervalo: Segundos entre as rodadas
+            max_por_dia: Gerações por dia neste processo
+        """
+        self.gerar = gerar
+        self.recusado = recusado
+        self.key_manager = key_manager
+        self.admissao = admissao
+        self.habilitada = os.getenv('PREGERACAO_ATIVA', '1') != '0'
+        self.intervalo = intervalo or int(os.getenv('PREGERACAO_INTERVALO', 600))
+        self.max_por_dia = max_por_dia or int(os.getenv('PREGERACAO_MAX_DIA', 60))
+        self.max_por_rodada = int(os.getenv('PREGERACAO_POR_RODADA', 5))
+        self.max_populares = int(os.getenv('PREGERACAO_MAX_TEMAS', 10))
+        self.janela_dias = int(os.getenv('PREGERACAO_JANELA_DIAS', 14))
+        self.validade = timedelta(hours=int(os.getenv('PREGERACAO_VALIDADE_HORAS', 30)))
+        self.horario = carregar_horario()
+        self.curriculo = carregar_curriculo()
+
+        self._app = None
+        self._tarefa = None
+        # Dia -> gerações feitas (orçamento diário)
+        self._geradas = {}
+        # (tipo, tema_normalizado) -> vezes servido ainda não gravadas
+        self._servidos = {}
+        self._acertos = 0
+        self._falhas = 0
+        self._ultima_rodada = None
+
+    def init_app(self, app):
+        self._app = app
+        app.config['PREGERACAO'] = self
+
+    # ============================================
+    # CONSULTA (ROTAS)
+    # ============================================
+
+    def buscar(self, tipo, tema):
+        """Texto pronto e dentro da validade do (tipo, tema), ou None"""
+        if tipo not in TIPOS_PREGERADOS:
+            return None
+        chave = (tipo, normalizar_tema(tema))
+        with pool.conexao() as conn:
+            linha = conn.execute(
+                'SELECT conteudo FROM conteudo_pronto WHERE tipo = ? AND tema_normalizado = ? AND expira_em > ?',
+                (*chave, datetime.now())
+            ).fetchone()
+        if linha is None or linha['conteudo'] is None:
+            return None
+
+        self._servidos[chave] = self._servidos.get(chave, 0) + 1
+        self._acertos += 1
+        return linha['conteudo']
+
+    # ============================================
+    # AGENDADOR
+    # ============================================
+
+    def em_horario_tranquilo(self, agora=None):
+        hora = (agora or datetime.now()).hour
+        inicio, fim = self.horario
+        if inicio <= fim:
+            return inicio <= hora < fim
+        return hora >= inicio or hora < fim
+
+    def _com_folga(self):
+        """Chaves sem 429 recentes e a admissão sem fila nem metade das vagas ocupada"""
+        if self.key_manager is not None and not self.key_manager.has_spare_quota():
+            return False
+        if self.admissao is not None:
+            uso = self.admissao.estatisticas()
+            if uso['na_fila'] or uso['em_andamento'] >= uso['max_simultaneas'] // 2:
+                return False
+        return True
+
+    def candidatos(self, conn, agora):
+        """
+        (tipo, tema, origem) a gerar: os mais pedidos na janela e depois os do currículo,
+        sem os que ainda estão válidos por mais de meia validade ou estão reservados
+
+        Returns:
+            list: em ordem de prioridade
+        """
+        desde = agora - timedelta(days=self.janela_dias)
+        pedidos = {}
+        for linha in conn.execute(SQL_POPULARIDADE, (desde,)):
+            chave = (linha['tipo_atividade'], normalizar_tema(linha['tema']))
+            total, tema = pedidos.get(chave, (0, ' '.join(linha['tema'].split())))
+            pedidos[chave] = (total + linha['pedidos'], tema)
+
+        populares = sorted(pedidos.items(), key=lambda item: -item[1][0])[:self.max_populares]
+        fila = [(tipo, tema, 'popular') for (tipo, _), (_, tema) in populares]
+        fila += [(tipo, tema, 'curriculo') for tema in self.curriculo for tipo in TIPOS_PREGERADOS]
+
+        existentes = {
+            (linha['tipo'], linha['tema_normalizado']): linha
+            for linha in conn.execute('SELECT tipo, tema_normalizado, expira_em, reservado_ate FROM conteudo_pronto')
+        }
+        renovar_antes = str(agora + self.validade / 2)
+        resultado = []
+        vistos = set()
+        for tipo, tema, origem in fila:
+            chave = (tipo, normalizar_tema(tema))
+            if chave in vistos:
+                continue
+            vistos.add(chave)
+            existente = existentes.get(chave)
+            if existente is not None:
+                if existente['expira_em'] and existente['expira_em'] > renovar_antes:
+                    continue
+                if existente['reservado_ate'] and existente['reservado_ate'] > str(agora):
+                    continue
+            resultado.append((tipo, tema, origem))
+        return resultado
+
+    def rodada(self, agora=None):
+        """
+        Gera o que couber nesta rodada (fora do horário tranquilo ou sem folga, nada)
+
+        Returns:
+            int: Conteúdos gerados e gravados
+        """
+        agora = agora or datetime.now()
+        self._ultima_rodada = agora
+        self._gravar_servidos()
+        if not self.habilitada or not self.em_horario_tranquilo(agora):
+            return 0
+
+        dia = agora.date().isoformat()
+        self._geradas = {dia: self._geradas.get(dia, 0)}
+        with pool.conexao() as conn:
+            candidatos = self.candidatos(conn, agora)
+
+        gravados = 0
+        tentativas = 0
+        for tipo, tema, origem in candidatos:
+            if tentativas >= self.max_por_rodada or self._geradas[dia] >= self.max_por_dia or not self._com_folga():
+                break
+            if not self._reservar(tipo, tema, origem):
+                continue
+
+            tentativas += 1
+            self._geradas[dia] += 1
+            try:
+                gerado = self._gerar_com_vaga(tipo, tema)
+            except Sobrecarga:
+                # Apareceu movimento: libera a reserva e deixa para a próxima rodada
+                self._liberar(tipo, tema, None)
+                break
+            except Exception as e:
+                print(f"⚠️ Falha na pré-geração ({tipo}, '{tema}'): {e}")
+                gerado = None
+
+            if gerado is None:
+                self._falhas += 1
+                self._liberar(tipo, tema, None)
+            elif self.recusado(tipo, gerado):
+                # Tema fora do escopo: não tenta de novo durante a janela de popularidade
+                self._liberar(tipo, tema, datetime.now() + timedelta(days=self.janela_dias))
+            else:
+                self._gravar(tipo, tema, gerado)
+                gravados += 1
+
+        if gravados:
+            print(f"📦 Pré-geração: {gravados} conteúdo(s) pronto(s)")
+        return gravados
+
+    def _gerar_com_vaga(self, tipo, tema):
+        """Gera com uma vaga da admissão (_com_folga já viu vagas sobrando; Sobrecarga sobe)"""
+        with self._app.app_context():
+            with self.admissao.vaga() if self.admissao else nullcontext():
+                return self.gerar(tipo, tema)
+
+    def _reservar(self, tipo, tema, origem):
+        agora = datetime.now()
+        parametros = {
+            'tipo': tipo,
+            'tema_normalizado': normalizar_tema(tema),
+            'tema': tema,
+            'origem': origem,
+            'reservado_ate': agora + timedelta(seconds=self.intervalo),
+            'agora': agora
+        }
+        with pool.conexao() as conn:
+            try:
+                reservado = conn.execute(SQL_RESERVAR, parametros).fetchone()
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Erro ao reservar pré-geração: {e}")
+                return False
+        return reservado is not None
+
+    def _liberar(self, tipo, tema, reservado_ate):
+        with pool.conexao() as conn:
+            conn.execute(
+                'UPDATE conteudo_pronto SET reservado_ate = ? WHERE tipo = ? AND tema_normalizado = ?',
+                (reservado_ate, tipo, normalizar_tema(tema))
+            )
+            conn.commit()
+
+    def _gravar(self, tipo, tema, gerado):
+        agora = datetime.now()
+        with pool.conexao() as conn:
+            conn.execute(
+                '''
+                UPDATE conteudo_pronto
+                SET tema = ?, conteudo = ?, gerado_em = ?, expira_em = ?, reservado_ate = NULL
+                WHERE tipo = ? AND tema_normalizado = ?
+                ''', (tema, gerado, agora, agora + self.validade, tipo, normalizar_tema(tema))
+            )
+            conn.commit()
+
+    def _gravar_servidos(self):
+        """Soma em conteudo_pronto.servido os acertos contados em memória"""
+        if not self._servidos:
+            return
+        servidos, self._servidos = self._servidos, {}
+        with pool.conexao() as conn:
+            try:
+                conn.executemany(
+                    'UPDATE conteudo_pronto SET servido = servido + ? WHERE tipo = ? AND tema_normalizado = ?',
+                    [(vezes, tipo, tema) for (tipo, tema), vezes in servidos.items()]
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Erro ao gravar acertos da pré-geração: {e}")
+                conn.rollback()
+
+    def _laco(self):
+        while True:
+            pausar(self.intervalo)
+            try:
+                self.rodada()
+            except Exception as e:
+                print(f"❌ Erro na rodada de pré-geração: {e}")
+
+    def iniciar(self):
+        """Inicia (uma única vez) as rodadas periódicas em segundo plano"""
+        if self._tarefa is None and self.habilitada:
+            self._tarefa = iniciar_em_segundo_plano(self._laco)
+        return self._tarefa
+
+    def estatisticas(self):
+        try:
+            with pool.conexao() as conn:
+                prontos = conn.execute(
+                    'SELECT COUNT(*) FROM conteudo_pronto WHERE expira_em > ?', (datetime.now(),)
+                ).fetchone()[0]
+        except sqlite3.Error:
+            prontos = None
+        return {
+            'habilitada': self.habilitada,
+            'horario': f"{self.horario[0]}h-{self.horario[1]}h",
+            'prontos': prontos,
+            'geradas_hoje': sum(self._geradas.values()),
+            'max_por_dia': self.max_por_dia,
+            'servidos': self._acertos,
+            'falhas': self._falhas,
+            'ultima_rodada': self._ultima_rodada.isoformat(timespec='seconds') if self._ultima_rodada else None
+        }
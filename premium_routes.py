@@ -1,10 +1,13 @@
 from flask import Blueprint, request, jsonify, session, current_app
-from utils import get_user_plan
+from utils import get_user_plan, validar_placar
 from api_key_manager import generate_with_retry
+from admissao import Sobrecarga, com_admissao, resposta_sobrecarga
 import google.generativeai as genai
 import os
 import datetime
-from config import conn, cursor
+from config import get_db
+from dominio import registrar_dominio
+from ranking import registrar_ranking, publicar_ranking
 import json
 
 premium_bp = Blueprint('premium_bp', __name__, url_prefix='/premium')
@@ -18,6 +21,20 @@ def check_premium_access(id_aluno):
         return jsonify({'error': 'Esta funcionalidade é exclusiva para usuários Premium.'}), 403
     return None
 
+def check_usage_limit(id_aluno, prompt):
+    """Aplica o limite diário do aluno antes de qualquer chamada ao Gemini"""
+    ledger = current_app.config['USAGE_LEDGER']
+    excedido = ledger.reservar(id_aluno, prompt)
+    if excedido:
+        response = jsonify({'error': 'Limite diário de uso Premium atingido. Tente novamente amanhã.', 'uso': excedido})
+        response.headers['Retry-After'] = str(excedido['retry_after'])
+        return response, 429
+    return None
+
+def estornar_uso(id_aluno, prompt):
+    """Devolve ao aluno a reserva de uma geração que falhou ou não chegou a ser feita"""
+    current_app.config['USAGE_LEDGER'].estornar(id_aluno, prompt)
+
 def check_premium_session():
     if 'id_aluno' not in session:
         return jsonify({'error': 'Usuário não logado.'}), 401
@@ -25,21 +42,10 @@ def check_premium_session():
         return jsonify({'error': 'Acesso negado. Funcionalidade Premium.'}), 403
     return None
 
-@premium_bp.route('/quiz', methods=['POST'])
-def quiz_premium():
-    data = request.get_json()
-    id_aluno = data.get('id_aluno')
-    
-    auth_error = check_premium_access(id_aluno)
-    if auth_error:
-        return auth_error
+# --- Prompts de cada geração (iguais no modo síncrono e nos jobs) ---
 
-    if 'tema' not in data:
-        return jsonify({'error': 'O campo "tema" é obrigatório para usuários Premium.'}), 400
-    
-    tema = data['tema']
-    
-    prompt = f"""
+def prompt_quiz(tema, texto=None):
+    return f"""
 Você é um Validador Acadêmico Rígido e Professor de Filosofia/Sociologia.
 Sua tarefa é analisar o tema: '{tema}'
 
@@ -71,40 +77,212 @@ Estrutura obrigatória do JSON de sucesso:
 
 Retorne APENAS o JSON (de erro ou de sucesso). Sem markdown, sem ```.
 """
-    
+
+def prompt_flashcard(tema, texto=None):
+    return f"""
+Analise o tema: '{tema}'.
+
+REGRA ABSOLUTA DE BLOQUEIO:
+Se este tema for sobre Matemática, Física, Química, Biologia, Esportes, Entretenimento, ou se contiver linguagem vulgar/obscena, PARE IMEDIATAMENTE.
+Não tente encontrar "o lado filosófico" de um tema que não é filosofia (ex: não aceite "Filosofia da Geometria" ou "Sociologia do Neymar").
+
+Se o tema for inválido, escreva APENAS: 
+NÃO É POSSIVEL FORMAR UMA RESPOSTA DEVIDO A INADEQUAÇÃO DO ASSUNTO.
+
+Se o tema for VÁLIDO (Filosofia ou Sociologia acadêmica), gere 12 flashcards seguindo o formato:
+Pergunta: [pergunta] Resposta: [resposta curta]
+"""
+
+def prompt_resumo(tema, texto=None):
+    return f"""
+Atue como um filtro acadêmico rigoroso. Tema solicitado: '{tema}'.
+
+CREITÉRIO DE REJEIÇÃO IMEDIATA:
+1. O tema é claramente parte do currículo de Filosofia ou Sociologia do Ensino Médio ou Superior?
+2. O tema NÃO é de Exatas, Biológicas, Tecnológicas ou Cultura Pop?
+3. O tema está livre de termos ofensivos ou obscenos?
+
+Se a resposta para qualquer pergunta for "NÃO", retorne APENAS:
+NÃO É POSSIVEL FORMAR UMA RESPOSTA DEVIDO A INADEQUAÇÃO DO ASSUNTO.
+
+Se todas as respostas forem "SIM", gere um resumo acadêmico de 4 a 6 parágrafos sobre '{tema}' e retorne somente o resumo sem mostar a resposta de nehum critério.
+"""
+
+def prompt_correcao(tema, texto):
+    return f"""
+Você é um corretor de provas de Filosofia e Sociologia.
+Analise o tema: '{tema}' e o texto '{texto} do aluno.
+
+CRITÉRIO DE REJEIÇÃO IMEDIATA:
+1. Se o tema ou o texto tratarem de Matemática, Física, Biologia, Química ou assuntos do cotidiano sem base filosófica teórica, REJEITE.
+2. Se houver linguagem obscena, REJEITE.
+
+Em caso de rejeição, responda APENAS:
+NÃO É POSSIVEL FORMAR UMA RESPOSTA DEVIDO A INADEQUAÇÃO DO ASSUNTO.
+
+Caso contrário, forneça um feedback de até 3 parágrafos corrigindo conceitos filosóficos/sociológicos.
+"""
+
+PROMPTS = {
+    'quiz': prompt_quiz,
+    'flashcard': prompt_flashcard,
+    'resumo': prompt_resumo,
+    'correcao': prompt_correcao,
+}
+
+MENSAGENS_FALHA = {
+    'quiz': "Não foi possível gerar o quiz após várias tentativas.",
+    'flashcard': "Não foi possível gerar os flashcards após várias tentativas.",
+    'resumo': "Não foi possível gerar o resumo após várias tentativas.",
+    'correcao': "Não foi possível gerar a correção após várias tentativas.",
+}
+
+ERROS_IA = {
+    'quiz': "Erro ao gerar quiz com IA",
+    'flashcard': "Erro ao gerar flashcards com IA",
+}
+
+def salvar_historico(id_aluno, tipo, tema, conteudo, texto_original=None):
+    """Grava a geração em historico_premium; retorna o id_historico (None se falhar)"""
+    conn = get_db()
     try:
-        key_manager = current_app.config['KEY_MANAGER']
-        texto = generate_with_retry(key_manager, prompt, MODEL_NAME)
-        
-        if texto is None:
-            return jsonify({"erro": "Não foi possível gerar o quiz após várias tentativas."}), 500
-        
+        cursor = conn.execute(
+            'INSERT INTO historico_premium (id_aluno, tipo_atividade, tema, conteudo_gerado, texto_original, data_criacao) VALUES (?, ?, ?, ?, ?, ?)',
+            (id_aluno, tipo, tema, conteudo, texto_original, datetime.datetime.now())
+        )
+        conn.commit()
+        return cursor.lastrowid
+    except Exception as e:
+        print(f"Erro ao salvar historico ({tipo}): {e}")
+        conn.rollback()
+        return None
+
+# Início da resposta de recusa pedida nos prompts de flashcard, resumo e correção
+RESPOSTA_INADEQUADA = "NÃO É POSSIVEL FORMAR UMA RESPOSTA"
+
+def gerar_texto(tipo, tema, texto=None):
+    """Texto gerado pelo Gemini para o tipo (o quiz sem markdown), ou None se todas as tentativas falharam"""
+    key_manager = current_app.config['KEY_MANAGER']
+    gerado = generate_with_retry(key_manager, PROMPTS[tipo](tema, texto), MODEL_NAME)
+    if gerado is not None and tipo == 'quiz':
         # Limpeza básica caso a IA mande markdown
-        texto = texto.replace("```json", "").replace("```", "").strip()
-        
-        # --- CORREÇÃO IMPORTANTE AQUI ---
-        # Tenta ler o JSON para ver se a IA retornou o erro de inadequação
-        try:
-            json_response = json.loads(texto)
-            if "erro" in json_response:
-                return jsonify({"erro": "Tema inadequado. Por favor, insira um tema estritamente de Filosofia ou Sociologia."}), 400
-        except json.JSONDecodeError:
-            # Se não for JSON válido, segue o fluxo (pode ser erro da IA, mas não bloqueamos aqui)
-            pass
-        except Exception:
-            pass
-            
-        return jsonify({"assunto": tema, "contedo": texto})
-    
+        gerado = gerado.replace("```json", "").replace("```", "").strip()
+    return gerado
+
+def tema_recusado(tipo, gerado):
+    """True se a IA recusou o tema (JSON de erro no quiz, frase de inadequação nos demais)"""
+    if tipo != 'quiz':
+        return RESPOSTA_INADEQUADA in gerado
+    # Tenta ler o JSON para ver se a IA retornou o erro de inadequação
+    try:
+        return "erro" in json.loads(gerado)
+    except Exception:
+        # Se não for JSON válido, segue o fluxo (pode ser erro da IA, mas não bloqueamos aqui)
+        return False
+
+def montar_resposta(tipo, tema, gerado, texto=None):
+    """Corpo da resposta de sucesso de cada rota de geração"""
+    if tipo == 'correcao':
+        return {"texto_original": texto, "correcao": gerado}
+    if tipo == 'resumo':
+        return {"assunto": tema, "conteudo": gerado}
+    return {"assunto": tema, "contedo": gerado}
+
+def gerar_conteudo(tipo, id_aluno, tema, texto=None):
+    """
+    Gera o conteúdo no Gemini e o grava no histórico (o quiz é gravado só quando
+    respondido, em /quiz/salvar_completo). Usada pelas rotas e pelos jobs; o uso
+    do aluno já deve ter sido reservado, e é estornado se a geração falhar
+
+    Returns:
+        (resposta, status, id_historico): corpo e status HTTP da resposta da rota
+    """
+    gerado = None
+    try:
+        gerado = gerar_texto(tipo, tema, texto)
+        current_app.config['USAGE_LEDGER'].registrar_saida(id_aluno, gerado)
+
+        if gerado is None:
+            estornar_uso(id_aluno, PROMPTS[tipo](tema, texto))
+            return {"erro": MENSAGENS_FALHA[tipo]}, 500, None
+
+        if tipo == 'quiz':
+            if tema_recusado(tipo, gerado):
+                return {"erro": "Tema inadequado. Por favor, insira um tema estritamente de Filosofia ou Sociologia."}, 400, None
+            return montar_resposta(tipo, tema, gerado), 200, None
+
+        id_historico = salvar_historico(id_aluno, tipo, tema, gerado, texto)
+        return montar_resposta(tipo, tema, gerado, texto), 200, id_historico
+
     except Exception as e:
-        print(f"Erro ao gerar quiz: {e}")
-        return jsonify({"erro": f"Erro ao gerar quiz com IA: {str(e)}"}), 500
+        print(f"Erro ao gerar {tipo}: {e}")
+        if gerado is None:
+            estornar_uso(id_aluno, PROMPTS[tipo](tema, texto))
+        erro = f"{ERROS_IA[tipo]}: {str(e)}" if tipo in ERROS_IA else str(e)
+        return {"erro": erro}, 500, None
+
+def servir_pronto(tipo, id_aluno, tema):
+    """Resposta com o conteúdo pré-gerado do tema, se houver (sem Gemini, sem gastar o uso do aluno)"""
+    pregeracao = current_app.config.get('PREGERACAO')
+    if pregeracao is None:
+        return None
+    gerado = pregeracao.buscar(tipo, tema)
+    if gerado is None:
+        return None
+
+    if tipo != 'quiz':
+        salvar_historico(id_aluno, tipo, tema, gerado)
+    return jsonify(montar_resposta(tipo, tema, gerado))
+
+@com_admissao
+def gerar_agora(tipo, id_aluno, tema, texto=None):
+    """Modo síncrono: a requisição espera a geração (com vaga na admissão)"""
+    limite_erro = check_usage_limit(id_aluno, PROMPTS[tipo](tema, texto))
+    if limite_erro:
+        return limite_erro
+
+    resposta, status, _ = gerar_conteudo(tipo, id_aluno, tema, texto)
+    return jsonify(resposta), status
+
+def enfileirar_job(tipo, id_aluno, tema, texto=None):
+    """Modo assíncrono: grava o job e responde 202 com o id, sem esperar o Gemini"""
+    jobs = current_app.config['JOBS']
+    try:
+        jobs.verificar_fila()
+    except Sobrecarga as e:
+        return resposta_sobrecarga(e)
 
-@premium_bp.route('/flashcard', methods=['POST'])
-def flashcard_premium():
+    prompt = PROMPTS[tipo](tema, texto)
+    limite_erro = check_usage_limit(id_aluno, prompt)
+    if limite_erro:
+        return limite_erro
+
+    try:
+        id_job = jobs.enfileirar(tipo, id_aluno, tema, texto)
+    except Exception:
+        estornar_uso(id_aluno, prompt)
+        raise
+    url = f"{premium_bp.url_prefix}/jobs/{id_job}"
+    response = jsonify({'id_job': id_job, 'estado': 'pendente', 'posicao': jobs.posicao(id_job), 'url': url})
+    response.status_code = 202
+    response.headers['Location'] = url
+    return response
+
+def gerar(tipo, data, id_aluno, tema, texto=None):
+    pronto = servir_pronto(tipo, id_aluno, tema)
+    if pronto is not None:
+        return pronto
+    if data.get('assincrono'):
+        return enfileirar_job(tipo, id_aluno, tema, texto)
+    return gerar_agora(tipo, id_aluno, tema, texto)
+
+# --- Rotas de geração ("assincrono": true no corpo ativa o modo job) ---
+
+@premium_bp.route('/quiz', methods=['POST'])
+def quiz_premium():
     data = request.get_json()
     id_aluno = data.get('id_aluno')
-
+    
     auth_error = check_premium_access(id_aluno)
     if auth_error:
         return auth_error
@@ -112,44 +290,21 @@ def flashcard_premium():
     if 'tema' not in data:
         return jsonify({'error': 'O campo "tema" é obrigatório para usuários Premium.'}), 400
     
-    tema = data['tema']
-    prompt = f"""
-Analise o tema: '{tema}'.
+    return gerar('quiz', data, id_aluno, data['tema'])
 
-REGRA ABSOLUTA DE BLOQUEIO:
-Se este tema for sobre Matemática, Física, Química, Biologia, Esportes, Entretenimento, ou se contiver linguagem vulgar/obscena, PARE IMEDIATAMENTE.
-Não tente encontrar "o lado filosófico" de um tema que não é filosofia (ex: não aceite "Filosofia da Geometria" ou "Sociologia do Neymar").
+@premium_bp.route('/flashcard', methods=['POST'])
+def flashcard_premium():
+    data = request.get_json()
+    id_aluno = data.get('id_aluno')
 
-Se o tema for inválido, escreva APENAS: 
-NÃO É POSSIVEL FORMAR UMA RESPOSTA DEVIDO A INADEQUAÇÃO DO ASSUNTO.
+    auth_error = check_premium_access(id_aluno)
+    if auth_error:
+        return auth_error
 
-Se o tema for VÁLIDO (Filosofia ou Sociologia acadêmica), gere 12 flashcards seguindo o formato:
-Pergunta: [pergunta] Resposta: [resposta curta]
-"""
-    try:
-        # --- USA O GERENCIADOR DE CHAVES ---
-        key_manager = current_app.config['KEY_MANAGER']
-        texto = generate_with_retry(key_manager, prompt, MODEL_NAME)
-        
-        if texto is None:
-            return jsonify({"erro": "Não foi possível gerar os flashcards após várias tentativas."}), 500
-        
-        # Salva no histórico
-        try:
-            cursor.execute(
-                'INSERT INTO historico_premium (id_aluno, tipo_atividade, tema, conteudo_gerado, data_criacao) VALUES (?, ?, ?, ?, ?)',
-                (id_aluno, 'flashcard', tema, texto, datetime.datetime.now())
-            )
-            conn.commit()
-        except Exception as e:
-            print(f"Erro ao salvar historico (flashcard): {e}")
-            conn.rollback()
-
-        return jsonify({"assunto": tema, "contedo": texto})
+    if 'tema' not in data:
+        return jsonify({'error': 'O campo "tema" é obrigatório para usuários Premium.'}), 400
     
-    except Exception as e:
-        print(f"Erro ao gerar flashcards: {e}")
-        return jsonify({"erro": f"Erro ao gerar flashcards com IA: {str(e)}"}), 500
+    return gerar('flashcard', data, id_aluno, data['tema'])
 
 
 @premium_bp.route('/resumo', methods=['POST'])
@@ -164,44 +319,7 @@ def resumo():
     if 'tema' not in data:
         return jsonify({'error': 'O campo "tema" é obrigatório.'}), 400
     
-    tema = data['tema']
-    prompt = f"""
-Atue como um filtro acadêmico rigoroso. Tema solicitado: '{tema}'.
-
-CREITÉRIO DE REJEIÇÃO IMEDIATA:
-1. O tema é claramente parte do currículo de Filosofia ou Sociologia do Ensino Médio ou Superior?
-2. O tema NÃO é de Exatas, Biológicas, Tecnológicas ou Cultura Pop?
-3. O tema está livre de termos ofensivos ou obscenos?
-
-Se a resposta para qualquer pergunta for "NÃO", retorne APENAS:
-NÃO É POSSIVEL FORMAR UMA RESPOSTA DEVIDO A INADEQUAÇÃO DO ASSUNTO.
-
-Se todas as respostas forem "SIM", gere um resumo acadêmico de 4 a 6 parágrafos sobre '{tema}' e retorne somente o resumo sem mostar a resposta de nehum critério.
-"""
-    try:
-        # --- USA O GERENCIADOR DE CHAVES ---
-        key_manager = current_app.config['KEY_MANAGER']
-        texto = generate_with_retry(key_manager, prompt, MODEL_NAME)
-        
-        if texto is None:
-            return jsonify({"erro": "Não foi possível gerar o resumo após várias tentativas."}), 500
-        
-        # Salva no histórico
-        try:
-            cursor.execute(
-                'INSERT INTO historico_premium (id_aluno, tipo_atividade, tema, conteudo_gerado, data_criacao) VALUES (?, ?, ?, ?, ?)',
-                (id_aluno, 'resumo', tema, texto, datetime.datetime.now())
-            )
-            conn.commit()
-        except Exception as e:
-            print(f"Erro ao salvar historico (resumo): {e}")
-            conn.rollback()
-        
-        return jsonify({"assunto": tema, "conteudo": texto})
-    
-    except Exception as e:
-        print(f"Erro ao gerar resumo: {e}")
-        return jsonify({"erro": str(e)}), 500
+    return gerar('resumo', data, id_aluno, data['tema'])
 
 @premium_bp.route('/correcao', methods=['POST'])
 def correcao():
@@ -215,45 +333,19 @@ def correcao():
     if 'tema' not in data or 'texto' not in data:
         return jsonify({'error': 'Os campos "tema" e "texto" são obrigatórios.'}), 400
 
-    tema = data['tema']
-    texto = data['texto']
-    prompt = f"""
-Você é um corretor de provas de Filosofia e Sociologia.
-Analise o tema: '{tema}' e o texto '{texto} do aluno.
+    return gerar('correcao', data, id_aluno, data['tema'], data['texto'])
 
-CRITÉRIO DE REJEIÇÃO IMEDIATA:
-1. Se o tema ou o texto tratarem de Matemática, Física, Biologia, Química ou assuntos do cotidiano sem base filosófica teórica, REJEITE.
-2. Se houver linguagem obscena, REJEITE.
+@premium_bp.route('/jobs/<id_job>', methods=['GET'])
+def get_job(id_job):
+    auth_error = check_premium_session()
+    if auth_error:
+        return auth_error
 
-Em caso de rejeição, responda APENAS:
-NÃO É POSSIVEL FORMAR UMA RESPOSTA DEVIDO A INADEQUAÇÃO DO ASSUNTO.
+    job = current_app.config['JOBS'].consultar(id_job)
+    if job is None or job['id_aluno'] != session['id_aluno']:
+        return jsonify({'error': 'Job não encontrado ou não pertence a você.'}), 404
 
-Caso contrário, forneça um feedback de até 3 parágrafos corrigindo conceitos filosóficos/sociológicos.
-"""
-    try:
-        # --- USA O GERENCIADOR DE CHAVES ---
-        key_manager = current_app.config['KEY_MANAGER']
-        texto_corrigido = generate_with_retry(key_manager, prompt, MODEL_NAME)
-        
-        if texto_corrigido is None:
-            return jsonify({"erro": "Não foi possível gerar a correção após várias tentativas."}), 500
-        
-        # Salva no histórico
-        try:
-            cursor.execute(
-                'INSERT INTO historico_premium (id_aluno, tipo_atividade, tema, conteudo_gerado, texto_original, data_criacao) VALUES (?, ?, ?, ?, ?, ?)',
-                (id_aluno, 'correcao', tema, texto_corrigido, texto, datetime.datetime.now())
-            )
-            conn.commit()
-        except Exception as e:
-            print(f"Erro ao salvar historico (correcao): {e}")
-            conn.rollback()
-        
-        return jsonify({"texto_original": texto, "correcao": texto_corrigido})
-    
-    except Exception as e:
-        print(f"Erro ao corrigir texto: {e}")
-        return jsonify({"erro": str(e)}), 500
+    return jsonify(job)
 
 @premium_bp.route('/quiz/salvar_completo', methods=['POST'])
 def salvar_quiz_premium_completo():
@@ -264,6 +356,9 @@ def salvar_quiz_premium_completo():
     if auth_error:
         return auth_error
         
+    conn = get_db()
+    cursor = conn.cursor()
+    
     try:
         tema = data.get('tema')
         acertos = data.get('acertos')
@@ -274,15 +369,24 @@ def salvar_quiz_premium_completo():
         if not all([tema, acertos is not None, total_perguntas, conteudo_gerado, respostas_usuario]):
              return jsonify({'error': 'Dados incompletos para salvar o quiz.'}), 400
 
+        try:
+            acertos, total_perguntas = validar_placar(acertos, total_perguntas)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        agora = datetime.datetime.now()
         cursor.execute(
             """
             INSERT INTO historico_premium 
             (id_aluno, tipo_atividade, tema, conteudo_gerado, acertos, total_perguntas, respostas_usuario, data_criacao) 
             VALUES (?, 'quiz', ?, ?, ?, ?, ?, ?)
             """,
-            (id_aluno, tema, conteudo_gerado, acertos, total_perguntas, respostas_usuario, datetime.datetime.now())
+            (id_aluno, tema, conteudo_gerado, acertos, total_perguntas, respostas_usuario, agora)
         )
+        registrar_dominio(conn, id_aluno, tema, acertos, total_perguntas, agora)
+        mudancas_ranking = registrar_ranking(conn, id_aluno, tema, acertos, agora)
         conn.commit()
+        publicar_ranking(id_aluno, mudancas_ranking)
         return jsonify({'message': 'Resultado do quiz salvo no histórico premium.'}), 201
 
     except Exception as e:
@@ -290,6 +394,17 @@ def salvar_quiz_premium_completo():
         conn.rollback()
         return jsonify({"error": f"Erro interno ao salvar quiz: {e}"}), 500
 
+@premium_bp.route('/uso/<int:id_aluno>', methods=['GET'])
+def get_uso(id_aluno):
+    auth_error = check_premium_session()
+    if auth_error:
+        return auth_error
+
+    if session['id_aluno'] != id_aluno:
+        return jsonify({'error': 'Acesso não autorizado ao uso de outro usuário.'}), 403
+
+    return jsonify(current_app.config['USAGE_LEDGER'].consultar(id_aluno))
+
 @premium_bp.route('/historico/<int:id_aluno>', methods=['GET'])
 def get_historico(id_aluno):
     auth_error = check_premium_session()
@@ -299,6 +414,9 @@ def get_historico(id_aluno):
     if session['id_aluno'] != id_aluno:
         return jsonify({'error': 'Acesso não autorizado ao histórico de outro usuário.'}), 403
 
+    conn = get_db()
+    cursor = conn.cursor()
+    
     try:
         cursor.execute(
             """
@@ -331,6 +449,9 @@ def get_historico_item(item_id):
     
     id_aluno_sessao = session['id_aluno']
     
+    conn = get_db()
+    cursor = conn.cursor()
+    
     try:
         cursor.execute(
             "SELECT * FROM historico_premium WHERE id_historico = ? AND id_aluno = ?",
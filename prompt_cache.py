@@ -0,0 +1,164 @@
+"""
+Cache do prompt fixo do tutor
+Usa o Context Caching do Gemini para não reenviar (e repagar) as instruções do
+tutor a cada mensagem. Quando o cache não está disponível (prompt abaixo do
+mínimo do modelo, chave sem suporte, erro), cai para o system_instruction
+comum e passa a contabilizar os tokens de instrução reenviados
+"""
+from datetime import datetime, timedelta
+import os
+
+import google.generativeai as genai
+from google.generativeai import caching
+
+from tarefas import novo_lock_de_thread
+
+
+class PromptCache:
+    def __init__(self, model_name, system_instruction, key_manager=None, ttl=None):
+        """
+        Args:
+            model_name: Modelo do tutor (o cache só vale para esse modelo)
+            system_instruction: Texto fixo das instruções
+            key_manager: APIKeyManager (o cache pertence ao projeto da chave usada)
+            ttl: Duração (segundos) de cada cache criado no Gemini
+        """
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.key_manager = key_manager
+        self.ttl = ttl or int(os.getenv('CHAT_CACHE_TTL', 3600))
+        self.habilitado = os.getenv('CHAT_CONTEXT_CACHE', '1') != '0'
+        # Menor conteúdo que o Gemini aceita em cache (1024 tokens no gemini-2.5-flash);
+        # abaixo disso o create sempre falha e nem é tentado
+        self.min_tokens = int(os.getenv('CHAT_CACHE_MIN_TOKENS', 1024))
+
+        # nome da chave -> {'cache', 'expira_em'} ou {'falhou_em'}
+        self._caches = {}
+        # Chaves com um create em andamento (feito fora do lock)
+        self._criando = set()
+        self._lock = novo_lock_de_thread()
+        self._tokens_instrucao = None
+
+        self._metricas = {
+            'turnos': 0,
+            'turnos_com_cache': 0,
+            'tokens_prompt': 0,
+            'tokens_em_cache': 0,
+            'tokens_instrucao_reenviados': 0
+        }
+
+    def _nome_chave(self):
+        if self.key_manager and self.key_manager.keys_data.get('keys'):
+            return self.key_manager.get_current_key()['name']
+        return 'default'
+
+    def _cache_da_chave(self, key_entry=None):
+        """Retorna o CachedContent válido da chave (padrão: a atual), criando-o se preciso"""
+        if not self.habilitado:
+            return None
+        if key_entry is not None and self.key_manager and key_entry is not self.key_manager.get_current_key():
+            # O create e o from_cached_content usam a chave global do genai.configure:
+            # o cache só serve para a chave atual
+            return None
+        if self.tokens_instrucao() < self.min_tokens:
+            print(f"ℹ️ Instruções do tutor ({self.tokens_instrucao()} tokens) abaixo do mínimo do "
+                  f"context cache ({self.min_tokens}): usando system_instruction")
+            self.habilitado = False
+            return None
+
+        nome = self._nome_chave()
+        agora = datetime.now()
+        with self._lock:
+            entrada = self._caches.get(nome)
+            if entrada:
+                if entrada.get('cache') and entrada['expira_em'] > agora:
+                    return entrada['cache']
+                if entrada.get('falhou_em') and agora - entrada['falhou_em'] < timedelta(hours=1):
+                    # Não insiste a cada mensagem depois de uma falha
+                    return None
+            if nome in self._criando:
+                # Outra thread já está criando: este turno segue sem cache em vez de esperar
+                return None
+            self._criando.add(nome)
+
+        # A criação é uma chamada de rede: fora do lock, para não travar os turnos das outras chaves
+        try:
+            cache = caching.CachedContent.create(
+                model=f"models/{self.model_name}",
+                display_name="repensei-tutor-socratico",
+                system_instruction=self.system_instruction,
+                ttl=timedelta(seconds=self.ttl)
+            )
+        except Exception as e:
+            print(f"⚠️ Context cache indisponível para a chave '{nome}' (usando fallback local): {e}")
+            with self._lock:
+                self._caches[nome] = {'falhou_em': agora}
+                self._criando.discard(nome)
+            return None
+
+        with self._lock:
+            self._criando.discard(nome)
+            entrada = self._caches.get(nome)
+            if entrada and entrada.get('cache') and entrada['expira_em'] > datetime.now():
+                # Outro cache válido foi gravado enquanto este era criado: fica o primeiro
+                return entrada['cache']
+            # Renova um pouco antes de o Gemini expirar o cache
+            self._caches[nome] = {'cache': cache, 'expira_em': agora + timedelta(seconds=self.ttl * 0.9)}
+        print(f"🧠 Context cache criado para a chave '{nome}': {cache.name}")
+        return cache
+
+    def obter_modelo(self, key_entry=None):
+        """
+        Modelo do tutor: a partir do cache quando possível, senão com system_instruction
+
+        Args:
+            key_entry: Chave escolhida pelo APIKeyManager para o turno (padrão: a global)
+        """
+        cache = self._cache_da_chave(key_entry)
+        if cache is not None:
+            return genai.GenerativeModel.from_cached_content(cached_content=cache)
+        if key_entry is not None and self.key_manager:
+            return self.key_manager.model_for_key(key_entry, self.model_name, system_instruction=self.system_instruction)
+        return genai.GenerativeModel(self.model_name, system_instruction=self.system_instruction)
+
+    def tokens_instrucao(self):
+        """Tamanho (tokens) das instruções, contado uma vez pelo Gemini ou estimado"""
+        if self._tokens_instrucao is None:
+            try:
+                model = genai.GenerativeModel(self.model_name)
+                self._tokens_instrucao = model.count_tokens(self.system_instruction).total_tokens
+            except Exception:
+                self._tokens_instrucao = max(1, len(self.system_instruction) // 4)
+        return self._tokens_instrucao
+
+    def registrar_uso(self, usage_metadata):
+        """Contabiliza os tokens de um turno (usage_metadata da resposta do Gemini)"""
+        if usage_metadata is None:
+            return
+        em_cache = getattr(usage_metadata, 'cached_content_token_count', 0) or 0
+        with self._lock:
+            self._metricas['turnos'] += 1
+            self._metricas['tokens_prompt'] += getattr(usage_metadata, 'prompt_token_count', 0) or 0
+            if em_cache:
+                self._metricas['turnos_com_cache'] += 1
+                self._metricas['tokens_em_cache'] += em_cache
+        if not em_cache:
+            # Fallback: as instruções foram reenviadas integralmente neste turno
+            tokens = self.tokens_instrucao()
+            with self._lock:
+                self._metricas['tokens_instrucao_reenviados'] += tokens
+
+    def metricas(self):
+        with self._lock:
+            metricas = dict(self._metricas)
+            caches_ativos = sorted(nome for nome, e in self._caches.items() if e.get('cache'))
+        turnos = metricas['turnos'] or 1
+        metricas.update({
+            'habilitado': self.habilitado,
+            'min_tokens': self.min_tokens,
+            'caches_ativos': caches_ativos,
+            'tokens_instrucao': self._tokens_instrucao,
+            'tokens_economizados_por_turno': round(metricas['tokens_em_cache'] / turnos, 1),
+            'overhead_instrucao_por_turno': round(metricas['tokens_instrucao_reenviados'] / turnos, 1)
+        })
+        return metricas
@@ -1,6 +1,9 @@
-from flask import Blueprint, request, jsonify, session
-from config import conn, cursor
-from utils import get_user_plan # Precisamos para verificar o ID do aluno
+from flask import Blueprint, request, jsonify, session, current_app
+import sqlite3
+from config import get_db
+from dominio import registrar_dominio, progresso_aluno
+from ranking import registrar_ranking, publicar_ranking, semana_de, MATERIAS_RANKING, MATERIA_GERAL
+from utils import aluno_existe, classificar_materia, invalidar_estatisticas, validar_placar
 import datetime # IMPORTAR PARA CORRIGIR O BUG
 
 quiz_bp = Blueprint('quiz_bp', __name__, url_prefix='/quiz')
@@ -16,22 +19,105 @@ def salvar_resultado():
 
     if not id_aluno or not tema or acertos is None or not total_perguntas:
         return jsonify({'error': 'Dados incompletos para salvar o resultado.'}), 400
+
+    try:
+        acertos, total_perguntas = validar_placar(acertos, total_perguntas)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Verificação simples se o aluno existe
-    # (get_user_plan retorna 'freemium' como padrão, então a verificação
-    # de 'is None' pode não funcionar como esperado se o aluno não existir.
-    # Uma verificação de existência real seria melhor, mas mantendo a lógica original:)
-    if get_user_plan(id_aluno) is None: # Esta verificação pode precisar de ajuste
-        return jsonify({'error': 'Aluno não encontrado.'}), 404
+    try:
+        if not aluno_existe(id_aluno):
+            return jsonify({'error': 'Aluno não encontrado.'}), 404
+    except sqlite3.Error as e:
+        print(f"Erro ao verificar aluno do resultado do quiz: {e}")
+        return jsonify({'error': f'Erro interno ao salvar resultado: {e}'}), 500
 
+    conn = get_db()
+    cursor = conn.cursor()
+    
     try:
         # CORREÇÃO DE BUG: Adicionado data_criacao ao INSERT
         cursor.execute(
-            'INSERT INTO quiz_resultado (id_aluno, tema, acertos, total_perguntas, data_criacao) VALUES (?, ?, ?, ?, ?)',
-            (id_aluno, tema, acertos, total_perguntas, data_hoje) # Passa a data
+            'INSERT INTO quiz_resultado (id_aluno, tema, materia, acertos, total_perguntas, data_criacao) VALUES (?, ?, ?, ?, ?, ?)',
+            (id_aluno, tema, classificar_materia(tema), acertos, total_perguntas, data_hoje) # Passa a data
         )
+        # Domínio por matéria/tema atualizado na mesma transação
+        registrar_dominio(conn, id_aluno, tema, acertos, total_perguntas, data_hoje)
+        mudancas_ranking = registrar_ranking(conn, id_aluno, tema, acertos, data_hoje)
         conn.commit()
+        invalidar_estatisticas()
+        publicar_ranking(id_aluno, mudancas_ranking)
         return jsonify({'message': 'Resultado do quiz salvo com sucesso.'}), 201
     except Exception as e:
         print(f"Erro ao salvar resultado do quiz: {e}")
-        return jsonify({'error': f'Erro interno ao salvar resultado: {e}'}), 500
\ No newline at end of file
+        conn.rollback()
+        return jsonify({'error': f'Erro interno ao salvar resultado: {e}'}), 500
+
+
+@quiz_bp.route('/progresso/<int:id_aluno>', methods=['GET'])
+def progresso(id_aluno):
+    """Domínio do aluno por matéria e tema (do tema mais fraco para o mais forte)"""
+    if session.get('id_aluno') != id_aluno and 'admin_id' not in session:
+        return jsonify({'error': 'Acesso não autorizado ao progresso de outro usuário.'}), 403
+
+    conn = get_db()
+
+    try:
+        return jsonify({'id_aluno': id_aluno, 'materias': progresso_aluno(conn, id_aluno)})
+    except Exception as e:
+        print(f"Erro ao buscar progresso do aluno: {e}")
+        return jsonify({'error': f'Erro interno ao buscar progresso: {e}'}), 500
+
+
+RANKING_LIMITE_MAXIMO = 100
+
+
+def _parametros_ranking():
+    """(materia, semana) da query string; ValueError com a mensagem para o cliente"""
+    materia = (request.args.get('materia') or MATERIA_GERAL).strip().capitalize()
+    if materia not in MATERIAS_RANKING:
+        raise ValueError(f"Matéria inválida. Use uma de: {', '.join(MATERIAS_RANKING)}")
+    try:
+        semana = semana_de(request.args.get('semana') or datetime.date.today())
+    except ValueError:
+        raise ValueError("semana deve estar no formato AAAA-MM-DD")
+    return materia, semana
+
+
+@quiz_bp.route('/ranking', methods=['GET'])
+def ranking_topo():
+    """Primeiros colocados da semana (?materia=, ?semana=, ?limit=)"""
+    if 'id_aluno' not in session and 'admin_id' not in session:
+        return jsonify({'error': 'Usuário não autenticado.'}), 401
+
+    try:
+        materia, semana = _parametros_ranking()
+        limite = min(max(int(request.args.get('limit', 10)), 1), RANKING_LIMITE_MAXIMO)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        topo = current_app.config['RANKING'].topo(get_db(), materia, semana, limite)
+        return jsonify({'semana': semana, 'materia': materia, 'ranking': topo})
+    except Exception as e:
+        print(f"Erro ao buscar ranking: {e}")
+        return jsonify({'error': f'Erro interno ao buscar ranking: {e}'}), 500
+
+
+@quiz_bp.route('/ranking/<int:id_aluno>', methods=['GET'])
+def ranking_aluno(id_aluno):
+    """Posição do aluno na semana (?materia=, ?semana=)"""
+    if session.get('id_aluno') != id_aluno and 'admin_id' not in session:
+        return jsonify({'error': 'Acesso não autorizado ao ranking de outro usuário.'}), 403
+
+    try:
+        materia, semana = _parametros_ranking()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        posicao = current_app.config['RANKING'].posicao(id_aluno, materia, semana)
+        return jsonify({'id_aluno': id_aluno, 'semana': semana, 'materia': materia, **posicao})
+    except Exception as e:
+        print(f"Erro ao buscar posição no ranking: {e}")
+        return jsonify({'error': f'Erro interno ao buscar posição no ranking: {e}'}), 500
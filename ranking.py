@@ -0,0 +1,266 @@
+"""
+Ranking semanal dos alunos (por matéria e geral)
+A pontuação da semana (soma dos acertos) fica na tabela ranking_semanal, atualizada
+a cada quiz salvo. A posição de um aluno sai de uma árvore de Fenwick em memória
+com a quantidade de alunos por pontuação, sem ordenar o placar a cada consulta
+"""
+from datetime import date, datetime, timedelta
+import os
+import time
+
+from flask import current_app
+
+from config import pool
+from utils import MATERIAS, classificar_materia
+
+MATERIA_GERAL = 'Geral'
+MATERIAS_RANKING = MATERIAS + ('Outros', MATERIA_GERAL)
+
+# Maior árvore de Fenwick por placar (pontuações acima dividem o último índice)
+RANKING_MAX_ARVORE = int(os.getenv('RANKING_MAX_ARVORE', 4096))
+
+SQL_REGISTRAR_RANKING = """
+INSERT INTO ranking_semanal (semana, materia, id_aluno, pontos, quizzes)
+VALUES (?, ?, ?, ?, 1)
+ON CONFLICT(semana, materia, id_aluno) DO UPDATE SET
+    pontos = pontos + excluded.pontos,
+    quizzes = quizzes + 1
+RETURNING pontos
+"""
+
+
+def semana_de(data):
+    """Segunda-feira da semana (ISO) de uma data, como 'AAAA-MM-DD'"""
+    if isinstance(data, str):
+        data = date.fromisoformat(data[:10])
+    elif isinstance(data, datetime):
+        data = data.date()
+    return (data - timedelta(days=data.weekday())).isoformat()
+
+
+def registrar_ranking(conn, id_aluno, tema, acertos, data):
+    """
+    Soma os acertos à semana do aluno na matéria do tema e no ranking geral
+    (na transação do chamador, sem commit)
+
+    Returns:
+        list: (semana, materia, pontos, ganho) de cada placar alterado, para Ranking.atualizar
+    """
+    semana = semana_de(data)
+    ganho = int(acertos or 0)
+    mudancas = []
+    for materia in (classificar_materia(tema), MATERIA_GERAL):
+        pontos = conn.execute(SQL_REGISTRAR_RANKING, (semana, materia, id_aluno, ganho)).fetchone()[0]
+        mudancas.append((semana, materia, pontos, ganho))
+    return mudancas
+
+
+def publicar_ranking(id_aluno, mudancas):
+    """Leva as mudanças já gravadas ao ranking em memória do app (e avisa os alunos afetados)"""
+    ranking = current_app.config.get('RANKING')
+    if ranking is None:
+        return
+    try:
+        ranking.atualizar(id_aluno, mudancas)
+    except Exception as e:
+        # O resultado já foi salvo; o placar se corrige na próxima recarga
+        print(f"⚠️ Falha ao atualizar ranking em memória: {e}")
+
+
+class ArvoreFenwick:
+    """Contagens por índice (0..tamanho-1) com soma de prefixo e atualização em O(log n)"""
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._arvore = [0] * (tamanho + 1)
+
+    def somar(self, indice, delta):
+        if indice < 0:
+            raise ValueError(f"Índice negativo na árvore de Fenwick: {indice}")
+        i = indice + 1
+        while i <= self.tamanho:
+            self._arvore[i] += delta
+            i += i & -i
+
+    def prefixo(self, indice):
+        """Soma das contagens de 0 até indice (inclusive)"""
+        if indice < 0:
+            raise ValueError(f"Índice negativo na árvore de Fenwick: {indice}")
+        i = min(indice + 1, self.tamanho)
+        total = 0
+        while i > 0:
+            total += self._arvore[i]
+            i -= i & -i
+        return total
+
+
+class _Placar:
+    """
+    Pontos de cada aluno em uma (semana, matéria), indexados por pontuação
+
+    A árvore cobre as pontuações até tamanho_maximo - 1; as maiores dividem o
+    último índice, e a posição de quem está nele é contada direto no dicionário
+    (só os poucos alunos com pontuação tão alta pagam a contagem linear)
+    """
+
+    def __init__(self, pontos_por_aluno, tamanho_maximo=None):
+        self.pontos = dict(pontos_por_aluno)
+        self.tamanho_maximo = tamanho_maximo or RANKING_MAX_ARVORE
+        self.carregado_em = time.monotonic()
+        self._reconstruir(max(self.pontos.values(), default=0) + 1)
+
+    def _indice(self, pontos):
+        # Pontuações negativas (bancos antigos) contam como 0
+        return min(max(pontos, 0), self.arvore.tamanho - 1)
+
+    def _reconstruir(self, tamanho):
+        self.arvore = ArvoreFenwick(min(max(tamanho, 64), self.tamanho_maximo))
+        for pontos in self.pontos.values():
+            self.arvore.somar(self._indice(pontos), 1)
+
+    def definir(self, id_aluno, pontos):
+        anterior = self.pontos.get(id_aluno)
+        if anterior is not None:
+            self.arvore.somar(self._indice(anterior), -1)
+        self.pontos[id_aluno] = pontos
+        if self.tamanho_maximo > self.arvore.tamanho <= pontos:
+            # Dobra a capacidade (até o máximo); a nova pontuação já entra na reconstrução
+            self._reconstruir(2 * pontos)
+        else:
+            self.arvore.somar(self._indice(pontos), 1)
+
+    def posicao(self, id_aluno):
+        """1 + alunos com mais pontos (empatados dividem a posição) ou None"""
+        pontos = self.pontos.get(id_aluno)
+        if pontos is None:
+            return None
+        if self._indice(pontos) == self.arvore.tamanho - 1:
+            return 1 + sum(1 for outros in self.pontos.values() if outros > pontos)
+        return 1 + len(self.pontos) - self.arvore.prefixo(self._indice(pontos))
+
+
+class Ranking:
+    def __init__(self, ao_mudar=None, recarga=None, max_avisos=None):
+        """
+        Inicializa o ranking em memória
+
+        Args:
+            ao_mudar: Função(id_aluno, dados) chamada quando a posição de um aluno muda
+            recarga: Segundos até um placar ser relido do banco (escritas de outros workers)
+            max_avisos: Máximo de alunos ultrapassados avisados por quiz salvo
+        """
+        self.ao_mudar = ao_mudar
+        self.recarga = recarga or int(os.getenv('RANKING_RECARGA', 60))
+        self.max_avisos = max_avisos or int(os.getenv('RANKING_MAX_AVISOS', 50))
+
+        # (semana, materia) -> _Placar
+        self._placares = {}
+        self._carregamentos = 0
+
+    def _placar(self, semana, materia):
+        chave = (semana, materia)
+        placar = self._placares.get(chave)
+        if placar is not None and time.monotonic() - placar.carregado_em < self.recarga:
+            return placar
+
+        with pool.conexao() as conn:
+            linhas = conn.execute(
+                'SELECT id_aluno, pontos FROM ranking_semanal WHERE semana = ? AND materia = ?',
+                chave
+            ).fetchall()
+
+        # Descarta placares vencidos de outras semanas/matérias
+        agora = time.monotonic()
+        for outra in [c for c, p in self._placares.items() if agora - p.carregado_em >= self.recarga]:
+            del self._placares[outra]
+
+        placar = _Placar((linha['id_aluno'], linha['pontos']) for linha in linhas)
+        self._placares[chave] = placar
+        self._carregamentos += 1
+        return placar
+
+    def posicao(self, id_aluno, materia, semana):
+        """
+        Returns:
+            dict: posicao (None se o aluno não pontuou na semana), pontos e participantes
+        """
+        placar = self._placar(semana, materia)
+        return {
+            'posicao': placar.posicao(id_aluno),
+            'pontos': placar.pontos.get(id_aluno, 0),
+            'participantes': len(placar.pontos)
+        }
+
+    def topo(self, conn, materia, semana, limite):
+        """Os limite primeiros da semana (pelo índice de pontos, sem ordenar a tabela)"""
+        linhas = conn.execute(
+            '''
+            SELECT r.id_aluno, a.nome, a.url_foto, r.pontos, r.quizzes
+            FROM ranking_semanal r
+            JOIN aluno a ON a.id_aluno = r.id_aluno
+            WHERE r.semana = ? AND r.materia = ?
+            ORDER BY r.pontos DESC, r.id_aluno
+            LIMIT ?
+            ''', (semana, materia, limite)
+        ).fetchall()
+
+        resultado = []
+        for i, linha in enumerate(linhas):
+            empatado = resultado and resultado[-1]['pontos'] == linha['pontos']
+            resultado.append({
+                'posicao': resultado[-1]['posicao'] if empatado else i + 1,
+                'id_aluno': linha['id_aluno'],
+                'nome': linha['nome'],
+                'url_foto': linha['url_foto'],
+                'pontos': linha['pontos'],
+                'quizzes': linha['quizzes']
+            })
+        return resultado
+
+    def atualizar(self, id_aluno, mudancas):
+        """
+        Aplica as pontuações já gravadas por registrar_ranking e avisa quem mudou de posição:
+        o próprio aluno e quem ele alcançou ou ultrapassou (pontos entre o antigo e o novo)
+        """
+        for semana, materia, pontos, ganho in mudancas:
+            placar = self._placares.get((semana, materia))
+            if placar is not None:
+                placar.definir(id_aluno, pontos)
+            else:
+                placar = self._placar(semana, materia)
+
+            if not ganho or self.ao_mudar is None:
+                continue
+
+            self.ao_mudar(id_aluno, self._dados(placar, id_aluno, semana, materia))
+
+            with pool.conexao() as conn:
+                ultrapassados = conn.execute(
+                    '''
+                    SELECT id_aluno FROM ranking_semanal
+                    WHERE semana = ? AND materia = ? AND pontos >= ? AND pontos < ? AND id_aluno != ?
+                    LIMIT ?
+                    ''', (semana, materia, pontos - ganho, pontos, id_aluno, self.max_avisos)
+                ).fetchall()
+            for linha in ultrapassados:
+                self.ao_mudar(linha['id_aluno'], self._dados(placar, linha['id_aluno'], semana, materia))
+
+    def _dados(self, placar, id_aluno, semana, materia):
+        return {
+            'semana': semana,
+            'materia': materia,
+            'posicao': placar.posicao(id_aluno),
+            'pontos': placar.pontos.get(id_aluno, 0),
+            'participantes': len(placar.pontos)
+        }
+
+    def invalidar(self):
+        """Descarta os placares em memória (ex.: após uma importação em massa)"""
+        self._placares.clear()
+
+    def estatisticas(self):
+        return {
+            'placares_em_memoria': len(self._placares),
+            'carregamentos': self._carregamentos,
+            'recarga': self.recarga
+        }
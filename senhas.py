@@ -0,0 +1,137 @@
+# comando para medir o login no custo atual: python senhas.py [concorrência] [logins]
+"""
+Hash de senhas com scrypt (hashlib, sem dependências extras)
+O custo é configurável por variáveis de ambiente. A verificação roda no pool de
+threads (executar_bloqueante) para não travar o hub do eventlet; senhas antigas em
+texto puro continuam aceitas e são trocadas pelo hash no primeiro login
+"""
+import base64
+import hashlib
+import hmac
+import os
+
+from tarefas import executar_bloqueante
+
+PREFIXO = 'scrypt'
+SCRYPT_N = int(os.getenv('SENHA_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.getenv('SENHA_SCRYPT_R', 8))
+SCRYPT_P = int(os.getenv('SENHA_SCRYPT_P', 1))
+TAMANHO_SAL = 16
+TAMANHO_HASH = 32
+
+
+def _b64(dados):
+    return base64.b64encode(dados).decode('ascii')
+
+
+def _scrypt(senha, sal, n, r, p):
+    return hashlib.scrypt(
+        str(senha).encode('utf-8'), salt=sal, n=n, r=r, p=p,
+        maxmem=128 * r * (n + p + 2) + 1024 * 1024, dklen=TAMANHO_HASH
+    )
+
+
+def e_hash(valor):
+    """True se o valor gravado já está no formato scrypt$n$r$p$sal$hash"""
+    return isinstance(valor, str) and valor.startswith(PREFIXO + '$')
+
+
+def gerar_hash(senha):
+    """Hash da senha no custo atual (lento de propósito: chame via executar_bloqueante)"""
+    sal = os.urandom(TAMANHO_SAL)
+    digest = _scrypt(senha, sal, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{PREFIXO}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(sal)}${_b64(digest)}"
+
+
+def verificar_senha(senha, armazenada):
+    """
+    Compara a senha com o valor gravado (hash ou texto puro legado)
+
+    Returns:
+        (ok, precisa_rehash): precisa_rehash é True para texto puro ou hash com custo antigo
+    """
+    if not armazenada:
+        _gastar_scrypt(senha)
+        return False, False
+
+    if not e_hash(armazenada):
+        # Mesmo custo de um hash real: o tempo de resposta não revela contas com senha legada
+        _gastar_scrypt(senha)
+        return hmac.compare_digest(str(senha).encode('utf-8'), armazenada.encode('utf-8')), True
+
+    try:
+        _, n, r, p, sal, digest = armazenada.split('$')
+        n, r, p = int(n), int(r), int(p)
+        esperado = base64.b64decode(digest)
+        calculado = _scrypt(senha, base64.b64decode(sal), n, r, p)
+    except (ValueError, TypeError) as e:
+        print(f"⚠️ Hash de senha inválido no banco: {e}")
+        return False, False
+
+    ok = hmac.compare_digest(calculado, esperado)
+    return ok, ok and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+# Usado quando o e-mail não existe (ou a senha gravada é legada), para a resposta levar o mesmo tempo
+_SAL_FICTICIO = os.urandom(TAMANHO_SAL)
+
+
+def _gastar_scrypt(senha):
+    """Um scrypt no custo atual cujo resultado é descartado"""
+    _scrypt(senha, _SAL_FICTICIO, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+def verificar_sem_usuario(senha):
+    """Gasta o mesmo tempo de uma verificação real (não revela se o e-mail existe)"""
+    _gastar_scrypt(senha)
+    return False, False
+
+
+def hash_fora_do_hub(senha):
+    return executar_bloqueante(gerar_hash, senha)
+
+
+def verificar_fora_do_hub(senha, armazenada):
+    if armazenada is None:
+        return executar_bloqueante(verificar_sem_usuario, senha)
+    return executar_bloqueante(verificar_senha, senha, armazenada)
+
+
+if __name__ == "__main__":
+    # Simula o servidor: logins simultâneos em green-threads, verificação no tpool,
+    # e um "tique" no hub a cada 10 ms para medir quanto ele fica travado
+    import sys
+    import time
+    import eventlet
+
+    concorrencia = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    logins = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    armazenada = gerar_hash('Senha@123')
+    atraso_hub = [0.0]
+    medindo = [True]
+
+    def tique():
+        while medindo[0]:
+            inicio = time.perf_counter()
+            eventlet.sleep(0.01)
+            atraso_hub[0] = max(atraso_hub[0], time.perf_counter() - inicio - 0.01)
+
+    def medir(_):
+        inicio = time.perf_counter()
+        verificar_fora_do_hub('Senha@123', armazenada)
+        return time.perf_counter() - inicio
+
+    medir(0)
+    eventlet.spawn(tique)
+    inicio = time.perf_counter()
+    tempos = sorted(eventlet.GreenPool(concorrencia).imap(medir, range(logins)))
+    total = time.perf_counter() - inicio
+    medindo[0] = False
+
+    def percentil(p):
+        return tempos[min(len(tempos) - 1, int(p / 100 * len(tempos)))] * 1000
+
+    print(f"scrypt n={SCRYPT_N} r={SCRYPT_R} p={SCRYPT_P} | {logins} logins, {concorrencia} simultâneos")
+    print(f"  p50 {percentil(50):.1f} ms | p95 {percentil(95):.1f} ms | máx {tempos[-1] * 1000:.1f} ms")
+    print(f"  vazão {logins / total:.1f} logins/s | maior atraso do hub {atraso_hub[0] * 1000:.1f} ms")
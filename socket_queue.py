@@ -0,0 +1,83 @@
+"""
+Fila de mensagens do Socket.IO apoiada em SQLite
+Permite rodar vários workers (ou processos na mesma máquina) sem Redis: cada
+emit é gravado numa tabela e os demais workers o repassam aos seus clientes
+"""
+import pickle
+import sqlite3
+import time
+
+import socketio
+
+
+class SQLiteManager(socketio.PubSubManager):
+    """
+    Client manager do python-socketio que usa uma tabela SQLite como pub/sub
+
+    URL no formato sqlite:///caminho/arquivo.db. Serve como substituto local de
+    um Redis em desenvolvimento, testes e implantações de uma única máquina.
+    """
+    name = 'sqlite'
+
+    def __init__(self, url='sqlite:///socketio_fila.db', channel='socketio', write_only=False, logger=None,
+                 intervalo_polling=0.05, retencao=60):
+        """
+        Args:
+            url: sqlite:///caminho do arquivo compartilhado entre os workers
+            channel: Canal (permite vários apps no mesmo arquivo)
+            write_only: Apenas publica (processos externos que só emitem)
+            intervalo_polling: Segundos entre leituras da fila
+            retencao: Segundos que uma mensagem fica na tabela antes de ser apagada
+        """
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.db_path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+        self.intervalo_polling = intervalo_polling
+        self.retencao = retencao
+        self._ultima_limpeza = 0
+
+        self._conn = self._conectar()
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS socketio_fila (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                canal TEXT NOT NULL,
+                mensagem BLOB NOT NULL,
+                criado_em REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_socketio_fila_canal ON socketio_fila(canal, id);
+        """)
+        self._conn.commit()
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _publish(self, data):
+        agora = time.time()
+        self._conn.execute(
+            'INSERT INTO socketio_fila (canal, mensagem, criado_em) VALUES (?, ?, ?)',
+            (self.channel, pickle.dumps(data), agora)
+        )
+        if agora - self._ultima_limpeza > self.retencao:
+            self._conn.execute('DELETE FROM socketio_fila WHERE criado_em < ?', (agora - self.retencao,))
+            self._ultima_limpeza = agora
+        self._conn.commit()
+
+    def _listen(self):
+        conn = self._conectar()
+        row = conn.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_fila').fetchone()
+        ultimo_id = row[0]
+
+        while True:
+            rows = conn.execute(
+                'SELECT id, mensagem FROM socketio_fila WHERE canal = ? AND id > ? ORDER BY id',
+                (self.channel, ultimo_id)
+            ).fetchall()
+            for id_mensagem, mensagem in rows:
+                ultimo_id = id_mensagem
+                try:
+                    yield pickle.loads(mensagem)
+                except Exception:
+                    self._get_logger().warning('Mensagem inválida na fila SQLite: %s', id_mensagem)
+            self.server.sleep(self.intervalo_polling)
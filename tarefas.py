@@ -0,0 +1,105 @@
+"""
+Utilitários de concorrência do servidor
+Abstraem o eventlet (produção, via gunicorn) e o threading padrão (scripts e testes locais)
+"""
+import queue
+import threading
+import time
+
+try:
+    import eventlet
+    from eventlet import tpool
+except ImportError:  # pragma: no cover - eventlet é opcional fora do servidor
+    eventlet = None
+    tpool = None
+
+
+def iniciar_em_segundo_plano(funcao, *args, **kwargs):
+    """
+    Executa uma função em segundo plano sem bloquear a requisição atual
+
+    Com eventlet usa uma green-thread; caso contrário, uma thread daemon.
+    """
+    if eventlet is not None:
+        return eventlet.spawn(funcao, *args, **kwargs)
+
+    thread = threading.Thread(target=funcao, args=args, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+
+def pausar(segundos):
+    """Dorme cedendo o controle para as outras green-threads (quando houver eventlet)"""
+    if eventlet is not None:
+        eventlet.sleep(segundos)
+    else:
+        time.sleep(segundos)
+
+
+def executar_bloqueante(funcao, *args, **kwargs):
+    """
+    Executa uma chamada bloqueante (SDK do Gemini, hashing...) fora do hub do eventlet
+
+    O eventlet não consegue "esverdear" o gRPC do SDK; sem isso, uma chamada lenta
+    congela todos os sockets do worker. Sem eventlet, apenas chama a função.
+    """
+    if tpool is not None:
+        return tpool.execute(funcao, *args, **kwargs)
+    return funcao(*args, **kwargs)
+
+
+def iterar_bloqueante(iteravel):
+    """
+    Percorre um iterador bloqueante (ex.: stream do Gemini) fora do hub do eventlet
+
+    Cada avanço do iterador roda em uma thread do pool; entre os itens, as
+    demais green-threads continuam sendo atendidas.
+    """
+    iterador = iter(iteravel)
+    fim = object()
+    while True:
+        item = executar_bloqueante(next, iterador, fim)
+        if item is fim:
+            return
+        yield item
+
+
+def novo_semaforo(limite):
+    """Semáforo compatível com green-threads (ou com threads, sem eventlet)"""
+    if eventlet is not None:
+        from eventlet.semaphore import Semaphore
+        return Semaphore(limite)
+    return threading.Semaphore(limite)
+
+
+def novo_lock_de_thread():
+    """
+    Lock de threads reais do sistema operacional
+
+    Para estado compartilhado entre as threads do tpool: mesmo com o
+    monkey-patch do gunicorn, devolve o Lock original (não o "verde").
+    """
+    if eventlet is not None:
+        from eventlet import patcher
+        return patcher.original('threading').Lock()
+    return threading.Lock()
+
+
+def nova_fila():
+    """Fila cuja espera (get com timeout) cede o hub às outras green-threads"""
+    if eventlet is not None:
+        from eventlet.queue import LightQueue
+        return LightQueue()
+    return queue.Queue()
+
+
+def cancelar(tarefa):
+    """
+    Abandona uma tarefa iniciada por iniciar_em_segundo_plano
+
+    Com eventlet a green-thread é encerrada (uma chamada em andamento no tpool
+    termina sozinha e o resultado é descartado); threads comuns não podem ser
+    interrompidas e apenas seguem até o fim.
+    """
+    if eventlet is not None and hasattr(tarefa, 'kill'):
+        tarefa.kill()
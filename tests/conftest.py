@@ -0,0 +1,43 @@
+"""
+Configuração comum dos testes
+Os módulos do servidor leem o caminho do banco ao serem importados, então os
+bancos temporários são definidos aqui, antes de qualquer import do projeto
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+_PASTA = tempfile.mkdtemp(prefix='repensei_testes_')
+os.environ['DB_NAME'] = os.path.join(_PASTA, 'repensei.db')
+os.environ['ANALYTICS_DB'] = os.path.join(_PASTA, 'analytics.db')
+os.environ['RATE_LIMIT_DB'] = os.path.join(_PASTA, 'limites.db')
+
+
+@pytest.fixture(scope='session')
+def banco():
+    """Banco temporário com todas as migrações aplicadas"""
+    from config import pool
+    from migrations import migrar
+
+    with pool.conexao() as conn:
+        migrar(conn)
+    return pool
+
+
+@pytest.fixture
+def aluno(banco):
+    """id de um aluno premium novo"""
+    from uuid import uuid4
+
+    with banco.conexao() as conn:
+        cursor = conn.execute(
+            "INSERT INTO aluno (nome, email, senha, plano) VALUES (?, ?, ?, 'premium')",
+            ('Aluno Teste', f'{uuid4().hex}@teste.com', 'x')
+        )
+        conn.commit()
+        return cursor.lastrowid
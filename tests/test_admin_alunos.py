@@ -0,0 +1,87 @@
+from uuid import uuid4
+
+import pytest
+
+
+@pytest.fixture
+def cliente_admin(banco):
+    from flask import Flask
+
+    from admin_routes import admin_bp
+    from config import init_app
+
+    app = Flask(__name__)
+    app.secret_key = 'teste'
+    init_app(app)
+    app.register_blueprint(admin_bp)
+    cliente = app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao['admin_id'] = 1
+    return cliente
+
+
+@pytest.fixture
+def turma(banco):
+    """Alunos com nomes e contagens repetidos, todos com o mesmo termo de busca"""
+    termo = uuid4().hex[:10]
+    ids = []
+    with banco.conexao() as conn:
+        for i in range(11):
+            cursor = conn.execute(
+                "INSERT INTO aluno (nome, email, senha, plano) VALUES (?, ?, 'x', 'freemium')",
+                (f'Aluno {i % 3}', f'{termo}{i}@teste.com')
+            )
+            ids.append(cursor.lastrowid)
+            for _ in range(i % 2):
+                conn.execute(
+                    'INSERT INTO quiz_resultado (id_aluno, tema, materia, acertos, total_perguntas, data_criacao) '
+                    "VALUES (?, 'Ética', 'Filosofia', ?, 10, '2026-10-19')",
+                    (cursor.lastrowid, i % 4)
+                )
+        conn.commit()
+    return termo, ids
+
+
+def percorrer(cliente, termo, ordem, limite):
+    paginas, cursor = [], None
+    while True:
+        params = {'search': termo, 'ordem': ordem, 'limit': limite}
+        if cursor:
+            params['cursor'] = cursor
+        resposta = cliente.get('/admin/alunos', query_string=params)
+        assert resposta.status_code == 200
+        paginas.append(resposta.get_json())
+        cursor = resposta.headers.get('X-Next-Cursor')
+        if not cursor:
+            return paginas
+
+
+@pytest.mark.parametrize('ordem', ['nome', 'email', 'recentes', 'total_quizzes', 'media_geral'])
+def test_paginas_nao_repetem_nem_pulam_alunos(cliente_admin, turma, ordem):
+    termo, ids = turma
+    paginas = percorrer(cliente_admin, termo, ordem, limite=3)
+
+    vistos = [aluno['id_aluno'] for pagina in paginas for aluno in pagina]
+    assert len(vistos) == len(set(vistos))
+    assert set(vistos) == set(ids)
+    assert all(len(pagina) <= 3 for pagina in paginas)
+
+    # A concatenação das páginas é a mesma lista de uma consulta só
+    inteira = cliente_admin.get('/admin/alunos', query_string={'search': termo, 'ordem': ordem, 'limit': 100})
+    assert vistos == [aluno['id_aluno'] for aluno in inteira.get_json()]
+
+
+def test_sem_sessao_de_admin_nao_lista(banco):
+    from flask import Flask
+
+    from admin_routes import admin_bp
+
+    app = Flask(__name__)
+    app.secret_key = 'teste'
+    app.register_blueprint(admin_bp)
+    assert app.test_client().get('/admin/alunos').status_code == 401
+
+
+def test_cursor_invalido_responde_400(cliente_admin):
+    resposta = cliente_admin.get('/admin/alunos', query_string={'cursor': 'nao-e-cursor'})
+    assert resposta.status_code == 400
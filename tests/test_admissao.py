@@ -0,0 +1,72 @@
+import pytest
+from flask import Flask
+
+from admissao import Admissao, Sobrecarga, com_admissao
+from tarefas import iniciar_em_segundo_plano, pausar
+
+
+def test_fila_cheia_recusa_na_hora():
+    admissao = Admissao(max_simultaneas=1, max_fila=0, espera_maxima=5)
+    with admissao.vaga():
+        with pytest.raises(Sobrecarga) as erro:
+            with admissao.vaga():
+                pass
+    assert erro.value.motivo == 'fila cheia'
+    assert erro.value.retry_after >= 1
+    assert admissao.estatisticas()['recusadas_fila_cheia'] == 1
+    assert admissao.estatisticas()['em_andamento'] == 0
+
+
+def test_espera_esgotada_sai_da_fila():
+    admissao = Admissao(max_simultaneas=1, max_fila=1, espera_maxima=0.05)
+    posicoes = []
+    with admissao.vaga():
+        with pytest.raises(Sobrecarga) as erro:
+            with admissao.vaga(ao_aguardar=posicoes.append):
+                pass
+    assert erro.value.motivo == 'tempo de espera esgotado'
+    assert posicoes == [1]
+    assert admissao.estatisticas()['na_fila'] == 0
+
+
+def test_vaga_liberada_passa_para_o_primeiro_da_fila():
+    admissao = Admissao(max_simultaneas=1, max_fila=2, espera_maxima=5)
+    ordem = []
+
+    def esperar(nome):
+        with admissao.vaga():
+            ordem.append(nome)
+
+    with admissao.vaga():
+        iniciar_em_segundo_plano(esperar, 'primeiro')
+        pausar(0.05)
+        iniciar_em_segundo_plano(esperar, 'segundo')
+        pausar(0.05)
+        assert admissao.estatisticas()['na_fila'] == 2
+
+    for _ in range(100):
+        if len(ordem) == 2:
+            break
+        pausar(0.01)
+    assert ordem == ['primeiro', 'segundo']
+    assert admissao.estatisticas()['em_andamento'] == 0
+
+
+def test_rota_lotada_responde_503_com_retry_after():
+    admissao = Admissao(max_simultaneas=1, max_fila=0)
+    app = Flask(__name__)
+    app.config['ADMISSAO_GEMINI'] = admissao
+
+    @app.route('/gerar')
+    @com_admissao
+    def gerar():
+        return {'ok': True}
+
+    cliente = app.test_client()
+    assert cliente.get('/gerar').status_code == 200
+
+    with admissao.vaga():
+        resposta = cliente.get('/gerar')
+    assert resposta.status_code == 503
+    assert int(resposta.headers['Retry-After']) >= 1
+    assert resposta.get_json()['motivo'] == 'fila cheia'
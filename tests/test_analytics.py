@@ -0,0 +1,55 @@
+from analytics import AnalyticsETL
+
+
+def inserir_resultados(banco, id_aluno, placares, dia='2026-10-14'):
+    with banco.conexao() as conn:
+        conn.executemany(
+            'INSERT INTO quiz_resultado (id_aluno, tema, materia, acertos, total_perguntas, data_criacao) '
+            "VALUES (?, 'Ética', 'Filosofia', ?, ?, ?)",
+            [(id_aluno, acertos, total, dia) for acertos, total in placares]
+        )
+        conn.commit()
+
+
+def total_do_aluno(etl, id_aluno, granularidade='dia'):
+    series = etl.tendencias(granularidade=granularidade, filtros={'id_aluno': id_aluno})['series']
+    return sum(ponto['quantidade'] for serie in series for ponto in serie['pontos'])
+
+
+def test_rodar_o_etl_de_novo_nao_conta_duas_vezes(banco, aluno, tmp_path):
+    inserir_resultados(banco, aluno, [(5, 10), (8, 10), (0, 0), (3, 10), (10, 10)])
+    etl = AnalyticsETL(db_path=str(tmp_path / 'analytics.db'), tamanho_lote=2)
+
+    assert etl.executar()['quiz_resultado'] >= 5
+    assert etl.executar() == {'quiz_resultado': 0, 'historico_premium': 0}
+    assert total_do_aluno(etl, aluno) == 5
+    assert total_do_aluno(etl, aluno, 'semana') == 5
+
+    ponto = etl.tendencias(filtros={'id_aluno': aluno})['series'][0]['pontos'][0]
+    assert ponto['media'] == (0.5 + 0.8 + 0.3 + 1.0) / 4
+
+    # Só o que entrou depois da última carga é somado
+    inserir_resultados(banco, aluno, [(7, 10)])
+    assert etl.executar()['quiz_resultado'] == 1
+    assert total_do_aluno(etl, aluno) == 6
+
+
+def test_lote_carregado_por_outro_worker_nao_e_somado_de_novo(banco, aluno, tmp_path):
+    caminho = str(tmp_path / 'analytics.db')
+    AnalyticsETL(db_path=caminho).executar()
+    inserir_resultados(banco, aluno, [(1, 10), (2, 10), (3, 10)])
+
+    etl, outro = AnalyticsETL(db_path=caminho), AnalyticsETL(db_path=caminho)
+    extrair = etl._extrair_quiz
+
+    def extrair_enquanto_outro_carrega(ultimo_id):
+        linhas = extrair(ultimo_id)
+        if linhas and outro.ultima_carga is None:
+            # O outro worker carrega o mesmo lote antes deste gravar
+            outro.executar()
+        return linhas
+
+    etl._extrair_quiz = extrair_enquanto_outro_carrega
+    etl.executar()
+
+    assert total_do_aluno(etl, aluno) == 3
@@ -0,0 +1,109 @@
+import pytest
+
+import api_key_manager
+from api_key_manager import APIKeyManager
+
+
+class ChamouOCliente(Exception):
+    pass
+
+
+class ClienteFalso:
+    def __init__(self, client_options=None):
+        self.api_key = client_options['api_key']
+
+    def generate_content(self, request, **kwargs):
+        raise ChamouOCliente(self.api_key)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = APIKeyManager(keys_file=str(tmp_path / 'chaves.json'))
+    manager.add_key('chave-a', 'a')
+    manager.add_key('chave-b', 'b')
+    return manager
+
+
+def test_modelo_usa_o_cliente_da_chave(manager, monkeypatch):
+    # Se o SDK deixar de usar GenerativeModel._client, este teste falha
+    monkeypatch.setattr(api_key_manager.glm, 'GenerativeServiceClient', ClienteFalso)
+    chave_b = manager.keys_data['keys'][1]
+    model = manager.model_for_key(chave_b, 'gemini-2.5-flash')
+
+    with pytest.raises(ChamouOCliente, match='chave-b'):
+        model.generate_content('oi')
+    assert manager.model_for_key(chave_b, 'gemini-2.5-flash')._client is model._client
+
+
+def test_circuito_abre_sonda_em_half_open_e_fecha(manager, monkeypatch):
+    from datetime import datetime, timedelta
+
+    from api_key_manager import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN
+
+    chave_a = manager.keys_data['keys'][0]
+    manager.open_circuit(chave_a, reason='teste')
+    assert chave_a['circuit_state'] == CIRCUIT_OPEN
+    assert manager.select_key() is manager.keys_data['keys'][1]
+
+    estados, falhar = [], [True]
+
+    def sondar(key_entry, model_name='gemini-2.5-flash'):
+        estados.append(key_entry['circuit_state'])
+        if falhar[0]:
+            raise RuntimeError('429 quota')
+
+    monkeypatch.setattr(manager, '_probe_key', sondar)
+
+    # Antes do cooldown não há sondagem
+    assert manager.probe_due_keys() == 0
+    assert estados == []
+
+    # Sondagem que falha: volta a abrir, com o cooldown dobrado
+    chave_a['blocked_until'] = (datetime.now() - timedelta(seconds=1)).isoformat()
+    assert manager.probe_due_keys() == 0
+    assert estados == [CIRCUIT_HALF_OPEN]
+    assert chave_a['circuit_state'] == CIRCUIT_OPEN
+    assert chave_a['probe_failures'] == 1
+    assert manager._cooldown_for(chave_a) == 2 * manager.cooldown_base
+
+    # Sondagem que passa: fecha e a chave volta ao rodízio
+    falhar[0] = False
+    chave_a['blocked_until'] = (datetime.now() - timedelta(seconds=1)).isoformat()
+    assert manager.probe_due_keys() == 1
+    assert chave_a['circuit_state'] == CIRCUIT_CLOSED
+    assert chave_a['probe_failures'] == 0
+    assert manager._is_key_available(chave_a)
+
+
+def test_escolhe_a_chave_de_menor_latencia_esperada(manager):
+    chave_a, chave_b = manager.keys_data['keys']
+    # Chave sem histórico é experimentada primeiro
+    manager.record_result(chave_a, 2.0)
+    assert manager.select_key() is chave_b
+
+    manager.record_result(chave_b, 1.0)
+    assert manager.select_key() is chave_b
+
+    # A média móvel acompanha a piora da chave b
+    for _ in range(10):
+        manager.record_result(chave_b, 5.0)
+    assert manager.select_key() is chave_a
+
+
+def test_erros_inflam_a_latencia_e_429_tira_a_prioridade(manager):
+    chave_a, chave_b = manager.keys_data['keys']
+    manager.record_result(chave_a, 1.0)
+    manager.record_result(chave_b, 1.5)
+    assert manager.select_key() is chave_a
+
+    # Chave rápida mas que falha muito custa mais (cada erro é uma nova tentativa)
+    for _ in range(3):
+        manager.record_result(chave_a, 1.0, error=RuntimeError('500 interno'))
+    assert manager._score(chave_a) > manager._score(chave_b)
+    assert manager.select_key() is chave_b
+
+    # Muitos 429 recentes: a chave só é usada se nenhuma outra tiver folga
+    for _ in range(5):
+        manager.record_result(chave_b, 1.0, error=RuntimeError('429 Resource exhausted'))
+    assert manager.select_key() is chave_a
+    assert manager.select_key(exclude=chave_a) is chave_b
@@ -0,0 +1,110 @@
+from cache import TTLCache
+
+
+def test_limite_de_entradas_descarta_a_usada_ha_mais_tempo():
+    cache = TTLCache(ttl=60, idade_maxima=60, max_entradas=3)
+    for chave in (1, 2, 3):
+        cache.obter(chave, lambda chave=chave: chave * 10)
+    cache.obter(1, lambda: 'recalculado')  # 1 passa a ser a mais recente
+    cache.obter(4, lambda: 40)
+
+    assert cache.estatisticas()['chaves'] == 3
+    assert cache.obter(1, lambda: 'recalculado') == 10
+    assert cache.obter(2, lambda: 'recalculado') == 'recalculado'
+
+
+def test_nao_guarda_none_quando_configurado():
+    cache = TTLCache(ttl=60, idade_maxima=60, guardar_none=False)
+    for id_aluno in range(1000):
+        assert cache.obter(id_aluno, lambda: None) is None
+    assert cache.estatisticas()['chaves'] == 0
+
+    assert cache.obter('existe', lambda: 'premium') == 'premium'
+    assert cache.estatisticas()['chaves'] == 1
+
+
+def test_entrada_velha_demais_sai_mesmo_se_o_calculo_falhar(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr('cache.time.monotonic', lambda: agora[0])
+    cache = TTLCache(ttl=10, idade_maxima=20)
+    cache.obter('a', lambda: 1)
+
+    agora[0] += 30
+
+    def falha():
+        raise RuntimeError('banco fora')
+
+    try:
+        cache.obter('a', falha)
+    except RuntimeError:
+        pass
+    assert cache.estatisticas()['chaves'] == 0
+
+
+def test_banco_ocupado_ao_conferir_aluno_responde_json(banco, monkeypatch):
+    import sqlite3
+
+    from flask import Flask
+
+    import utils
+    from config import init_app
+    from quiz_routes import quiz_bp
+
+    def banco_travado(id_aluno):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(utils, '_buscar_plano', banco_travado)
+    app = Flask(__name__)
+    init_app(app)
+    app.register_blueprint(quiz_bp)
+
+    resposta = app.test_client().post('/quiz/salvar_resultado', json={
+        'id_aluno': 1, 'tema': 'Ética', 'acertos': 3, 'total_perguntas': 5
+    })
+    assert resposta.status_code == 500
+    assert 'error' in resposta.get_json()
+
+
+def esperar_segundo_plano():
+    from tarefas import pausar
+    for _ in range(5):
+        pausar(0.01)
+
+
+def test_valor_vencido_e_servido_enquanto_recalcula(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr('cache.time.monotonic', lambda: agora[0])
+    cache = TTLCache(ttl=10, idade_maxima=60)
+    assert cache.obter('stats', lambda: 'v1') == 'v1'
+
+    agora[0] += 15
+    calculos = []
+
+    def recalcular():
+        calculos.append(1)
+        return 'v2'
+
+    # Vencido: as leituras recebem o antigo na hora e só um recálculo é disparado
+    assert cache.obter('stats', recalcular) == 'v1'
+    assert cache.obter('stats', recalcular) == 'v1'
+    esperar_segundo_plano()
+    assert calculos == [1]
+    assert cache.obter('stats', recalcular) == 'v2'
+    assert cache.estatisticas()['acertos_vencidos'] == 2
+
+
+def test_invalidar_serve_o_antigo_e_falha_no_recalculo_o_mantem(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr('cache.time.monotonic', lambda: agora[0])
+    cache = TTLCache(ttl=10, idade_maxima=60)
+    cache.obter('stats', lambda: 'v1')
+    cache.invalidar('stats')
+
+    def falha():
+        raise RuntimeError('banco fora')
+
+    assert cache.obter('stats', falha) == 'v1'
+    esperar_segundo_plano()
+    assert cache.obter('stats', lambda: 'v2') == 'v1'  # ainda vencido: serve e recalcula
+    esperar_segundo_plano()
+    assert cache.obter('stats', lambda: 'v3') == 'v2'
@@ -0,0 +1,138 @@
+from types import SimpleNamespace
+
+import pytest
+
+from chat_context import ChatContext
+
+
+class ModeloFalso:
+    def __init__(self, texto='resposta', falhar=False):
+        self.texto = texto
+        self.falhar = falhar
+        self.chamadas = 0
+
+    def generate_content(self, conteudo, stream=False):
+        self.chamadas += 1
+        if self.falhar:
+            raise RuntimeError('Gemini fora')
+        if stream:
+            return iter([SimpleNamespace(text=self.texto)])
+        return SimpleNamespace(text=self.texto)
+
+
+def conversar(chat, vezes):
+    for i in range(vezes):
+        list(chat.enviar_stream(f'mensagem {i}'))
+
+
+def test_stream_nao_resume_antes_do_evento_final():
+    resumo = ModeloFalso('resumo novo')
+    chat = ChatContext(lambda: ModeloFalso(), lambda: resumo, janela=1, intervalo_resumo=1)
+    conversar(chat, 3)
+
+    assert resumo.chamadas == 0
+    assert chat.precisa_resumo()
+
+    assert chat.concluir_troca() is True
+    assert resumo.chamadas == 1
+    assert chat.resumo == 'resumo novo'
+    assert chat.fora_da_janela == []
+
+
+def test_uso_registrado_em_concluir_troca():
+    usos = []
+    chat = ChatContext(lambda: ModeloFalso(), lambda: ModeloFalso(), registrar_uso=usos.append)
+    chat._uso_pendente = 'metadados'
+    assert chat.concluir_troca() is False
+    assert usos == ['metadados']
+
+
+def test_falhas_seguidas_limitam_as_trocas_pendentes():
+    chat = ChatContext(lambda: ModeloFalso(), lambda: ModeloFalso(falhar=True), janela=1, intervalo_resumo=2)
+    chat.max_falhas_resumo = 3
+    for i in range(30):
+        conversar(chat, 1)
+        chat.concluir_troca()
+        assert len(chat.fora_da_janela) <= 2 * chat.intervalo_resumo + 2 * chat.max_falhas_resumo
+    assert len(chat.montar_conteudo('oi')) <= 2 * chat.intervalo_resumo + 2 * chat.max_falhas_resumo + 2 + 1
+
+
+def test_troca_durante_o_resumo_nao_se_perde():
+    import threading
+
+    comecou, liberar = threading.Event(), threading.Event()
+
+    class ResumoLento(ModeloFalso):
+        def generate_content(self, conteudo, stream=False):
+            comecou.set()
+            liberar.wait(5)
+            return super().generate_content(conteudo, stream)
+
+    chat = ChatContext(lambda: ModeloFalso(), lambda: ResumoLento('resumo'), janela=1, intervalo_resumo=1)
+    conversar(chat, 2)
+    resumidas = list(chat.fora_da_janela)
+
+    resumo = threading.Thread(target=chat.atualizar_resumo)
+    resumo.start()
+    comecou.wait(5)
+    # Um segundo resumo simultâneo não começa
+    assert chat.atualizar_resumo() is False
+    conversar(chat, 1)  # stream da próxima mensagem enquanto o resumo roda
+    liberar.set()
+    resumo.join(5)
+
+    assert chat.resumo == 'resumo'
+    assert len(chat.fora_da_janela) == 2
+    assert chat.fora_da_janela[0] not in resumidas
+
+
+class RespostaEmTrechos:
+    """Stream falso do Gemini: trechos, um chunk só de metadados e, opcionalmente, uma falha no meio"""
+
+    def __init__(self, trechos, falhar_depois=None):
+        self.trechos = trechos
+        self.falhar_depois = falhar_depois
+        self.usage_metadata = 'uso'
+
+    def __iter__(self):
+        for i, trecho in enumerate(self.trechos):
+            if i == self.falhar_depois:
+                raise RuntimeError('conexão caiu')
+            yield SimpleNamespace(text=trecho)
+        yield SemTexto()
+
+
+class SemTexto:
+    @property
+    def text(self):
+        raise ValueError('chunk sem texto')
+
+
+class ModeloDeStream:
+    def __init__(self, resposta):
+        self.resposta = resposta
+
+    def generate_content(self, conteudo, stream=False):
+        assert stream
+        return self.resposta
+
+
+def test_stream_entrega_os_trechos_e_so_registra_no_fim():
+    chat = ChatContext(lambda: None, lambda: None)
+    stream = chat.enviar_stream('o que é justiça?', ModeloDeStream(RespostaEmTrechos(['Boa ', 'pergunta', '!'])))
+
+    assert next(stream) == 'Boa '
+    assert chat.turnos == []  # nada no histórico enquanto o stream corre
+    assert list(stream) == ['pergunta', '!']
+    assert chat.ultima_resposta() == 'Boa pergunta!'
+    assert chat._uso_pendente == 'uso'
+
+
+def test_stream_interrompido_nao_registra_a_troca():
+    chat = ChatContext(lambda: None, lambda: None)
+    stream = chat.enviar_stream('oi', ModeloDeStream(RespostaEmTrechos(['Olá', ' de novo'], falhar_depois=1)))
+
+    assert next(stream) == 'Olá'
+    with pytest.raises(RuntimeError):
+        next(stream)
+    assert chat.turnos == []
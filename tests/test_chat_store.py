@@ -0,0 +1,43 @@
+from uuid import uuid4
+
+from chat_store import ChatStore
+
+
+class ChatFalso:
+    def __init__(self, historico=None):
+        self.historico = list(historico or [])
+
+
+def novo_store(**kwargs):
+    return ChatStore(ChatFalso, lambda chat: chat.historico, **kwargs)
+
+
+def test_sessao_fixada_nao_e_removida_no_meio_da_troca(banco):
+    store = novo_store(max_sessoes=1)
+    sessao = uuid4().hex
+    chat = store.obter(sessao)
+    store.fixar(sessao)
+
+    store.obter(uuid4().hex)  # passaria do limite e removeria a sessão mais antiga
+    chat.historico.append('troca em andamento')
+    store.atualizar(sessao, chat)
+    assert store.obter(sessao) is chat
+
+    store.liberar(sessao)
+    assert store.estatisticas()['sessoes_em_memoria'] == 1
+
+
+def test_troca_de_sessao_removida_e_gravada_direto_no_banco(banco):
+    store = novo_store(max_sessoes=1)
+    sessao = uuid4().hex
+    chat = store.obter(sessao)
+    chat.historico.append('primeira troca')
+    store.atualizar(sessao, chat)
+
+    store.obter(uuid4().hex)  # remove (e grava) a sessão
+    chat.historico.append('segunda troca')
+    store.atualizar(sessao, chat)
+
+    historico, versao = store._carregar_transcricao(sessao)
+    assert historico == ['primeira troca', 'segunda troca']
+    assert versao == 2
@@ -0,0 +1,61 @@
+import pytest
+from flask import Flask
+
+from dominio import ALFA_DOMINIO, parametros_dominio, progresso_aluno, registrar_dominio
+
+
+def test_parametros_convertem_texto():
+    parametros = parametros_dominio(1, 'Ética', '3', '5', '2024-01-01')
+    assert parametros['acertos'] == 3
+    assert parametros['total_perguntas'] == 5
+    assert parametros['precisao'] == pytest.approx(0.6)
+
+
+@pytest.mark.parametrize('acertos,total', [(1, 0), (6, 5), (-1, 5), ('x', 5), (None, 5)])
+def test_parametros_ignoram_placar_invalido(acertos, total):
+    assert parametros_dominio(1, 'Ética', acertos, total, '2024-01-01') is None
+
+
+def test_ewma_pesa_o_quiz_mais_recente(banco, aluno):
+    with banco.conexao() as conn:
+        registrar_dominio(conn, aluno, 'Filosofia moral', 10, 10, '2024-01-01')
+        registrar_dominio(conn, aluno, 'Filosofia moral', 0, 10, '2024-01-02')
+        conn.commit()
+        [materia] = progresso_aluno(conn, aluno)
+
+    assert materia['materia'] == 'Filosofia'
+    assert materia['tentativas'] == 2
+    assert materia['precisao'] == pytest.approx(0.5)
+    assert materia['precisao_recente'] == pytest.approx(1 - ALFA_DOMINIO)
+
+
+@pytest.fixture
+def cliente_premium(banco):
+    from config import init_app
+    from premium_routes import premium_bp
+
+    app = Flask(__name__)
+    init_app(app)
+    app.register_blueprint(premium_bp)
+    return app.test_client()
+
+
+def test_salvar_completo_recusa_placar_invalido(cliente_premium, aluno, banco):
+    resposta = cliente_premium.post('/premium/quiz/salvar_completo', json={
+        'id_aluno': aluno, 'tema': 'Ética', 'acertos': 8, 'total_perguntas': 5,
+        'conteudo_gerado': '{}', 'respostas_usuario': {}
+    })
+    assert resposta.status_code == 400
+    with banco.conexao() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM dominio_aluno WHERE id_aluno = ?', (aluno,)).fetchone()[0] == 0
+
+
+def test_salvar_completo_aceita_numeros_em_texto(cliente_premium, aluno, banco):
+    resposta = cliente_premium.post('/premium/quiz/salvar_completo', json={
+        'id_aluno': aluno, 'tema': 'Ética', 'acertos': '4', 'total_perguntas': '5',
+        'conteudo_gerado': '{}', 'respostas_usuario': {}
+    })
+    assert resposta.status_code == 201
+    with banco.conexao() as conn:
+        linha = conn.execute('SELECT acertos, total_perguntas FROM dominio_aluno WHERE id_aluno = ?', (aluno,)).fetchone()
+    assert tuple(linha) == (4, 5)
@@ -0,0 +1,44 @@
+import api_key_manager
+from api_key_manager import APIKeyManager, _generate_hedged
+from tarefas import pausar
+
+
+def gerenciador(tmp_path):
+    manager = APIKeyManager(keys_file=str(tmp_path / 'chaves.json'))
+    manager.add_key('chave-lenta', 'lenta')
+    manager.add_key('chave-rapida', 'rapida')
+    manager.hedge_enabled = True
+    manager.hedge_min_samples = 1
+    manager._latencies.extend([0.05] * 5)
+    return manager
+
+
+def test_perdedora_do_hedge_entra_como_limite_inferior(tmp_path, monkeypatch):
+    manager = gerenciador(tmp_path)
+    lenta, rapida = manager.keys_data['keys']
+
+    def chamada_falsa(key_manager, key_entry, prompt, model_name, results):
+        if key_entry is lenta:
+            pausar(1.0)
+        results.put((key_entry, key_entry['name'], None, 0.01))
+
+    monkeypatch.setattr(api_key_manager, '_call_model', chamada_falsa)
+
+    assert _generate_hedged(manager, lenta, 'prompt', 'modelo') == 'rapida'
+    # A chave lenta foi abandonada, mas o tempo que já levava (>= o atraso do hedge) foi registrado
+    amostra = manager._stats_for(lenta)['latency_ewma']
+    assert amostra is not None and amostra >= 0.05
+    assert max(manager._latencies) >= 0.05
+    assert manager.get_hedge_stats()['hedge_wins'] == 1
+
+
+def test_limite_inferior_nao_puxa_o_ewma_para_baixo(tmp_path):
+    manager = gerenciador(tmp_path)
+    lenta = manager.keys_data['keys'][0]
+    manager.record_result(lenta, 2.0)
+
+    manager.record_censored(lenta, 0.5)
+    assert manager._stats_for(lenta)['latency_ewma'] == 2.0
+
+    manager.record_censored(lenta, 4.0)
+    assert manager._stats_for(lenta)['latency_ewma'] > 2.0
@@ -0,0 +1,88 @@
+import pytest
+from flask import Flask
+
+from jobs import FilaDeJobs
+
+
+@pytest.fixture
+def app(banco):
+    from config import init_app
+    from premium_routes import premium_bp
+
+    app = Flask(__name__)
+    app.secret_key = 'teste'
+    init_app(app)
+    app.register_blueprint(premium_bp)
+    return app
+
+
+def cliente_do_aluno(app, id_aluno):
+    cliente = app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao['id_aluno'] = id_aluno
+        sessao['plano'] = 'premium'
+    return cliente
+
+
+def test_job_concluido_fica_disponivel_na_rota(app, aluno):
+    gerados, avisos = [], []
+
+    def gerar(tipo, id_aluno, tema, texto):
+        gerados.append((tipo, id_aluno, tema, texto))
+        return {'perguntas': ['P1']}, 200, 42
+
+    jobs = FilaDeJobs(gerar, ao_concluir=lambda id_aluno, dados: avisos.append((id_aluno, dados)))
+    jobs.init_app(app)
+    cliente = cliente_do_aluno(app, aluno)
+
+    id_job = jobs.enfileirar('quiz', aluno, 'Ética')
+    pendente = cliente.get(f'/premium/jobs/{id_job}').get_json()
+    assert pendente['estado'] == 'pendente'
+    assert pendente['posicao'] == 1
+
+    jobs._executar(id_job)
+    # Um segundo worker (outro processo) não consegue assumir o mesmo job
+    jobs._executar(id_job)
+
+    assert gerados == [('quiz', aluno, 'Ética', None)]
+    concluido = cliente.get(f'/premium/jobs/{id_job}').get_json()
+    assert concluido['estado'] == 'concluido'
+    assert concluido['resultado'] == {'perguntas': ['P1']}
+    assert concluido['id_historico'] == 42
+    assert avisos == [(aluno, {
+        'id_job': id_job, 'tipo': 'quiz', 'tema': 'Ética', 'estado': 'concluido',
+        'status': 200, 'id_historico': 42, 'resultado': {'perguntas': ['P1']},
+    })]
+
+
+def test_falha_na_geracao_vira_job_com_erro(app, aluno):
+    def gerar(tipo, id_aluno, tema, texto):
+        raise RuntimeError('Gemini fora')
+
+    jobs = FilaDeJobs(gerar)
+    jobs.init_app(app)
+    id_job = jobs.enfileirar('resumo', aluno, 'Ética', 'texto base')
+    jobs._executar(id_job)
+
+    job = jobs.consultar(id_job)
+    assert job['estado'] == 'erro'
+    assert job['status_http'] == 500
+    assert job['resultado'] == {'erro': 'Gemini fora'}
+    assert jobs.estatisticas()['com_erro'] == 1
+
+
+def test_job_de_outro_aluno_nao_e_exibido(app, aluno):
+    jobs = FilaDeJobs(lambda *args: ({}, 200, None))
+    jobs.init_app(app)
+    id_job = jobs.enfileirar('quiz', aluno, 'Ética')
+
+    resposta = cliente_do_aluno(app, aluno + 1000000).get(f'/premium/jobs/{id_job}')
+    assert resposta.status_code == 404
+
+
+def test_correcao_passa_na_frente_do_resumo(banco, aluno):
+    jobs = FilaDeJobs(lambda *args: ({}, 200, None))
+    resumo = jobs.enfileirar('resumo', aluno, 'Ética', 'texto')
+    correcao = jobs.enfileirar('correcao', aluno, 'Ética', 'texto')
+    assert jobs.posicao(correcao) == 1
+    assert jobs.posicao(resumo) == 2
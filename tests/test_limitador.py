@@ -0,0 +1,82 @@
+import pytest
+
+import limitador
+from limitador import BaldesMemoria, BaldesSQLite, Limitador, carregar_regras
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(limitador.time, 'monotonic', relogio)
+    monkeypatch.setattr(limitador.time, 'time', relogio)
+    return relogio
+
+
+def test_regras_substituidas_e_desligadas():
+    regras = carregar_regras('auth_bp.login=5/30;premium_bp=0/60;quebrada')
+    assert regras['auth_bp.login'] == (5, 30.0)
+    assert 'premium_bp' not in regras
+    assert regras['freemium_bp'] == limitador.REGRAS_PADRAO['freemium_bp']
+
+
+@pytest.mark.parametrize('criar', [
+    lambda tmp_path: BaldesMemoria(60),
+    lambda tmp_path: BaldesSQLite(60, db_path=str(tmp_path / 'limites.db')),
+], ids=['memoria', 'sqlite'])
+def test_rajada_espera_e_reposicao(criar, relogio, tmp_path):
+    baldes = criar(tmp_path)
+    # 3 tokens repostos em 60 s: um a cada 20 s
+    for _ in range(3):
+        assert baldes.consumir('aluno:1', 3, 3 / 60) == 0
+    assert baldes.consumir('aluno:1', 3, 3 / 60) == pytest.approx(20)
+
+    relogio.agora += 5
+    assert baldes.consumir('aluno:1', 3, 3 / 60) == pytest.approx(15)
+
+    relogio.agora += 15
+    assert baldes.consumir('aluno:1', 3, 3 / 60) == 0
+    # Outra identidade tem o próprio balde
+    assert baldes.consumir('aluno:2', 3, 3 / 60) == 0
+
+
+def test_balde_parado_nao_passa_da_capacidade(relogio):
+    baldes = BaldesMemoria(60)
+    assert baldes.consumir('ip:1', 2, 2 / 60) == 0
+    relogio.agora += 3600
+    assert baldes.consumir('ip:1', 2, 2 / 60) == 0
+    assert baldes.consumir('ip:1', 2, 2 / 60) == 0
+    assert baldes.consumir('ip:1', 2, 2 / 60) > 0
+
+
+def test_retry_after_arredonda_para_cima(relogio):
+    limite = Limitador(regras={'premium_bp': (1, 60)}, backend='memoria')
+    assert limite.verificar('premium_bp', 'aluno:1') is None
+    relogio.agora += 0.5
+    assert limite.verificar('premium_bp', 'aluno:1') == 60
+    assert limite.verificar('regra_inexistente', 'aluno:1') is None
+
+
+def test_ip_forjado_no_x_forwarded_for_nao_escapa_do_limite(relogio):
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.secret_key = 'teste'
+    limite = Limitador(regras={'login': (2, 60)}, backend='memoria', confiar_proxy=True)
+    limite.init_app(app)
+    app.add_url_rule('/login', 'login', lambda: 'ok', methods=['POST'])
+    cliente = app.test_client()
+
+    # O cliente manda um IP diferente a cada tentativa; o proxy acrescenta o real
+    status = [
+        cliente.post('/login', headers={'X-Forwarded-For': f'10.0.0.{i}, 203.0.113.7'}).status_code
+        for i in range(3)
+    ]
+    assert status == [200, 200, 429]
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+from migrations import SQL_CLASSIFICAR_MATERIA
+from utils import classificar_materia
+
+TEMAS = [
+    'Filosofia antiga', 'SOCIOLOGIA clássica', 'Filosofia e Sociologia',
+    'Sociologia e Filosofia', 'Ética', '', None,
+]
+
+
+@pytest.mark.parametrize('tema', TEMAS)
+def test_migracao_e_insercao_classificam_igual(tema):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE quiz_resultado (tema TEXT)')
+    conn.execute('INSERT INTO quiz_resultado VALUES (?)', (tema or '',))
+    na_migracao = conn.execute(f'SELECT {SQL_CLASSIFICAR_MATERIA} FROM quiz_resultado').fetchone()[0]
+    assert na_migracao == classificar_materia(tema)
+
+
+def test_tema_com_as_duas_materias_fica_em_filosofia():
+    assert classificar_materia('Sociologia e Filosofia') == 'Filosofia'
+
+
+def agregados(conn):
+    """(mantidos pelos triggers, recalculados do zero), sem as linhas zeradas"""
+    mantidos = {
+        (r['plano'], r['materia']): (r['quantidade'], r['quantidade_validos'], round(r['soma_percentual'], 6))
+        for r in conn.execute('SELECT * FROM resumo_quiz WHERE quantidade > 0')
+    }
+    recalculados = {
+        (r['plano'], r['materia']): (r['quantidade'], r['validos'], round(r['soma'], 6))
+        for r in conn.execute(
+            '''
+            SELECT a.plano, q.materia, COUNT(*) AS quantidade, SUM(q.total_perguntas > 0) AS validos,
+                   COALESCE(SUM(CASE WHEN q.total_perguntas > 0 THEN CAST(q.acertos AS REAL) / q.total_perguntas END), 0) AS soma
+            FROM quiz_resultado q JOIN aluno a ON a.id_aluno = q.id_aluno
+            GROUP BY a.plano, q.materia
+            '''
+        )
+    }
+    return mantidos, recalculados
+
+
+def test_triggers_mantem_os_agregados_do_dashboard(banco, aluno):
+    with banco.conexao() as conn:
+        def inserir(tema, acertos, total):
+            conn.execute(
+                'INSERT INTO quiz_resultado (id_aluno, tema, materia, acertos, total_perguntas, data_criacao) '
+                "VALUES (?, ?, ?, ?, ?, '2026-10-19')",
+                (aluno, tema, classificar_materia(tema), acertos, total)
+            )
+
+        inserir('Filosofia moderna', 7, 10)
+        inserir('Sociologia urbana', 3, 10)
+        inserir('Ética', 0, 0)
+        mantidos, recalculados = agregados(conn)
+        assert mantidos == recalculados
+        assert mantidos[('premium', 'Filosofia')][0] >= 1
+
+        conn.execute("UPDATE aluno SET plano = 'freemium' WHERE id_aluno = ?", (aluno,))
+        assert agregados(conn)[0] == agregados(conn)[1]
+
+        conn.execute("DELETE FROM quiz_resultado WHERE id_aluno = ? AND tema = 'Ética'", (aluno,))
+        assert agregados(conn)[0] == agregados(conn)[1]
+
+        conn.execute('DELETE FROM aluno WHERE id_aluno = ?', (aluno,))
+        assert agregados(conn)[0] == agregados(conn)[1]
+        conn.rollback()
@@ -0,0 +1,50 @@
+import sqlite3
+
+import migrations
+
+
+def test_migrar_de_novo_nao_muda_nada(banco):
+    with banco.conexao() as conn:
+        versao = migrations.versao_atual(conn)
+        assert migrations.migrar(conn) == versao == migrations.MIGRATIONS[-1][0]
+
+
+def test_migracao_aplicada_por_outro_processo_e_pulada(tmp_path, monkeypatch):
+    conn = sqlite3.connect(str(tmp_path / 'corrida.db'))
+    conn.execute('PRAGMA user_version = 1')
+    aplicacoes = []
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [(1, 'teste', aplicacoes.append)])
+
+    # Fora do lock a versão lida está desatualizada (outro processo migrou em seguida)
+    versao_real = migrations.versao_atual
+    monkeypatch.setattr(
+        migrations, 'versao_atual',
+        lambda c: versao_real(c) if c.in_transaction else 0
+    )
+
+    migrations.migrar(conn)
+    assert aplicacoes == []
+    assert versao_real(conn) == 1
+    assert not conn.in_transaction
+
+
+def test_script_roda_na_mesma_transacao_da_versao(tmp_path, monkeypatch):
+    conn = sqlite3.connect(str(tmp_path / 'falha.db'))
+    script = """
+    CREATE TABLE a (x INTEGER);
+    CREATE TRIGGER t AFTER INSERT ON a BEGIN
+        SELECT 1;
+        SELECT 2;
+    END;
+    CREATE TABLE a (x INTEGER);
+    """
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [(1, 'com erro', script)])
+
+    try:
+        migrations.migrar(conn)
+    except sqlite3.Error:
+        pass
+    else:
+        raise AssertionError('a migração deveria falhar')
+    assert migrations.versao_atual(conn) == 0
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'a'").fetchone()[0] == 0
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+from chat_store import ChatStore
+from socket_queue import SQLiteManager
+
+
+class ChatFalso:
+    def __init__(self, historico=None):
+        self.historico = list(historico or [])
+
+
+def test_worker_retoma_a_conversa_avancada_por_outro(banco):
+    worker_a = ChatStore(ChatFalso, lambda chat: chat.historico, compartilhado=True)
+    worker_b = ChatStore(ChatFalso, lambda chat: chat.historico, compartilhado=True)
+    sessao = uuid4().hex
+
+    chat_a = worker_a.obter(sessao)
+    chat_a.historico.append('troca 1')
+    worker_a.atualizar(sessao, chat_a)
+
+    # O aluno reconecta no worker B: a conversa é reidratada do banco
+    chat_b = worker_b.obter(sessao)
+    assert chat_b.historico == ['troca 1']
+    chat_b.historico.append('troca 2')
+    worker_b.atualizar(sessao, chat_b)
+
+    # De volta ao A: a cópia local ficou para trás e é descartada
+    chat_a = worker_a.obter(sessao)
+    assert chat_a.historico == ['troca 1', 'troca 2']
+
+
+def test_fila_sqlite_entrega_emits_entre_workers(tmp_path):
+    url = f"sqlite:///{tmp_path / 'fila.db'}"
+    publicador = SQLiteManager(url, channel='repensei')
+    outro_app = SQLiteManager(url, channel='outro')
+    ouvinte = SQLiteManager(url, channel='repensei')
+
+    def publicar_depois_de_ouvir(segundos):
+        # Primeira espera do ouvinte: ele já marcou o último id, então publica agora
+        outro_app._publish({'method': 'emit', 'event': 'de_outro_app'})
+        publicador._publish({'method': 'emit', 'event': 'nova_mensagem', 'room': 'sessao_1'})
+
+    ouvinte.server = SimpleNamespace(sleep=publicar_depois_de_ouvir)
+    mensagem = next(ouvinte._listen())
+    assert mensagem == {'method': 'emit', 'event': 'nova_mensagem', 'room': 'sessao_1'}
@@ -0,0 +1,48 @@
+from flask import Flask
+
+from config import ConnectionPool, get_db, init_app
+
+
+def test_conexao_reaproveitada_com_os_pragmas(banco):
+    pool = ConnectionPool(tamanho=2)
+    with pool.conexao() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA foreign_keys').fetchone()[0] == 1
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+        primeira = conn
+    with pool.conexao() as conn:
+        assert conn is primeira
+    assert pool.estatisticas() == {'livres': 1, 'emprestadas': 0, 'criadas': 1, 'tamanho': 2}
+
+
+def test_pool_cheio_cria_extra_e_fecha_na_devolucao(banco):
+    pool = ConnectionPool(tamanho=1)
+    conexoes = [pool.obter() for _ in range(3)]
+    assert len({id(c) for c in conexoes}) == 3
+    assert pool.estatisticas()['emprestadas'] == 3
+
+    for conn in conexoes:
+        pool.devolver(conn)
+    assert pool.estatisticas() == {'livres': 1, 'emprestadas': 0, 'criadas': 3, 'tamanho': 1}
+
+
+def test_transacao_pendente_nao_passa_para_o_proximo_uso(banco):
+    pool = ConnectionPool(tamanho=1)
+    with pool.conexao() as conn:
+        conn.execute("INSERT INTO aluno (nome, email, senha) VALUES ('Pendente', 'pendente@teste.com', 'x')")
+        assert conn.in_transaction
+    with pool.conexao() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM aluno WHERE email = 'pendente@teste.com'").fetchone()[0] == 0
+
+
+def test_requisicao_devolve_a_conexao_ao_terminar(banco):
+    import config
+
+    app = Flask(__name__)
+    init_app(app)
+    antes = config.pool.estatisticas()['emprestadas']
+    with app.app_context():
+        assert get_db() is get_db()
+        assert config.pool.estatisticas()['emprestadas'] == antes + 1
+    assert config.pool.estatisticas()['emprestadas'] == antes
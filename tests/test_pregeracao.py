@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from flask import Flask
+
+from pregeracao import TIPOS_PREGERADOS, PreGeracao
+
+MADRUGADA = datetime(2026, 10, 19, 3, 0)
+
+
+@pytest.fixture
+def tema():
+    return f'Ética {uuid4().hex}'
+
+
+def nova_pregeracao(tema, gerar, recusado=lambda tipo, texto: False):
+    pregeracao = PreGeracao(gerar, recusado)
+    pregeracao.init_app(Flask(__name__))
+    pregeracao.horario = (2, 6)
+    pregeracao.curriculo = [tema]
+    pregeracao.max_populares = 0
+    pregeracao.max_por_rodada = len(TIPOS_PREGERADOS)
+    return pregeracao
+
+
+def test_conteudo_gerado_na_madrugada_e_servido_sem_chamar_o_gemini(banco, tema):
+    chamadas = []
+
+    def gerar(tipo, tema):
+        chamadas.append(tipo)
+        return f'{tipo} pronto'
+
+    pregeracao = nova_pregeracao(tema, gerar)
+    assert pregeracao.rodada(MADRUGADA) == 3
+    assert sorted(chamadas) == sorted(TIPOS_PREGERADOS)
+
+    # O tema é comparado normalizado (maiúsculas e espaços não importam)
+    assert pregeracao.buscar('quiz', '  ' + tema.upper()) == 'quiz pronto'
+    assert pregeracao.buscar('correcao', tema) is None
+    assert pregeracao.estatisticas()['servidos'] == 1
+
+    # Ainda válido: a rodada seguinte não gera de novo
+    assert pregeracao.rodada(MADRUGADA) == 0
+    assert len(chamadas) == 3
+
+
+def test_conteudo_expirado_nao_e_servido(banco, tema):
+    pregeracao = nova_pregeracao(tema, lambda tipo, tema: 'texto')
+    pregeracao.rodada(MADRUGADA)
+    assert pregeracao.buscar('resumo', tema) == 'texto'
+
+    with banco.conexao() as conn:
+        conn.execute(
+            "UPDATE conteudo_pronto SET expira_em = ? WHERE tipo = 'resumo' AND tema = ?",
+            (datetime.now() - timedelta(minutes=1), tema)
+        )
+        conn.commit()
+
+    assert pregeracao.buscar('resumo', tema) is None
+    # E volta a ser candidato na próxima rodada
+    with banco.conexao() as conn:
+        assert ('resumo', tema, 'curriculo') in pregeracao.candidatos(conn, datetime.now())
+
+
+def test_fora_do_horario_tranquilo_nada_e_gerado(banco, tema):
+    chamadas = []
+    pregeracao = nova_pregeracao(tema, lambda tipo, tema: chamadas.append(tipo) or 'texto')
+    assert pregeracao.rodada(MADRUGADA.replace(hour=14)) == 0
+    assert chamadas == []
+    assert pregeracao.buscar('quiz', tema) is None
+
+
+def test_tema_recusado_nao_e_servido(banco, tema):
+    pregeracao = nova_pregeracao(tema, lambda tipo, tema: 'Não posso ajudar', recusado=lambda tipo, texto: True)
+    assert pregeracao.rodada(MADRUGADA) == 0
+    assert pregeracao.buscar('quiz', tema) is None
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+import threading
+from types import SimpleNamespace
+
+import prompt_cache
+from prompt_cache import PromptCache
+
+
+def novo_cache(monkeypatch, tokens, criar):
+    monkeypatch.setattr(prompt_cache.caching.CachedContent, 'create', criar)
+    cache = PromptCache('gemini-2.5-flash', 'instruções do tutor')
+    cache.habilitado = True
+    cache._tokens_instrucao = tokens
+    return cache
+
+
+def test_prompt_abaixo_do_minimo_nao_tenta_criar_o_cache(monkeypatch):
+    chamadas = []
+    cache = novo_cache(monkeypatch, 600, lambda **kwargs: chamadas.append(kwargs))
+
+    assert cache._cache_da_chave() is None
+    assert cache._cache_da_chave() is None
+    assert chamadas == []
+    assert cache.metricas()['habilitado'] is False
+
+
+def test_criacao_lenta_nao_trava_os_outros_turnos(monkeypatch):
+    comecou, liberar = threading.Event(), threading.Event()
+
+    def criar_lento(**kwargs):
+        comecou.set()
+        liberar.wait(5)
+        return SimpleNamespace(name='cachedContents/teste')
+
+    cache = novo_cache(monkeypatch, 2000, criar_lento)
+    resultado = []
+    criando = threading.Thread(target=lambda: resultado.append(cache._cache_da_chave()))
+    criando.start()
+    assert comecou.wait(5)
+
+    # Enquanto o create está em andamento, o lock está livre e os turnos seguem sem cache
+    assert cache._cache_da_chave() is None
+    assert cache.metricas()['caches_ativos'] == []
+
+    liberar.set()
+    criando.join(5)
+    assert resultado[0].name == 'cachedContents/teste'
+    assert cache._cache_da_chave() is resultado[0]
+
+
+def test_modelo_do_turno_usa_a_chave_escolhida(monkeypatch, tmp_path):
+    from api_key_manager import APIKeyManager
+
+    manager = APIKeyManager(keys_file=str(tmp_path / 'chaves.json'))
+    manager.add_key('chave-a', 'a')
+    manager.add_key('chave-b', 'b')
+    presos = []
+    monkeypatch.setattr(manager, 'model_for_key', lambda key_entry, model_name, **kwargs: presos.append(key_entry) or 'modelo')
+
+    cache = PromptCache('gemini-2.5-flash', 'instruções do tutor', manager)
+    chave_b = manager.keys_data['keys'][1]
+    assert cache.obter_modelo(chave_b) == 'modelo'
+    assert presos == [chave_b]
+
+
+def test_cache_e_reaproveitado_ate_perto_de_expirar(monkeypatch):
+    criados = []
+
+    def criar(**kwargs):
+        criados.append(SimpleNamespace(name=f'cachedContents/{len(criados)}'))
+        return criados[-1]
+
+    cache = novo_cache(monkeypatch, 2000, criar)
+    primeiro = cache._cache_da_chave()
+    assert cache._cache_da_chave() is primeiro
+    assert len(criados) == 1
+
+    cache._caches['default']['expira_em'] = datetime.now() - timedelta(seconds=1)
+    assert cache._cache_da_chave() is criados[1]
+
+
+def test_falha_no_create_nao_e_repetida_a_cada_turno(monkeypatch):
+    chamadas = []
+
+    def criar_falhando(**kwargs):
+        chamadas.append(kwargs)
+        raise RuntimeError('cache indisponível')
+
+    cache = novo_cache(monkeypatch, 2000, criar_falhando)
+    assert cache._cache_da_chave() is None
+    assert cache._cache_da_chave() is None
+    assert len(chamadas) == 1
+
+
+def test_metricas_separam_turnos_com_e_sem_cache(monkeypatch):
+    cache = novo_cache(monkeypatch, 2000, lambda **kwargs: None)
+    cache.registrar_uso(SimpleNamespace(prompt_token_count=2100, cached_content_token_count=2000))
+    cache.registrar_uso(SimpleNamespace(prompt_token_count=2100, cached_content_token_count=0))
+
+    metricas = cache.metricas()
+    assert metricas['turnos'] == 2
+    assert metricas['turnos_com_cache'] == 1
+    assert metricas['tokens_economizados_por_turno'] == 1000
+    assert metricas['overhead_instrucao_por_turno'] == 1000
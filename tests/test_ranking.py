@@ -0,0 +1,104 @@
+import random
+
+import pytest
+from flask import Flask
+
+from ranking import ArvoreFenwick, _Placar
+from utils import MAX_PERGUNTAS_QUIZ, validar_placar
+
+
+def posicao_por_forca_bruta(pontos, id_aluno):
+    return 1 + sum(1 for outros in pontos.values() if outros > pontos[id_aluno])
+
+
+def test_fenwick_prefixo():
+    arvore = ArvoreFenwick(10)
+    for indice in (0, 3, 3, 9):
+        arvore.somar(indice, 1)
+    assert arvore.prefixo(0) == 1
+    assert arvore.prefixo(3) == 3
+    assert arvore.prefixo(9) == 4
+    assert arvore.prefixo(50) == 4
+
+
+@pytest.mark.parametrize('operacao', ['somar', 'prefixo'])
+def test_fenwick_recusa_indice_negativo(operacao):
+    arvore = ArvoreFenwick(8)
+    with pytest.raises(ValueError):
+        if operacao == 'somar':
+            arvore.somar(-1, 1)
+        else:
+            arvore.prefixo(-1)
+
+
+def test_placar_confere_com_forca_bruta():
+    gerador = random.Random(42)
+    placar = _Placar([], tamanho_maximo=256)
+    for _ in range(500):
+        id_aluno = gerador.randrange(40)
+        placar.definir(id_aluno, placar.pontos.get(id_aluno, 0) + gerador.randrange(0, 20))
+        for outro in placar.pontos:
+            assert placar.posicao(outro) == posicao_por_forca_bruta(placar.pontos, outro)
+
+
+def test_placar_pontuacao_negativa_nao_trava():
+    # Regressão: somar(-1) entrava em laço infinito (i & -i == 0)
+    placar = _Placar([(1, 3)])
+    placar.definir(2, -1)
+    assert placar.posicao(1) == 1
+    assert placar.posicao(2) == 2
+
+
+def test_placar_pontuacao_enorme_nao_cresce_a_arvore():
+    placar = _Placar([(1, 3), (2, 10 ** 9)], tamanho_maximo=128)
+    placar.definir(3, 10 ** 12)
+    assert placar.arvore.tamanho == 128
+    assert [placar.posicao(i) for i in (3, 2, 1)] == [1, 2, 3]
+
+    placar.definir(1, 10 ** 10)
+    assert [placar.posicao(i) for i in (3, 1, 2)] == [1, 2, 3]
+
+
+@pytest.mark.parametrize('acertos,total', [
+    (-5, 10), (11, 10), (0, MAX_PERGUNTAS_QUIZ + 1), (10 ** 9, 10 ** 9), ('x', 10), (1.5, 10), (True, 10), (None, 10),
+])
+def test_validar_placar_recusa(acertos, total):
+    with pytest.raises(ValueError):
+        validar_placar(acertos, total)
+
+
+def test_validar_placar_converte_texto():
+    assert validar_placar('3', '5') == (3, 5)
+    assert validar_placar(3.0, 10) == (3, 10)
+
+
+@pytest.fixture
+def cliente_quiz(banco):
+    from config import init_app
+    from quiz_routes import quiz_bp
+
+    app = Flask(__name__)
+    init_app(app)
+    app.register_blueprint(quiz_bp)
+    return app.test_client()
+
+
+@pytest.mark.parametrize('acertos,total', [(-5, 10), (10 ** 9, 10 ** 9), (7, 5), ('abc', 5)])
+def test_salvar_resultado_recusa_placar_invalido(cliente_quiz, aluno, banco, acertos, total):
+    resposta = cliente_quiz.post('/quiz/salvar_resultado', json={
+        'id_aluno': aluno, 'tema': 'Ética', 'acertos': acertos, 'total_perguntas': total
+    })
+    assert resposta.status_code == 400
+    with banco.conexao() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM quiz_resultado WHERE id_aluno = ?', (aluno,)).fetchone()[0] == 0
+        assert conn.execute('SELECT COUNT(*) FROM ranking_semanal WHERE id_aluno = ?', (aluno,)).fetchone()[0] == 0
+
+
+def test_salvar_resultado_aceita_numeros_em_texto(cliente_quiz, aluno, banco):
+    resposta = cliente_quiz.post('/quiz/salvar_resultado', json={
+        'id_aluno': aluno, 'tema': 'Ética', 'acertos': '3', 'total_perguntas': '5'
+    })
+    assert resposta.status_code == 201
+    with banco.conexao() as conn:
+        linha = conn.execute('SELECT acertos, total_perguntas FROM dominio_aluno WHERE id_aluno = ?', (aluno,)).fetchone()
+    assert tuple(linha) == (3, 5)
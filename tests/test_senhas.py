@@ -0,0 +1,57 @@
+import pytest
+
+import senhas
+from senhas import e_hash, gerar_hash, verificar_senha
+
+
+@pytest.fixture(autouse=True)
+def custo_baixo(monkeypatch):
+    # Custo mínimo para os testes não levarem segundos por hash
+    monkeypatch.setattr(senhas, 'SCRYPT_N', 2 ** 4)
+    monkeypatch.setattr(senhas, 'SCRYPT_R', 1)
+    monkeypatch.setattr(senhas, 'SCRYPT_P', 1)
+
+
+def test_hash_confere_e_usa_sal():
+    armazenada = gerar_hash('segredo')
+    assert e_hash(armazenada)
+    assert armazenada != gerar_hash('segredo')
+    assert verificar_senha('segredo', armazenada) == (True, False)
+    assert verificar_senha('errada', armazenada) == (False, False)
+
+
+def test_texto_puro_legado_pede_rehash():
+    assert verificar_senha('segredo', 'segredo') == (True, True)
+    assert verificar_senha('errada', 'segredo') == (False, True)
+
+
+def test_custo_antigo_pede_rehash(monkeypatch):
+    armazenada = gerar_hash('segredo')
+    monkeypatch.setattr(senhas, 'SCRYPT_N', 2 ** 5)
+    assert verificar_senha('segredo', armazenada) == (True, True)
+    # Senha errada não dispara rehash
+    assert verificar_senha('errada', armazenada) == (False, False)
+
+
+@pytest.mark.parametrize('armazenada', [None, '', 'scrypt$quebrado', 'scrypt$16$1$1$@@@$@@@'])
+def test_valor_gravado_invalido_recusa(armazenada):
+    assert verificar_senha('segredo', armazenada) == (False, False)
+
+
+def test_todos_os_caminhos_pagam_um_scrypt(monkeypatch):
+    # Texto puro, hash e e-mail inexistente custam o mesmo: o tempo não revela a conta
+    armazenada = gerar_hash('segredo')
+    chamadas = []
+    scrypt_real = senhas._scrypt
+    monkeypatch.setattr(senhas, '_scrypt', lambda *args: chamadas.append(args) or scrypt_real(*args))
+
+    for verificar in (
+        lambda: verificar_senha('segredo', 'segredo'),
+        lambda: verificar_senha('errada', 'segredo'),
+        lambda: verificar_senha('segredo', armazenada),
+        lambda: senhas.verificar_sem_usuario('segredo'),
+    ):
+        chamadas.clear()
+        verificar()
+        assert len(chamadas) == 1
+        assert chamadas[0][2:] == (senhas.SCRYPT_N, senhas.SCRYPT_R, senhas.SCRYPT_P)
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+import tarefas
+from tarefas import executar_bloqueante, iniciar_em_segundo_plano, iterar_bloqueante, pausar
+
+pytestmark = pytest.mark.skipif(tarefas.eventlet is None, reason='sem eventlet o hub não existe')
+
+
+def relogio_do_hub(tiques):
+    """Green-thread que só avança se o hub não estiver travado"""
+    def tique():
+        for _ in range(20):
+            tiques.append(time.monotonic())
+            pausar(0.01)
+    return iniciar_em_segundo_plano(tique)
+
+
+def test_chamada_bloqueante_nao_trava_o_hub():
+    tiques = []
+    tarefa = relogio_do_hub(tiques)
+    executar_bloqueante(time.sleep, 0.2)  # time.sleep real (sem monkey-patch)
+    durante = len(tiques)
+    tarefa.wait()
+    assert durante >= 5
+
+
+def test_iterar_bloqueante_mantem_a_ordem_e_libera_o_hub():
+    def stream_lento():
+        for trecho in ('a', 'b', 'c'):
+            time.sleep(0.05)
+            yield trecho
+        raise RuntimeError('stream caiu')
+
+    tiques = []
+    tarefa = relogio_do_hub(tiques)
+    recebidos = []
+    with pytest.raises(RuntimeError, match='stream caiu'):
+        for trecho in iterar_bloqueante(stream_lento()):
+            recebidos.append(trecho)
+    durante = len(tiques)
+    tarefa.wait()
+    assert recebidos == ['a', 'b', 'c']
+    assert durante >= 5
@@ -0,0 +1,81 @@
+import io
+import json
+from uuid import uuid4
+
+from transferencia import Importacao, exportar, ler_registros
+
+
+def importar(banco, entidade, texto, formato, tamanho_lote=2):
+    with banco.conexao() as conn:
+        registros = ler_registros(io.BytesIO(texto.encode('utf-8')), formato)
+        return Importacao(entidade, tamanho_lote=tamanho_lote).executar(conn, registros)
+
+
+def test_csv_aponta_o_erro_de_cada_linha_e_grava_as_validas(banco):
+    dominio = uuid4().hex
+    texto = (
+        'nome,email,senha,plano\n'
+        f'Ana,ana@{dominio}.com,segredo,premium\n'
+        f',sem.nome@{dominio}.com,segredo,\n'
+        f'Bia,bia@{dominio}.com,segredo,ouro\n'
+        f'Caio,caio@{dominio}.com,segredo,\n'
+        f'Ana de novo,ana@{dominio}.com,segredo,\n'
+        f'Duda,duda@{dominio}.com,segredo,freemium\n'
+    )
+
+    resumo = importar(banco, 'alunos', texto, 'csv')
+
+    assert resumo['inseridos'] == 3
+    assert resumo['erros'] == [
+        {'linha': 3, 'erro': "Campo 'nome' é obrigatório"},
+        {'linha': 4, 'erro': "Plano inválido. Use 'freemium' ou 'premium'"},
+        {'linha': 6, 'erro': 'E-mail já cadastrado'},
+    ]
+    with banco.conexao() as conn:
+        nomes = {linha['nome'] for linha in conn.execute('SELECT nome FROM aluno WHERE email LIKE ?', (f'%@{dominio}.com',))}
+    assert nomes == {'Ana', 'Caio', 'Duda'}
+
+
+def test_ndjson_invalido_e_aluno_inexistente_sao_erros_da_linha(banco, aluno):
+    linhas = [
+        json.dumps({'id_aluno': aluno, 'tema': 'Ética', 'acertos': 7, 'total_perguntas': 10, 'data_criacao': '2026-10-01'}),
+        '{quebrado',
+        '[1, 2]',
+        json.dumps({'id_aluno': 999999999, 'tema': 'Ética', 'acertos': 1, 'total_perguntas': 10}),
+        json.dumps({'id_aluno': aluno, 'tema': 'Ética', 'acertos': 11, 'total_perguntas': 10}),
+        json.dumps({'id_aluno': aluno, 'tema': 'Sociologia urbana', 'acertos': 4, 'total_perguntas': 5, 'data_criacao': '2026-10-02'}),
+    ]
+
+    resumo = importar(banco, 'resultados', '\n'.join(linhas) + '\n', 'ndjson')
+
+    assert resumo['inseridos'] == 2
+    assert [erro['linha'] for erro in resumo['erros']] == [2, 3, 4, 5]
+    assert resumo['erros'][1]['erro'] == 'Cada linha deve ser um objeto JSON'
+    assert resumo['erros'][2]['erro'] == 'Aluno não encontrado'
+
+
+def test_exportacao_devolve_o_que_foi_importado(banco, aluno):
+    resultados = [
+        {'id_aluno': aluno, 'tema': f'Filosofia {i}', 'acertos': i, 'total_perguntas': 5, 'data_criacao': f'2026-09-1{i}'}
+        for i in range(5)
+    ]
+    texto = ''.join(json.dumps(r) + '\n' for r in resultados)
+    assert importar(banco, 'resultados', texto, 'ndjson')['inseridos'] == 5
+
+    for formato in ('ndjson', 'csv'):
+        saida = ''.join(exportar('resultados', formato, desde='2026-09-10', ate='2026-09-14', tamanho_lote=2))
+        exportados = list(ler_registros(io.BytesIO(saida.encode('utf-8')), formato))
+        do_aluno = [r for _, r, _ in exportados if int(r['id_aluno']) == aluno]
+        assert [
+            {c: r[c] for c in ('tema', 'data_criacao')} | {'acertos': int(r['acertos']), 'total_perguntas': int(r['total_perguntas'])}
+            for r in do_aluno
+        ] == [
+            {c: r[c] for c in ('tema', 'data_criacao', 'acertos', 'total_perguntas')} for r in resultados
+        ]
+        assert all(r['materia'] == 'Filosofia' for r in do_aluno)
+
+
+def test_exportacao_de_alunos_nao_inclui_senha(banco, aluno):
+    saida = ''.join(exportar('alunos', 'ndjson'))
+    exportado = next(json.loads(linha) for linha in saida.splitlines() if json.loads(linha)['id_aluno'] == aluno)
+    assert 'senha' not in exportado
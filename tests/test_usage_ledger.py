@@ -0,0 +1,63 @@
+from flask import Flask
+
+import premium_routes
+from usage_ledger import UsageLedger, estimar_tokens
+
+
+def test_estorno_devolve_a_reserva(banco, aluno):
+    ledger = UsageLedger(limite_chamadas=1)
+    assert ledger.reservar(aluno, 'prompt de teste') is None
+    assert ledger.reservar(aluno, 'outro prompt') is not None
+
+    ledger.estornar(aluno, 'prompt de teste')
+    assert ledger.consultar(aluno)['chamadas'] == 0
+    assert ledger.consultar(aluno)['tokens_estimados'] == 0
+    assert ledger.reservar(aluno, 'outro prompt') is None
+
+
+def test_estorno_nao_deixa_o_uso_negativo(banco, aluno):
+    ledger = UsageLedger()
+    ledger.estornar(aluno, 'prompt sem reserva')
+    assert ledger.consultar(aluno)['chamadas'] == 0
+    assert ledger.consultar(aluno)['tokens_estimados'] == 0
+
+
+def test_geracao_que_falha_estorna_o_uso(banco, aluno, monkeypatch):
+    ledger = UsageLedger()
+    app = Flask(__name__)
+    app.config['USAGE_LEDGER'] = ledger
+    monkeypatch.setattr(premium_routes, 'gerar_texto', lambda tipo, tema, texto=None: None)
+
+    prompt = premium_routes.PROMPTS['resumo']('Contratualismo', None)
+    assert ledger.reservar(aluno, prompt) is None
+    with app.app_context():
+        _, status, _ = premium_routes.gerar_conteudo('resumo', aluno, 'Contratualismo')
+
+    assert status == 500
+    assert ledger.consultar(aluno)['chamadas'] == 0
+    assert ledger.consultar(aluno)['tokens_estimados'] == 0
+    assert estimar_tokens(prompt) > 0
+
+
+def test_modo_compartilhado_soma_os_workers(banco, aluno):
+    # Dois processos com o mesmo banco: o limite vale para o aluno, não por worker
+    workers = [UsageLedger(limite_chamadas=3, compartilhado=True) for _ in range(2)]
+    permitidas = [workers[i % 2].reservar(aluno, 'prompt') is None for i in range(6)]
+    assert permitidas == [True, True, True, False, False, False]
+
+    excedido = workers[0].reservar(aluno, 'prompt')
+    assert excedido['chamadas'] == 3
+
+    workers[1].estornar(aluno, 'prompt')
+    assert workers[0].consultar(aluno)['chamadas'] == 2
+    assert workers[0].reservar(aluno, 'prompt') is None
+    assert workers[1].reservar(aluno, 'prompt') is not None
+
+
+def test_modo_compartilhado_respeita_o_limite_de_tokens(banco, aluno):
+    ledger = UsageLedger(limite_tokens=10, compartilhado=True)
+    assert ledger.reservar(aluno, 'x' * 100) is not None
+    assert ledger.reservar(aluno, 'x' * 20) is None
+    ledger.registrar_saida(aluno, 'y' * 40)
+    assert ledger.consultar(aluno)['tokens_estimados'] == 15
+    assert ledger.reservar(aluno, 'x' * 4) is not None
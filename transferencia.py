@@ -0,0 +1,312 @@
+"""
+Importação e exportação em massa (CSV ou NDJSON)
+A entrada é lida linha a linha do corpo da requisição e gravada em lotes; a saída
+é gerada por um gerador que busca as linhas do banco aos poucos (fetchmany)
+"""
+import csv
+from datetime import date, datetime
+import io
+import json
+import os
+import sqlite3
+
+from config import pool
+from dominio import registrar_dominio_lote
+from ranking import registrar_ranking
+from senhas import e_hash, hash_fora_do_hub
+from utils import classificar_materia, validar_placar
+
+FORMATOS = ('csv', 'ndjson')
+TAMANHO_LOTE = int(os.getenv('IMPORTACAO_LOTE', 500))
+MAX_ERROS_LISTADOS = 1000
+
+
+def detectar_formato(formato, content_type):
+    """Formato pedido em ?formato= ou deduzido do Content-Type (padrão: csv)"""
+    if formato:
+        return formato.lower()
+    if content_type and ('ndjson' in content_type or 'jsonl' in content_type):
+        return 'ndjson'
+    return 'csv'
+
+
+def ler_registros(stream, formato):
+    """
+    Percorre a entrada sem carregá-la inteira na memória
+
+    Yields:
+        (linha, registro, erro): registro é um dict ou None quando a linha é inválida
+    """
+    texto = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if formato == 'csv':
+        leitor = csv.DictReader(texto)
+        for registro in leitor:
+            # line_num considera o cabeçalho e quebras dentro de aspas
+            yield leitor.line_num, {k: (v.strip() if isinstance(v, str) else v) for k, v in registro.items() if k}, None
+        return
+
+    for numero, linha in enumerate(texto, start=1):
+        if not linha.strip():
+            continue
+        try:
+            registro = json.loads(linha)
+        except json.JSONDecodeError as e:
+            yield numero, None, f"JSON inválido: {e.msg}"
+            continue
+        if not isinstance(registro, dict):
+            yield numero, None, "Cada linha deve ser um objeto JSON"
+            continue
+        yield numero, registro, None
+
+
+# ============================================
+# VALIDAÇÃO DAS LINHAS IMPORTADAS
+# ============================================
+
+def _obrigatorio(registro, campo):
+    valor = registro.get(campo)
+    if valor is None or (isinstance(valor, str) and not valor.strip()):
+        raise ValueError(f"Campo '{campo}' é obrigatório")
+    return valor.strip() if isinstance(valor, str) else valor
+
+
+def _inteiro(registro, campo):
+    valor = _obrigatorio(registro, campo)
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Campo '{campo}' deve ser um número inteiro")
+
+
+def validar_aluno(registro):
+    """Returns: parâmetros do INSERT em aluno. Raises: ValueError com a mensagem da linha"""
+    nome = _obrigatorio(registro, 'nome')
+    email = _obrigatorio(registro, 'email').lower()
+    senha = str(_obrigatorio(registro, 'senha'))
+    plano = (registro.get('plano') or 'freemium').strip().lower()
+    if plano not in ('freemium', 'premium'):
+        raise ValueError("Plano inválido. Use 'freemium' ou 'premium'")
+    if '@' not in email:
+        raise ValueError("E-mail inválido")
+    # Hashes vindos de outra base são mantidos; texto puro é convertido aqui
+    if not e_hash(senha):
+        senha = hash_fora_do_hub(senha)
+    return (nome, email, senha, plano, registro.get('url_foto') or None)
+
+
+def validar_resultado(registro):
+    """Returns: parâmetros do INSERT em quiz_resultado. Raises: ValueError com a mensagem da linha"""
+    id_aluno = _inteiro(registro, 'id_aluno')
+    tema = _obrigatorio(registro, 'tema')
+    acertos, total_perguntas = validar_placar(
+        _obrigatorio(registro, 'acertos'), _obrigatorio(registro, 'total_perguntas')
+    )
+
+    data_criacao = registro.get('data_criacao') or date.today().isoformat()
+    try:
+        data_criacao = date.fromisoformat(str(data_criacao)[:10]).isoformat()
+    except ValueError:
+        raise ValueError("data_criacao deve estar no formato AAAA-MM-DD")
+
+    return (id_aluno, tema, classificar_materia(tema), acertos, total_perguntas, data_criacao)
+
+
+def _apos_gravar_resultados(conn, gravados):
+    """Leva os resultados importados ao domínio por matéria/tema e ao ranking semanal (na transação do lote)"""
+    registrar_dominio_lote(conn, (
+        (id_aluno, tema, acertos, total_perguntas, data_criacao)
+        for id_aluno, tema, _, acertos, total_perguntas, data_criacao in gravados
+    ))
+    for id_aluno, tema, _, acertos, _, data_criacao in gravados:
+        registrar_ranking(conn, id_aluno, tema, acertos, data_criacao)
+
+
+# entidade -> (validação, INSERT, função chamada com as linhas gravadas do lote ou None)
+IMPORTACOES = {
+    'alunos': (
+        validar_aluno,
+        'INSERT INTO aluno (nome, email, senha, plano, url_foto) VALUES (?, ?, ?, ?, ?)',
+        None
+    ),
+    'resultados': (
+        validar_resultado,
+        'INSERT INTO quiz_resultado (id_aluno, tema, materia, acertos, total_perguntas, data_criacao) VALUES (?, ?, ?, ?, ?, ?)',
+        _apos_gravar_resultados
+    ),
+}
+
+
+# ============================================
+# IMPORTAÇÃO
+# ============================================
+
+class Importacao:
+    def __init__(self, entidade, tamanho_lote=None):
+        """
+        Args:
+            entidade: Chave de IMPORTACOES ('alunos' ou 'resultados')
+            tamanho_lote: Linhas por transação
+        """
+        self.validar, self.sql, self.apos_gravar = IMPORTACOES[entidade]
+        self.tamanho_lote = tamanho_lote or TAMANHO_LOTE
+        self.inseridos = 0
+        self.total_erros = 0
+        self.erros = []
+
+    def _erro(self, linha, mensagem):
+        self.total_erros += 1
+        if len(self.erros) < MAX_ERROS_LISTADOS:
+            self.erros.append({'linha': linha, 'erro': mensagem})
+
+    def _gravar_lote(self, conn, lote):
+        """
+        Insere o lote com executemany; se alguma linha violar uma restrição,
+        refaz o lote linha a linha (cada uma em seu SAVEPOINT) para apontar qual falhou
+        """
+        conn.execute('BEGIN')
+        try:
+            try:
+                conn.execute('SAVEPOINT lote')
+                gravados = [parametros for _, parametros in lote]
+                conn.executemany(self.sql, gravados)
+                conn.execute('RELEASE lote')
+            except sqlite3.IntegrityError:
+                conn.execute('ROLLBACK TO lote')
+                conn.execute('RELEASE lote')
+                gravados = []
+                for linha, parametros in lote:
+                    try:
+                        conn.execute('SAVEPOINT linha')
+                        conn.execute(self.sql, parametros)
+                        conn.execute('RELEASE linha')
+                        gravados.append(parametros)
+                    except sqlite3.IntegrityError as e:
+                        conn.execute('ROLLBACK TO linha')
+                        conn.execute('RELEASE linha')
+                        self._erro(linha, _mensagem_integridade(e))
+            if self.apos_gravar and gravados:
+                self.apos_gravar(conn, gravados)
+            conn.commit()
+            self.inseridos += len(gravados)
+        except Exception:
+            conn.rollback()
+            raise
+
+    def executar(self, conn, registros):
+        """
+        Valida e grava os registros em transações de tamanho_lote linhas
+
+        Returns:
+            dict: Resumo com inseridos, total de erros e os erros por linha
+        """
+        lote = []
+        for linha, registro, erro in registros:
+            if erro:
+                self._erro(linha, erro)
+                continue
+            try:
+                lote.append((linha, self.validar(registro)))
+            except ValueError as e:
+                self._erro(linha, str(e))
+                continue
+
+            if len(lote) >= self.tamanho_lote:
+                self._gravar_lote(conn, lote)
+                lote = []
+
+        if lote:
+            self._gravar_lote(conn, lote)
+
+        return self.resumo()
+
+    def resumo(self):
+        return {
+            'inseridos': self.inseridos,
+            'total_erros': self.total_erros,
+            'erros': sorted(self.erros, key=lambda erro: erro['linha']),
+            'erros_omitidos': max(0, self.total_erros - len(self.erros))
+        }
+
+
+def _mensagem_integridade(erro):
+    texto = str(erro)
+    if 'UNIQUE' in texto and 'email' in texto:
+        return "E-mail já cadastrado"
+    if 'FOREIGN KEY' in texto:
+        return "Aluno não encontrado"
+    if 'CHECK' in texto:
+        return "Valor fora do permitido"
+    return texto
+
+
+# ============================================
+# EXPORTAÇÃO
+# ============================================
+
+# entidade -> (tabela, colunas exportadas, coluna de data usada nos filtros desde/ate)
+# A senha dos alunos nunca é exportada
+EXPORTACOES = {
+    'alunos': ('aluno', ['id_aluno', 'nome', 'email', 'plano', 'url_foto'], None),
+    'resultados': ('quiz_resultado', ['id_resultado', 'id_aluno', 'tema', 'materia', 'acertos', 'total_perguntas', 'data_criacao'], 'data_criacao'),
+    'historico': ('historico_premium', ['id_historico', 'id_aluno', 'tipo_atividade', 'tema', 'conteudo_gerado', 'texto_original',
+                                        'acertos', 'total_perguntas', 'respostas_usuario', 'data_criacao'], 'data_criacao'),
+}
+
+
+def _serializar(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+def exportar(entidade, formato, desde=None, ate=None, tamanho_lote=None):
+    """
+    Gera a exportação em pedaços de texto, buscando tamanho_lote linhas por vez
+
+    Usa uma conexão própria do pool, devolvida quando o gerador termina (ou é fechado).
+
+    Yields:
+        str: Cabeçalho e linhas em CSV, ou um objeto JSON por linha (NDJSON)
+    """
+    tabela, colunas, coluna_data = EXPORTACOES[entidade]
+    tamanho_lote = tamanho_lote or TAMANHO_LOTE
+
+    sql = f"SELECT {', '.join(colunas)} FROM {tabela}"
+    filtros = []
+    params = []
+    if coluna_data and desde:
+        filtros.append(f"{coluna_data} >= ?")
+        params.append(desde)
+    if coluna_data and ate:
+        # Inclui o dia inteiro de "ate" (a coluna pode ter hora)
+        filtros.append(f"{coluna_data} < date(?, '+1 day')")
+        params.append(ate)
+    if filtros:
+        sql += " WHERE " + " AND ".join(filtros)
+    sql += f" ORDER BY {colunas[0]}"
+
+    with pool.conexao() as conn:
+        cursor = conn.execute(sql, params)
+
+        if formato == 'csv':
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer)
+            escritor.writerow(colunas)
+            yield buffer.getvalue()
+
+        while True:
+            linhas = cursor.fetchmany(tamanho_lote)
+            if not linhas:
+                break
+
+            if formato == 'csv':
+                buffer = io.StringIO()
+                escritor = csv.writer(buffer)
+                escritor.writerows([[_serializar(v) for v in linha] for linha in linhas])
+                yield buffer.getvalue()
+            else:
+                yield "".join(
+                    json.dumps({c: _serializar(linha[c]) for c in colunas}, ensure_ascii=False) + "\n"
+                    for linha in linhas
+                )
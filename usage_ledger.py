@@ -0,0 +1,273 @@
+"""
+Ledger de uso das funcionalidades Premium
+Conta chamadas e tokens estimados por aluno/dia e aplica os limites diários
+antes de qualquer chamada ao Gemini. Com um worker o uso é somado em memória e
+gravado em lotes; com vários (modo compartilhado) cada reserva é um UPSERT
+condicional no SQLite, para o limite valer para o aluno e não por processo
+"""
+from datetime import date, datetime, timedelta
+import os
+import sqlite3
+
+from config import pool
+from tarefas import iniciar_em_segundo_plano, pausar
+
+
+# Reserva atômica do modo compartilhado: só soma (e devolve a linha) se couber no limite
+SQL_RESERVAR = """
+INSERT INTO uso_diario (id_aluno, dia, chamadas, tokens_estimados)
+SELECT :id_aluno, :dia, 1, :tokens WHERE 1 <= :limite_chamadas AND :tokens <= :limite_tokens
+ON CONFLICT(id_aluno, dia) DO UPDATE SET
+    chamadas = chamadas + 1,
+    tokens_estimados = tokens_estimados + excluded.tokens_estimados
+WHERE chamadas + 1 <= :limite_chamadas AND tokens_estimados + excluded.tokens_estimados <= :limite_tokens
+RETURNING chamadas, tokens_estimados
+"""
+
+SQL_SOMAR = """
+INSERT INTO uso_diario (id_aluno, dia, chamadas, tokens_estimados)
+VALUES (:id_aluno, :dia, MAX(:chamadas, 0), MAX(:tokens, 0))
+ON CONFLICT(id_aluno, dia) DO UPDATE SET
+    chamadas = MAX(chamadas + :chamadas, 0),
+    tokens_estimados = MAX(tokens_estimados + :tokens, 0)
+RETURNING chamadas, tokens_estimados
+"""
+
+
+def estimar_tokens(texto):
+    """Estimativa barata de tokens (~4 caracteres por token)"""
+    if not texto:
+        return 0
+    return max(1, len(texto) // 4)
+
+
+class UsageLedger:
+    def __init__(self, limite_chamadas=None, limite_tokens=None, intervalo_flush=None, compartilhado=False):
+        """
+        Inicializa o ledger
+
+        Args:
+            limite_chamadas: Máximo de gerações por aluno por dia
+            limite_tokens: Máximo de tokens estimados (entrada + saída) por aluno por dia
+            intervalo_flush: Segundos entre as gravações no SQLite
+            compartilhado: True quando há mais de um worker (o uso vai direto para o banco)
+        """
+        self.limite_chamadas = limite_chamadas or int(os.getenv('LIMITE_CHAMADAS_DIA', 100))
+        self.limite_tokens = limite_tokens or int(os.getenv('LIMITE_TOKENS_DIA', 200000))
+        self.intervalo_flush = intervalo_flush or int(os.getenv('USO_FLUSH_INTERVALO', 30))
+        self.compartilhado = compartilhado
+
+        # (id_aluno, dia) -> {'chamadas', 'tokens'} já consolidado + pendente
+        self._uso = {}
+        # (id_aluno, dia) -> {'chamadas', 'tokens'} ainda não gravado
+        self._pendente = {}
+        self._tarefa_flush = None
+
+    def _chave(self, id_aluno):
+        return (int(id_aluno), date.today().isoformat())
+
+    def _carregar(self, chave):
+        """Busca o uso do dia no banco na primeira vez que o aluno aparece neste processo"""
+        uso = self._uso.get(chave)
+        if uso is not None:
+            return uso
+
+        uso = {'chamadas': 0, 'tokens': 0}
+        conn = pool.obter()
+        if conn:
+            try:
+                row = conn.execute(
+                    'SELECT chamadas, tokens_estimados FROM uso_diario WHERE id_aluno = ? AND dia = ?',
+                    chave
+                ).fetchone()
+                if row:
+                    uso = {'chamadas': row['chamadas'], 'tokens': row['tokens_estimados']}
+            except sqlite3.Error as e:
+                print(f"Erro ao carregar uso do aluno {chave[0]}: {e}")
+            finally:
+                pool.devolver(conn)
+
+        self._uso[chave] = uso
+        return uso
+
+    def _no_banco(self, sql, parametros):
+        """
+        Executa um UPSERT do modo compartilhado
+
+        Returns:
+            (executou, linha): executou é False se o banco não respondeu (linha None
+            quando o UPSERT não alterou nada)
+        """
+        conn = pool.obter()
+        if not conn:
+            return False, None
+        try:
+            linha = conn.execute(sql, parametros).fetchone()
+            conn.commit()
+            return True, linha
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar uso do aluno {parametros['id_aluno']}: {e}")
+            conn.rollback()
+            return False, None
+        finally:
+            pool.devolver(conn)
+
+    def _somar(self, chave, chamadas, tokens):
+        if self.compartilhado:
+            executou, linha = self._no_banco(SQL_SOMAR, {
+                'id_aluno': chave[0], 'dia': chave[1], 'chamadas': chamadas, 'tokens': tokens
+            })
+            if executou:
+                self._uso[chave] = {'chamadas': linha['chamadas'], 'tokens': linha['tokens_estimados']}
+                return
+            # Sem o banco, soma localmente e o flush grava depois
+
+        uso = self._carregar(chave)
+        uso['chamadas'] += chamadas
+        uso['tokens'] += tokens
+
+        pendente = self._pendente.setdefault(chave, {'chamadas': 0, 'tokens': 0})
+        pendente['chamadas'] += chamadas
+        pendente['tokens'] += tokens
+
+    def reservar(self, id_aluno, prompt):
+        """
+        Verifica os limites e, se houver saldo, registra a chamada
+
+        Args:
+            id_aluno: Aluno que está gerando
+            prompt: Prompt que será enviado (para estimar os tokens de entrada)
+
+        Returns:
+            dict: None se a chamada foi autorizada, ou os dados do limite excedido
+        """
+        chave = self._chave(id_aluno)
+        tokens_prompt = estimar_tokens(prompt)
+
+        if self.compartilhado:
+            executou, linha = self._no_banco(SQL_RESERVAR, {
+                'id_aluno': chave[0], 'dia': chave[1], 'tokens': tokens_prompt,
+                'limite_chamadas': self.limite_chamadas, 'limite_tokens': self.limite_tokens
+            })
+            if executou:
+                # O uso em memória passa a ser só o último valor lido do banco
+                self._uso.pop(chave, None)
+                if linha is not None:
+                    self._uso[chave] = {'chamadas': linha['chamadas'], 'tokens': linha['tokens_estimados']}
+                    return None
+                return self._excedido(self._carregar(chave))
+            # Sem o banco, cai para a contagem local (melhor que recusar todo mundo)
+
+        uso = self._carregar(chave)
+        if uso['chamadas'] >= self.limite_chamadas or uso['tokens'] + tokens_prompt > self.limite_tokens:
+            return self._excedido(uso)
+
+        self._somar(chave, 1, tokens_prompt)
+        return None
+
+    def _excedido(self, uso):
+        """Dados do limite excedido (corpo do 429)"""
+        amanha = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+        return {
+            'chamadas': uso['chamadas'],
+            'limite_chamadas': self.limite_chamadas,
+            'tokens_estimados': uso['tokens'],
+            'limite_tokens': self.limite_tokens,
+            'retry_after': max(1, int((amanha - datetime.now()).total_seconds()))
+        }
+
+    def estornar(self, id_aluno, prompt):
+        """
+        Devolve uma chamada reservada que não chegou a gerar nada (falha do
+        Gemini ou pedido recusado depois da reserva)
+        """
+        chave = self._chave(id_aluno)
+        uso = self._carregar(chave)
+        # Na virada do dia a reserva ficou no dia anterior: não deixa o novo negativo
+        chamadas = min(1, uso['chamadas'])
+        tokens = min(estimar_tokens(prompt), uso['tokens'])
+        if chamadas or tokens:
+            self._somar(chave, -chamadas, -tokens)
+
+    def registrar_saida(self, id_aluno, texto):
+        """Soma os tokens estimados da resposta gerada"""
+        if texto:
+            self._somar(self._chave(id_aluno), 0, estimar_tokens(texto))
+
+    def consultar(self, id_aluno):
+        """Uso do dia e limites do aluno"""
+        chave = self._chave(id_aluno)
+        if self.compartilhado and chave not in self._pendente:
+            # Outros workers também somam: relê o banco
+            self._uso.pop(chave, None)
+        uso = self._carregar(chave)
+        return {
+            'chamadas': uso['chamadas'],
+            'limite_chamadas': self.limite_chamadas,
+            'tokens_estimados': uso['tokens'],
+            'limite_tokens': self.limite_tokens
+        }
+
+    def flush(self):
+        """Grava no SQLite os incrementos pendentes"""
+        if not self._pendente:
+            return 0
+
+        pendente, self._pendente = self._pendente, {}
+        linhas = [
+            (id_aluno, dia, valores['chamadas'], valores['tokens'])
+            for (id_aluno, dia), valores in pendente.items()
+        ]
+
+        conn = pool.obter()
+        if not conn:
+            self._devolver(pendente)
+            return 0
+
+        try:
+            conn.executemany(
+                '''
+                INSERT INTO uso_diario (id_aluno, dia, chamadas, tokens_estimados)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(id_aluno, dia) DO UPDATE SET
+                    chamadas = chamadas + excluded.chamadas,
+                    tokens_estimados = tokens_estimados + excluded.tokens_estimados
+                ''',
+                linhas
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar ledger de uso: {e}")
+            conn.rollback()
+            self._devolver(pendente)
+            return 0
+        finally:
+            pool.devolver(conn)
+
+        # Descarta contadores de dias anteriores já gravados
+        hoje = date.today().isoformat()
+        for chave in [c for c in self._uso if c[1] != hoje and c not in self._pendente]:
+            del self._uso[chave]
+
+        return len(linhas)
+
+    def _devolver(self, pendente):
+        """Recoloca incrementos que não puderam ser gravados"""
+        for chave, valores in pendente.items():
+            atual = self._pendente.setdefault(chave, {'chamadas': 0, 'tokens': 0})
+            atual['chamadas'] += valores['chamadas']
+            atual['tokens'] += valores['tokens']
+
+    def _laco_flush(self):
+        while True:
+            pausar(self.intervalo_flush)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Erro no flush do ledger de uso: {e}")
+
+    def iniciar_flush_periodico(self):
+        """Inicia (uma única vez) a gravação periódica em segundo plano"""
+        if self._tarefa_flush is None:
+            self._tarefa_flush = iniciar_em_segundo_plano(self._laco_flush)
+        return self._tarefa_flush
@@ -1,6 +1,8 @@
 import json
 import os
-from config import cursor
+import sqlite3
+from flask import current_app
+from config import get_db
 
 def carregar_dados_json(nome_arquivo):
     """Carrega dados de um arquivo JSON local."""
@@ -14,21 +16,105 @@ def carregar_dados_json(nome_arquivo):
         print(f"AVISO: Não foi possível carregar o arquivo {nome_arquivo}.")
         return []
 
+MATERIAS = ('Filosofia', 'Sociologia')
+
+def classificar_materia(tema):
+    """
+    Matéria normalizada de um tema livre (gravada em quiz_resultado.materia).
+
+    Um tema que cita as duas fica em Filosofia (antes contava nas duas médias);
+    a migração da coluna reclassifica os resultados antigos com a mesma regra.
+    """
+    tema = (tema or '').lower()
+    for materia in MATERIAS:
+        if materia.lower() in tema:
+            return materia
+    return 'Outros'
+
+def normalizar_tema(tema):
+    """Tema em minúsculas e com espaços simples (chave de agrupamento por tema)."""
+    return ' '.join((tema or '').lower().split())
+
+# Teto de perguntas por quiz aceito ao salvar um resultado (os quizzes têm 10)
+MAX_PERGUNTAS_QUIZ = int(os.getenv('QUIZ_MAX_PERGUNTAS', 100))
+
+def _inteiro_placar(valor, campo):
+    if isinstance(valor, bool):
+        raise ValueError(f"{campo} deve ser um número inteiro.")
+    if isinstance(valor, float) and not valor.is_integer():
+        raise ValueError(f"{campo} deve ser um número inteiro.")
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"{campo} deve ser um número inteiro.")
+
+def validar_placar(acertos, total_perguntas):
+    """
+    Acertos e total de perguntas de um resultado como inteiros, com
+    0 <= acertos <= total_perguntas <= MAX_PERGUNTAS_QUIZ.
+
+    Raises:
+        ValueError: Com a mensagem para o cliente
+    """
+    acertos = _inteiro_placar(acertos, 'acertos')
+    total_perguntas = _inteiro_placar(total_perguntas, 'total_perguntas')
+    if not 0 <= total_perguntas <= MAX_PERGUNTAS_QUIZ:
+        raise ValueError(f"total_perguntas deve estar entre 0 e {MAX_PERGUNTAS_QUIZ}.")
+    if not 0 <= acertos <= total_perguntas:
+        raise ValueError("acertos deve estar entre 0 e total_perguntas.")
+    return acertos, total_perguntas
+
+def _buscar_plano(id_aluno):
+    """Plano do aluno no banco, ou None se ele não existe (erros não vão para o cache)."""
+    conn = get_db()
+    if not conn:
+        raise sqlite3.OperationalError("Sem conexão com o banco de dados.")
+    resultado = conn.execute('SELECT plano FROM Aluno WHERE id_aluno = ?', (id_aluno,)).fetchone()
+    if resultado is None:
+        return None
+    return resultado['plano'] or 'freemium'
+
+def _identidade_aluno(id_aluno):
+    """Plano do aluno (None se não existe), servido pelo cache de planos do app quando houver."""
+    try:
+        id_aluno = int(id_aluno)
+    except (TypeError, ValueError):
+        return None
+
+    cache = current_app.config.get('PLANOS_CACHE')
+    if cache is None:
+        return _buscar_plano(id_aluno)
+    return cache.obter(id_aluno, lambda: _buscar_plano(id_aluno))
+
 def get_user_plan(id_aluno):
-    """Busca o plano do usuário no banco de dados."""
-    if not cursor:
-        print("Erro: Sem conexão com o banco de dados.")
-        return 'freemium'
-        
+    """Busca o plano do usuário (cache de planos, com o banco como fonte)."""
     try:
-        cursor.execute('SELECT plano FROM Aluno WHERE id_aluno = ?', (id_aluno,))
-        resultado = cursor.fetchone()
-        
-        # sqlite3.Row já suporta acesso por nome de coluna (como .get())
-        if resultado and resultado['plano']: # Acesso direto por chave
-            return resultado['plano']
+        plano = _identidade_aluno(id_aluno)
     except Exception as e:
         print(f"Erro ao buscar plano do usuário: {e}")
-    
-    # Retorna 'freemium' como padrão em caso de erro ou se o plano for nulo
-    return 'freemium'
\ No newline at end of file
+        plano = None
+
+    # Retorna 'freemium' como padrão em caso de erro ou se o aluno não existir
+    return plano or 'freemium'
+
+def aluno_existe(id_aluno):
+    """Verifica se o aluno existe (mesma consulta e cache de get_user_plan)."""
+    return _identidade_aluno(id_aluno) is not None
+
+def invalidar_plano(id_aluno=None):
+    """Descarta o plano em cache após uma escrita no aluno (sem id: de todos os alunos)."""
+    cache = current_app.config.get('PLANOS_CACHE')
+    if cache is None:
+        return
+    if id_aluno is None:
+        cache.limpar()
+    else:
+        cache.remover(int(id_aluno))
+
+CHAVE_ESTATISTICAS = 'admin_stats'
+
+def invalidar_estatisticas():
+    """Marca as estatísticas do dashboard como vencidas após uma escrita que as afeta."""
+    cache = current_app.config.get('STATS_CACHE')
+    if cache:
+        cache.invalidar(CHAVE_ESTATISTICAS)